@@ -1,16 +1,38 @@
 from django.contrib import admin
-from .models import Category, Zone, Device, Measurement, Sensor, Alert
+from .models import Category, Zone, Device, DeviceToken, ExportJob, Measurement, Sensor, Alert, AlertRule, Organization
 from django.utils import timezone
 from django import forms
 from django.core.exceptions import ValidationError
+from .counting import EstimatedCountPaginator
+
+def set_status(queryset, status):
+    """Cambia el estado fila a fila: save() envía post_save (tokens, reglas, dashboard, fragmentos, exportaciones)."""
+    updated = 0
+    for obj in queryset:
+        obj.status = status
+        obj.save(update_fields=["status", "updated_at"])
+        updated += 1
+    return updated
 
 # Action to mark records as INACTIVE
 def mark_inactive(modeladmin, request, queryset):
-    updated = queryset.update(status="INACTIVE")
+    updated = set_status(queryset, "INACTIVE")
     modeladmin.message_user(request, f"{updated} record(s) marked as INACTIVE")
 
 mark_inactive.short_description = "Mark selected as INACTIVE"
 
+class OrganizationChoicesMixin:
+    """Opciones de las FK limitadas a la organización del usuario (los superusuarios ven todas)."""
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if not request.user.is_superuser:
+            model = db_field.remote_field.model
+            if model is Organization:
+                kwargs["queryset"] = Organization.objects.filter(pk=getattr(request.organization, "pk", None))
+            elif hasattr(model._default_manager, "for_org"):
+                kwargs["queryset"] = model._default_manager.for_org(request.organization)
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
 class ZoneInline(admin.TabularInline):
     model = Zone
     extra = 0
@@ -24,7 +46,7 @@ class SensorInline(admin.TabularInline):
     show_change_link = True
 
 @admin.register(Category)
-class CategoryAdmin(admin.ModelAdmin):
+class CategoryAdmin(OrganizationChoicesMixin, admin.ModelAdmin):
     list_display = ("id", "name", "status", "created_at")
     list_filter = ("status",)
     search_fields = ("name",)
@@ -33,12 +55,10 @@ class CategoryAdmin(admin.ModelAdmin):
 
     def get_queryset(self, request):
         qs = super().get_queryset(request)
-        if not request.user.is_superuser:
-            qs = qs.filter(organization=request.user.userprofile.organization)
-        return qs
+        return qs.unscoped() if request.user.is_superuser else qs.for_org(request.organization)
 
 @admin.register(Zone)
-class ZoneAdmin(admin.ModelAdmin):
+class ZoneAdmin(OrganizationChoicesMixin, admin.ModelAdmin):
     list_display = ("id", "name", "status", "created_at")
     list_filter = ("status",)
     search_fields = ("name",)
@@ -47,12 +67,10 @@ class ZoneAdmin(admin.ModelAdmin):
 
     def get_queryset(self, request):
         qs = super().get_queryset(request)
-        if not request.user.is_superuser:
-            qs = qs.filter(organization=request.user.userprofile.organization)
-        return qs
+        return qs.unscoped() if request.user.is_superuser else qs.for_org(request.organization)
 
 @admin.register(Device)
-class DeviceAdmin(admin.ModelAdmin):
+class DeviceAdmin(OrganizationChoicesMixin, admin.ModelAdmin):
     list_display = ("id", "name", "category", "zone", "status", "created_at")
     list_filter = ("status", "category", "zone")
     search_fields = ("name", "category__name", "zone__name")
@@ -67,45 +85,60 @@ class DeviceAdmin(admin.ModelAdmin):
 
     @admin.action(description="Activar dispositivos seleccionados")
     def make_active(self, request, queryset):
-        updated = queryset.update(status="ACTIVE")
+        updated = set_status(queryset, "ACTIVE")
         self.message_user(request, f"{updated} dispositivos activados")
 
     actions.append(make_active)
 
     def get_queryset(self, request):
         qs = super().get_queryset(request)
-        if not request.user.is_superuser:
-            qs = qs.filter(organization=request.user.userprofile.organization)
-        return qs
+        return qs.unscoped() if request.user.is_superuser else qs.for_org(request.organization)
 
 @admin.register(Measurement)
-class MeasurementAdmin(admin.ModelAdmin):
+class MeasurementAdmin(OrganizationChoicesMixin, admin.ModelAdmin):
     list_display = ("id", "device", "value", "unit", "date", "created_at")
     list_filter = ("device", "date")
     search_fields = ("device__name",)
     readonly_fields = ("created_at", "updated_at")
+    # Tabla grande: conteo acotado/estimado y sin el segundo COUNT(*) sin filtros
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
     def get_queryset(self, request):
         qs = super().get_queryset(request)
-        if not request.user.is_superuser:
-            qs = qs.filter(organization=request.user.userprofile.organization)
-        return qs
+        return qs.unscoped() if request.user.is_superuser else qs.for_org(request.organization)
 
 @admin.register(Alert)
-class AlertAdmin(admin.ModelAdmin):
-    list_display = ("id", "device", "level", "message", "read", "created_at")
+class AlertAdmin(OrganizationChoicesMixin, admin.ModelAdmin):
+    list_display = ("id", "device", "level", "message", "occurrences", "read", "created_at", "last_seen_at")
     list_filter = ("level", "read")
     search_fields = ("message", "device__name")
+    readonly_fields = ("created_at", "updated_at", "occurrences", "last_seen_at")
+
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        return qs.unscoped() if request.user.is_superuser else qs.for_org(request.organization)
+
+@admin.register(AlertRule)
+class AlertRuleAdmin(OrganizationChoicesMixin, admin.ModelAdmin):
+    list_display = ("id", "name", "kind", "operator", "threshold", "level", "device", "category", "zone", "status")
+    list_filter = ("kind", "level", "status")
+    search_fields = ("name", "device__name", "category__name", "zone__name")
     readonly_fields = ("created_at", "updated_at")
+    list_select_related = ("device", "category", "zone")
+
+    @admin.action(description="Mark selected as INACTIVE")
+    def deactivate_rules(self, request, queryset):
+        mark_inactive(self, request, queryset)
+
+    actions = [deactivate_rules]
 
     def get_queryset(self, request):
         qs = super().get_queryset(request)
-        if not request.user.is_superuser:
-            qs = qs.filter(organization=request.user.userprofile.organization)
-        return qs
+        return qs.unscoped() if request.user.is_superuser else qs.for_org(request.organization)
 
 @admin.register(Sensor)
-class SensorAdmin(admin.ModelAdmin):
+class SensorAdmin(OrganizationChoicesMixin, admin.ModelAdmin):
     list_display = ("id", "device", "name", "type", "unit", "status", "created_at")
     list_filter = ("type", "status")
     search_fields = ("name", "device__name")
@@ -113,10 +146,51 @@ class SensorAdmin(admin.ModelAdmin):
     actions = [mark_inactive]
     list_select_related = ("device",)
 
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        return qs.unscoped() if request.user.is_superuser else qs.for_org(request.organization)
+
+@admin.register(DeviceToken)
+class DeviceTokenAdmin(OrganizationChoicesMixin, admin.ModelAdmin):
+    list_display = ("id", "name", "prefix", "device", "organization", "status", "created_at")
+    list_filter = ("status",)
+    search_fields = ("name", "prefix", "device__name")
+    readonly_fields = ("prefix", "created_at", "updated_at")
+    list_select_related = ("device", "organization")
+    fields = ("name", "device", "organization", "status", "prefix", "created_at", "updated_at")
+
+    @admin.action(description="Rotar tokens seleccionados")
+    def rotate_tokens(self, request, queryset):
+        for token in queryset:
+            key = token.rotate()
+            self.message_user(request, f"{token}: nuevo token {key} (cópialo ahora, no se volverá a mostrar)")
+
+    actions = [mark_inactive, rotate_tokens]
+
+    def save_model(self, request, obj, form, change):
+        key = None if change else obj.set_key()
+        super().save_model(request, obj, form, change)
+        if key:
+            self.message_user(request, f"Token creado: {key} (cópialo ahora, no se volverá a mostrar)")
+
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        return qs.unscoped() if request.user.is_superuser else qs.for_org(request.organization)
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ("id", "kind", "format", "organization", "state", "rows_written", "created_at", "expires_at")
+    list_filter = ("state", "kind", "format")
+    list_select_related = ("organization",)
+    readonly_fields = [field.name for field in ExportJob._meta.fields]
+
+    def has_add_permission(self, request):
+        return False  # se crean desde los listados
+
     def get_queryset(self, request):
         qs = super().get_queryset(request)
         if not request.user.is_superuser:
-            qs = qs.filter(organization=request.user.userprofile.organization)
+            qs = qs.filter(organization=request.organization) if request.organization else qs.none()
         return qs
 
 # Validación ejemplo para Category
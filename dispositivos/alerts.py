@@ -0,0 +1,141 @@
+"""
+Bandeja de alertas: contadores de no leídas y marcado en bloque.
+
+``AlertCounter`` guarda las no leídas por (organización, nivel) y se ajusta con
+``F()`` en cada cambio: alertas creadas (``post_save`` o ``record_created``
+tras un ``bulk_create``), leídas, borradas o con otro nivel (``Alert.from_db``
+recuerda el estado al cargar) y el borrado lógico en bloque (``soft_delete``).
+``unread_counts`` sirve los contadores desde la caché, así el contador del menú
+no consulta la BD en cada página. La caché se invalida tras el commit (antes,
+otra petición podría volver a guardar los valores viejos) y además expira con
+``ALERT_COUNT_CACHE_TTL``.
+"""
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from .models import Alert, AlertCounter
+
+LEVELS = [level for level, _ in Alert.LEVEL]
+ALL = "all"  # todas las organizaciones (agregado global)
+
+
+def _cache_key(organization_id):
+    return f"alerts:unread:{organization_id or ALL}"
+
+
+def empty_counts():
+    """Contadores en cero (usuarios sin organización)."""
+    return dict.fromkeys([*LEVELS, "total"], 0)
+
+
+def unread_counts(organization_id=None):
+    """{nivel: no leídas, ..., "total": n} de la organización (o de todas)."""
+    key = _cache_key(organization_id)
+    counts = cache.get(key)
+    if counts is None:
+        counters = AlertCounter.objects.all()
+        if organization_id:
+            counters = counters.filter(organization_id=organization_id)
+        counts = empty_counts()
+        for level, total in counters.values("level").annotate(total=Sum("unread")).values_list("level", "total"):
+            counts[level] = max(total, 0)
+        counts["total"] = sum(counts[level] for level in LEVELS)
+        cache.set(key, counts, settings.ALERT_COUNT_CACHE_TTL)
+    return counts
+
+
+def _invalidate(organization_ids):
+    keys = [_cache_key(org_id) for org_id in organization_ids] + [_cache_key(None)]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def adjust(deltas):
+    """Suma ``deltas`` ({(organización, nivel): n}) a los contadores."""
+    deltas = {key: delta for key, delta in deltas.items() if key is not None and delta}
+    if not deltas:
+        return
+    with transaction.atomic():
+        AlertCounter.objects.bulk_create(
+            [AlertCounter(organization_id=org_id, level=level) for org_id, level in deltas],
+            ignore_conflicts=True,
+        )
+        for (org_id, level), delta in deltas.items():
+            AlertCounter.objects.filter(organization_id=org_id, level=level).update(unread=F("unread") + delta)
+        _invalidate({org_id for org_id, _ in deltas})
+
+
+def record_created(alerts):
+    """Cuenta alertas insertadas con ``bulk_create`` (no envía ``post_save``)."""
+    adjust(Counter(alert.counter_state() for alert in alerts))
+    for alert in alerts:
+        alert._counted_state = alert.counter_state()
+
+
+def track_saved(alert, created):
+    previous = None if created else getattr(alert, "_counted_state", None)
+    current = alert.counter_state()
+    if previous != current:
+        adjust({previous: -1, current: 1})
+    alert._counted_state = current
+
+
+def track_deleted(alert):
+    adjust({getattr(alert, "_counted_state", alert.counter_state()): -1})
+
+
+def mark_read(queryset):
+    """Marca como leídas las alertas de ``queryset`` con un único UPDATE; devuelve cuántas.
+
+    Las filas se bloquean antes de contarlas por nivel y el UPDATE se limita al
+    mayor id bloqueado, así el descuento en los contadores coincide con lo que
+    cambia.
+    """
+    with transaction.atomic():
+        unread = queryset.filter(read=False).order_by()
+        rows = list(unread.select_for_update().values_list("pk", "organization_id", "level"))
+        if not rows:
+            return 0
+        updated = unread.filter(pk__lte=max(row[0] for row in rows)).update(read=True)
+        states = Counter((org_id, level) for _, org_id, level in rows if org_id is not None)
+        adjust({key: -count for key, count in states.items()})
+    return updated
+
+
+def soft_delete(queryset):
+    """Borrado lógico en bloque (``Alert.objects...delete()``, acción del admin); devuelve cuántas.
+
+    Igual que ``mark_read``: bloquea las filas, las cuenta por nivel y limita el
+    UPDATE al mayor id bloqueado.
+    """
+    with transaction.atomic():
+        live = queryset.filter(deleted_at__isnull=True).order_by()
+        rows = list(live.select_for_update().values_list("pk", "organization_id", "level", "read"))
+        if not rows:
+            return 0
+        deleted = live.filter(pk__lte=max(row[0] for row in rows)).update(deleted_at=timezone.now())
+        states = Counter((org_id, level) for _, org_id, level, read in rows if org_id is not None and not read)
+        adjust({key: -count for key, count in states.items()})
+    return deleted
+
+
+def rebuild_counters(organization_id=None):
+    """Recalcula los contadores desde las alertas (p. ej. tras cambios con ``update()``)."""
+    alerts = Alert.objects.filter(read=False, organization__isnull=False)
+    counters = AlertCounter.objects.all()
+    if organization_id:
+        alerts = alerts.filter(organization_id=organization_id)
+        counters = counters.filter(organization_id=organization_id)
+    with transaction.atomic():
+        stale = set(counters.values_list("organization_id", flat=True))
+        counters.delete()
+        fresh = AlertCounter.objects.bulk_create([
+            AlertCounter(organization_id=org_id, level=level, unread=total)
+            for org_id, level, total in alerts.order_by().values("organization_id", "level")
+            .annotate(total=Count("id")).values_list("organization_id", "level", "total")
+        ])
+        _invalidate(stale | {counter.organization_id for counter in fresh})
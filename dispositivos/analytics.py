@@ -0,0 +1,115 @@
+"""
+Estadísticas por dispositivo calculadas en bloque con NumPy.
+
+``load_columns`` trae (device_id, fecha, valor) de la BD y del archivo como
+columnas (sin instancias de modelo ni ``Decimal``) y ``grouped_stats`` calcula
+por dispositivo, sin bucles de Python por lectura: cantidad, media, desvío,
+mínimo, máximo, percentiles, primer/último valor y tasa de cambio por hora.
+
+``device_stats`` cubre una organización, zona o categoría en una sola llamada.
+Ver ``manage.py benchmark_analytics`` para la comparación con el enfoque ORM.
+"""
+from array import array
+
+import numpy as np
+from django.db.models import FloatField
+from django.db.models.functions import Cast
+
+from .archive import iter_archived_rows
+from .models import Device, Measurement
+
+DEFAULT_PERCENTILES = (50, 90, 95, 99)
+
+
+def load_columns(organization_id, start=None, end=None, device_ids=None, chunk_size=10000):
+    """Columnas (device_ids int64, tiempos en segundos float64, valores float64)."""
+    devices, times, values = array("q"), array("d"), array("d")
+    for row in iter_archived_rows(organization_id, start, end, set(device_ids) if device_ids is not None else None):
+        devices.append(row.device_id)
+        times.append(row.date.timestamp())
+        values.append(row.value)
+
+    live = Measurement.objects.filter(organization_id=organization_id)
+    if start is not None:
+        live = live.filter(date__gte=start)
+    if end is not None:
+        live = live.filter(date__lt=end)
+    if device_ids is not None:
+        live = live.filter(device_id__in=device_ids)
+    rows = live.order_by().values_list("device_id", "date", Cast("value", FloatField()))
+    for device_id, date, value in rows.iterator(chunk_size=chunk_size):
+        devices.append(device_id)
+        times.append(date.timestamp())
+        values.append(value)
+    return (
+        np.frombuffer(devices, dtype=np.int64),
+        np.frombuffer(times, dtype=np.float64),
+        np.frombuffer(values, dtype=np.float64),
+    )
+
+
+def grouped_percentile(sorted_values, starts, counts, q):
+    """Percentil ``q`` por grupo con interpolación lineal (como ``np.percentile``)."""
+    position = starts + (counts - 1) * (q / 100.0)
+    lo = np.floor(position).astype(np.int64)
+    hi = np.ceil(position).astype(np.int64)
+    fraction = position - lo
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * fraction
+
+
+def grouped_stats(devices, times, values, percentiles=DEFAULT_PERCENTILES):
+    """Estadísticas por dispositivo; devuelve {device_id: {...}}."""
+    if len(devices) == 0:
+        return {}
+    # Orden por (dispositivo, valor): mínimo, máximo y percentiles salen por posición
+    by_value = np.lexsort((values, devices))
+    sorted_values = values[by_value]
+    ids, starts, counts = np.unique(devices[by_value], return_index=True, return_counts=True)
+    ends = starts + counts - 1
+
+    sums = np.add.reduceat(sorted_values, starts)
+    means = sums / counts
+    deviations = (sorted_values - np.repeat(means, counts)) ** 2
+    stds = np.sqrt(np.add.reduceat(deviations, starts) / counts)
+    quantiles = {q: grouped_percentile(sorted_values, starts, counts, q) for q in percentiles}
+
+    # Orden por (dispositivo, tiempo): primer y último valor y tasa de cambio
+    by_time = np.lexsort((times, devices))
+    timed_values, sorted_times = values[by_time], times[by_time]
+    first, last = timed_values[starts], timed_values[ends]
+    elapsed_hours = (sorted_times[ends] - sorted_times[starts]) / 3600.0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rates = np.where(elapsed_hours > 0, (last - first) / elapsed_hours, np.nan)
+
+    result = {}
+    for i, device_id in enumerate(ids.tolist()):
+        stats = {
+            "count": int(counts[i]),
+            "mean": float(means[i]),
+            "std": float(stds[i]),
+            "min": float(sorted_values[starts[i]]),
+            "max": float(sorted_values[ends[i]]),
+            "first": float(first[i]),
+            "last": float(last[i]),
+            "rate_per_hour": None if np.isnan(rates[i]) else float(rates[i]),
+        }
+        for q in percentiles:
+            stats[f"p{q}"] = float(quantiles[q][i])
+        result[device_id] = stats
+    return result
+
+
+def device_stats(organization_id, start=None, end=None, zone_id=None, category_id=None,
+                 device_ids=None, percentiles=DEFAULT_PERCENTILES):
+    """Estadísticas de los dispositivos de una organización, zona o categoría en ``[start, end)``."""
+    if zone_id is not None or category_id is not None:
+        devices = Device.all_objects.filter(organization_id=organization_id)
+        if zone_id is not None:
+            devices = devices.filter(zone_id=zone_id)
+        if category_id is not None:
+            devices = devices.filter(category_id=category_id)
+        if device_ids is not None:
+            devices = devices.filter(id__in=device_ids)
+        device_ids = list(devices.values_list("id", flat=True))
+    columns = load_columns(organization_id, start, end, device_ids)
+    return grouped_stats(*columns, percentiles=percentiles)
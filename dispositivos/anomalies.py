@@ -0,0 +1,269 @@
+"""
+Detección de anomalías en lote sobre las mediciones nuevas de una organización.
+
+``detect`` lee como columnas las lecturas con id mayor al ``AnomalyWatermark``
+de la organización, junto con ``ANOMALY_LOOKBACK_HOURS`` de historia de los
+mismos dispositivos, y evalúa en bloque con NumPy, por dispositivo y unidad:
+
+* z-score móvil: distancia del valor a la media de las ``ANOMALY_WINDOW``
+  lecturas anteriores, en desvíos;
+* IQR: distancia a las cercas de Tukey (Q1/Q3 de la historia previa al lote),
+  en múltiplos del rango intercuartil.
+
+Los ids que el watermark deja atrás sin verlos (transacciones de ingesta aún
+abiertas) quedan como "huecos" en el watermark y se revisan en las corridas
+siguientes durante ``ANOMALY_GAP_SECONDS``, así una transacción larga que
+confirma tarde no se pierde. Las lecturas nuevas con fecha anterior a
+``ANOMALY_MAX_AGE_HOURS`` (backfills) se saltan sin evaluarlas.
+
+Se propone como mucho una ``Alert`` por dispositivo y corrida, con el nivel de
+su peor lectura; se insertan en un solo ``bulk_create`` a través de
+``suppression`` (las repetidas suman ocurrencias a la alerta abierta). Los medidores acumulados
+(Wh/kWh/MWh) se ignoran: crecen siempre y su valor no tiene una distribución
+estable.
+"""
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import FloatField, Min, Q
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from . import dashboard
+from .analytics import grouped_percentile
+from .energy import ENERGY, classify
+from .models import Alert, AnomalyWatermark, Measurement
+from .suppression import suppressor
+
+# (umbral, nivel) de mayor a menor
+Z_LEVELS = ((6.0, "GRAVE"), (4.5, "ALTA"), (3.0, "MEDIA"))
+IQR_LEVELS = ((3.0, "ALTA"), (1.5, "MEDIA"))
+LEVELS = (None, "MEDIA", "ALTA", "GRAVE")  # índice = gravedad
+MIN_HISTORY = 10  # lecturas previas necesarias para evaluar un valor
+MIN_SCALE_RATIO = 0.01  # desvío/IQR mínimo relativo: evita alertas en señales casi constantes
+SETTLE = timedelta(seconds=5)  # margen para transacciones de ingesta aún abiertas
+MAX_GAPS = 500  # huecos pendientes por organización (se descartan los más viejos)
+
+Columns = namedtuple("Columns", ["ids", "groups", "times", "values", "new", "keys"])
+Detection = namedtuple("Detection", ["examined", "anomalies", "alerts"])
+
+
+def missing_ranges(found, ranges):
+    """Subrangos ``[desde, hasta, visto]`` de ``ranges`` sin ids en ``found`` (ordenada)."""
+    missing = []
+    for first, last, seen in ranges:
+        current = first
+        for measurement_id in found[bisect_left(found, first):bisect_right(found, last)]:
+            if measurement_id > current:
+                missing.append([current, measurement_id - 1, seen])
+            current = measurement_id + 1
+        if current <= last:
+            missing.append([current, last, seen])
+    return missing
+
+
+def load_columns(organization_id, watermark, now, gaps=()):
+    """Lecturas nuevas e historia ordenadas por (grupo, fecha); ``keys[g]`` es (device_id, unidad).
+
+    Son nuevas las lecturas con id mayor a ``watermark`` o dentro de ``gaps``.
+    Devuelve (columnas o ``None``, nuevo watermark, huecos pendientes). Con
+    ``watermark`` 0 (primera corrida) solo se consideran nuevas las lecturas de
+    los últimos ``ANOMALY_INITIAL_MINUTES``.
+    """
+    since = now - timedelta(hours=settings.ANOMALY_MAX_AGE_HOURS)
+    pending = Q(id__gt=watermark)
+    for first, last, _ in gaps:
+        pending |= Q(id__range=(first, last))
+    visible = Measurement.objects.filter(pending, organization_id=organization_id, created_at__lt=now - SETTLE)
+    if not watermark:
+        # Primera corrida: sin huecos hacia atrás, solo la última parte de la tabla
+        since = max(since, now - timedelta(minutes=settings.ANOMALY_INITIAL_MINUTES))
+        visible = visible.filter(date__gte=since)
+    found = array("q", visible.order_by("id").values_list("id", flat=True).iterator(chunk_size=10000))
+    ranges = list(gaps)
+    if found and found[-1] > watermark:
+        if watermark:
+            ranges.append([watermark + 1, found[-1], now.timestamp()])
+        watermark = found[-1]
+    expired = now.timestamp() - settings.ANOMALY_GAP_SECONDS
+    gaps = [gap for gap in missing_ranges(found, ranges) if gap[2] >= expired][-MAX_GAPS:]
+
+    # Acotadas por fecha: un backfill de lecturas viejas no se evalúa ni trae años de historia
+    new = visible.filter(date__gte=since)
+    min_date = new.aggregate(min_date=Min("date"))["min_date"]
+    if min_date is None:
+        return None, watermark, gaps
+
+    rows = (
+        Measurement.objects.filter(
+            organization_id=organization_id,
+            device_id__in=new.values("device_id"),
+            id__lte=watermark,
+            date__gte=min_date - timedelta(hours=settings.ANOMALY_LOOKBACK_HOURS),
+        )
+        .order_by()
+        .values_list("id", "device_id", "unit", "date", Cast("value", FloatField()))
+    )
+    codes, keys = {}, []
+    ids, groups, times, values = array("q"), array("q"), array("d"), array("d")
+    since_ts = since.timestamp()
+    new_flags = bytearray()
+    for measurement_id, device_id, unit, date, value in rows.iterator(chunk_size=10000):
+        key = (device_id, unit)
+        code = codes.get(key)
+        if code is None:
+            spec = classify(unit)
+            code = codes[key] = -1 if spec and spec[0] == ENERGY else len(keys)
+            if code >= 0:
+                keys.append(key)
+        if code < 0:
+            continue
+        ts = date.timestamp()
+        ids.append(measurement_id)
+        groups.append(code)
+        times.append(ts)
+        values.append(value)
+        position = bisect_left(found, measurement_id)
+        new_flags.append(ts >= since_ts and position < len(found) and found[position] == measurement_id)
+
+    columns = Columns(
+        np.frombuffer(ids, dtype=np.int64),
+        np.frombuffer(groups, dtype=np.int64),
+        np.frombuffer(times, dtype=np.float64),
+        np.frombuffer(values, dtype=np.float64),
+        np.frombuffer(bytes(new_flags), dtype=np.bool_),
+        keys,
+    )
+    order = np.lexsort((columns.ids, columns.times, columns.groups))
+    columns = columns._replace(**{
+        name: getattr(columns, name)[order] for name in ("ids", "groups", "times", "values", "new")
+    })
+    return columns, watermark, gaps
+
+
+def _scale_floor(center):
+    return np.maximum(np.abs(center) * MIN_SCALE_RATIO, 1e-6)
+
+
+def rolling_zscores(groups, values, window, min_history=MIN_HISTORY):
+    """z-score de cada valor contra los ``window`` anteriores de su grupo (0 si hay menos de
+    ``min_history``). ``groups`` debe venir ordenado (y cada grupo por fecha)."""
+    size = len(values)
+    if size == 0:
+        return np.empty(0)
+    index = np.arange(size)
+    starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    group_start = np.repeat(starts, np.diff(np.r_[starts, size]))
+    lo = np.maximum(group_start, index - window)
+    history = index - lo
+
+    # Sumas acumuladas de valores centrados en el primero del grupo (menos cancelación numérica)
+    offset = values[group_start]
+    centered = values - offset
+    sums = np.r_[0.0, np.cumsum(centered)]
+    squares = np.r_[0.0, np.cumsum(centered ** 2)]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = (sums[index] - sums[lo]) / history
+        variance = (squares[index] - squares[lo]) / history - mean ** 2
+        scale = np.maximum(np.sqrt(np.maximum(variance, 0.0)), _scale_floor(mean + offset))
+        z = (centered - mean) / scale
+    return np.where(history >= min_history, z, 0.0)
+
+
+def iqr_distances(groups, values, baseline, group_count, min_history=MIN_HISTORY):
+    """Distancia de cada valor a las cercas Q1/Q3 de su grupo, en IQR, calculadas solo con
+    las filas ``baseline`` (0 dentro de las cercas o sin historia suficiente)."""
+    q1 = np.full(group_count, np.nan)
+    q3 = np.full(group_count, np.nan)
+    base_groups, base_values = groups[baseline], values[baseline]
+    if len(base_values):
+        by_value = np.lexsort((base_values, base_groups))
+        sorted_values = base_values[by_value]
+        codes, starts, counts = np.unique(base_groups[by_value], return_index=True, return_counts=True)
+        enough = counts >= min_history
+        codes, starts, counts = codes[enough], starts[enough], counts[enough]
+        q1[codes] = grouped_percentile(sorted_values, starts, counts, 25)
+        q3[codes] = grouped_percentile(sorted_values, starts, counts, 75)
+    low, high = q1[groups], q3[groups]
+    iqr = np.maximum(high - low, _scale_floor((low + high) / 2))
+    distance = np.maximum(low - values, values - high) / iqr
+    return np.where(np.isnan(distance), 0.0, np.maximum(distance, 0.0))
+
+
+def severities(z, distance):
+    """Índice en ``LEVELS`` por lectura: el mayor entre z-score e IQR."""
+    z = np.abs(z)
+    by_z = sum((z >= threshold).astype(np.int8) for threshold, _ in Z_LEVELS)
+    by_iqr = sum((distance > threshold).astype(np.int8) for threshold, _ in IQR_LEVELS)
+    return np.maximum(by_z, by_iqr)
+
+
+def _message(value, unit, when, z, distance, count):
+    when = timezone.localtime(datetime.fromtimestamp(when, tz=dt_timezone.utc))
+    detail = f"z={z:+.1f}" if abs(z) >= Z_LEVELS[-1][0] else f"{distance:.1f} IQR fuera de rango"
+    reading = f"{value:g} {unit}".strip()
+    message = f"Valor anómalo {reading} a las {when:%d/%m %H:%M} ({detail})"
+    if count > 1:
+        message += f"; {count} lecturas anómalas"
+    return message[:250]
+
+
+def build_alerts(organization_id, columns, window):
+    """Una ``Alert`` (sin guardar) por dispositivo con su peor lectura nueva."""
+    z = rolling_zscores(columns.groups, columns.values, window)
+    distance = iqr_distances(columns.groups, columns.values, ~columns.new, len(columns.keys))
+    severity = np.where(columns.new, severities(z, distance), 0)
+    anomalous = np.flatnonzero(severity)
+    if not len(anomalous):
+        return [], 0
+
+    # Por dispositivo: mayor gravedad y, a igual gravedad, mayor |z| + distancia IQR
+    worst, counts = {}, {}
+    score = np.abs(z) + distance
+    for i in anomalous.tolist():
+        device_id, unit = columns.keys[columns.groups[i]]
+        counts[device_id] = counts.get(device_id, 0) + 1
+        current = worst.get(device_id)
+        if current is None or (severity[i], score[i]) > (severity[current], score[current]):
+            worst[device_id] = i
+
+    alerts = []
+    for device_id, i in worst.items():
+        unit = columns.keys[columns.groups[i]][1]
+        alerts.append(Alert(
+            device_id=device_id,
+            organization_id=organization_id,  # bulk_create no pasa por save()
+            level=LEVELS[severity[i]],
+            message=_message(columns.values[i], unit, columns.times[i], z[i], distance[i], counts[device_id]),
+        ))
+    return alerts, len(anomalous)
+
+
+def detect(organization_id, now=None, window=None, dry_run=False):
+    """Evalúa las lecturas nuevas de la organización, crea las alertas y avanza el watermark."""
+    now = now or timezone.now()
+    window = window or settings.ANOMALY_WINDOW
+    with transaction.atomic():
+        # El watermark bloqueado evita que dos corridas evalúen el mismo lote
+        AnomalyWatermark.objects.bulk_create(
+            [AnomalyWatermark(organization_id=organization_id)], ignore_conflicts=True,
+        )
+        mark = AnomalyWatermark.objects.select_for_update().get(organization_id=organization_id)
+        columns, last_id, gaps = load_columns(organization_id, mark.last_measurement_id, now, mark.gaps)
+        alerts, anomalies = build_alerts(organization_id, columns, window) if columns is not None else ([], 0)
+        examined = int(columns.new.sum()) if columns is not None else 0
+        if dry_run:
+            return Detection(examined, anomalies, alerts)
+        created = suppressor.submit(alerts)
+        if (last_id, gaps) != (mark.last_measurement_id, mark.gaps):
+            # También sin lecturas evaluables: saltea backfills y vence huecos
+            mark.last_measurement_id, mark.gaps = last_id, gaps
+            mark.save(update_fields=["last_measurement_id", "gaps", "updated_at"])
+    if created:
+        dashboard.invalidate(organization_id)  # bulk_create no envía post_save
+    return Detection(examined, anomalies, created)
@@ -0,0 +1,360 @@
+"""
+Archivo de mediciones antiguas en segmentos comprimidos por organización y mes.
+
+Cada segmento (``<ARCHIVE_DIR>/<org_id>/<YYYY-MM>.seg``) guarda las lecturas
+ordenadas por fecha en bloques comprimidos con zlib, seguidos de un índice
+JSON con el rango de fechas de cada bloque::
+
+    [bloque 0][bloque 1]...[índice JSON][u32 largo del índice][MAGIC]
+
+Cada bloque contiene columnas little-endian: id (int64), device_id (int64),
+fecha en microsegundos UTC (int64), valor (float64) y código de unidad (uint16).
+La lectura hace ``mmap`` del archivo y solo descomprime los bloques que
+intersectan el rango pedido.
+
+``iter_measurement_rows`` mezcla de forma transparente el archivo con las filas
+vivas de la BD, ordenadas por fecha.
+"""
+import heapq
+import json
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+from itertools import chain, islice
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+
+from .models import Measurement
+from .pagination import iter_keyset
+
+MAGIC = b"ECOSEG01"
+_TRAILER = struct.Struct("<I")
+BLOCK_ROWS = 65536
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+_COLUMNS = (("ids", "q"), ("devices", "q"), ("dates", "q"), ("values", "d"), ("units", "H"))
+
+MeasurementRow = namedtuple("MeasurementRow", ["device_id", "date", "value", "unit"])
+
+
+class SegmentError(ValueError):
+    """El archivo no es un segmento válido."""
+
+
+def archive_dir():
+    return str(getattr(settings, "MEASUREMENT_ARCHIVE_DIR", os.path.join(settings.BASE_DIR, "archive")))
+
+
+def segment_path(organization_id, month):
+    return os.path.join(archive_dir(), str(organization_id), f"{month:%Y-%m}.seg")
+
+
+def month_start(dt):
+    dt = dt.astimezone(dt_timezone.utc)
+    return dt.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_month(dt):
+    return (dt.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def _to_micros(dt):
+    return (dt - _EPOCH) // timedelta(microseconds=1)
+
+
+def _from_micros(micros):
+    return _EPOCH + timedelta(microseconds=micros)
+
+
+def _little_endian(arr):
+    if sys.byteorder == "big":
+        arr.byteswap()
+    return arr
+
+
+class SegmentColumns:
+    """Columnas en memoria de un segmento (o de un bloque)."""
+
+    def __init__(self):
+        for name, typecode in _COLUMNS:
+            setattr(self, name, array(typecode))
+        self.unit_names = []
+        self._unit_codes = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def append(self, measurement_id, device_id, date, value, unit):
+        code = self._unit_codes.get(unit)
+        if code is None:
+            code = self._unit_codes[unit] = len(self.unit_names)
+            self.unit_names.append(unit)
+        self.ids.append(measurement_id)
+        self.devices.append(device_id)
+        self.dates.append(date if isinstance(date, int) else _to_micros(date))
+        self.values.append(float(value))
+        self.units.append(code)
+
+
+def write_segment(path, rows):
+    """Escribe ``rows`` (id, device_id, fecha, valor, unidad) de forma atómica.
+
+    Las filas deben venir ordenadas por (fecha, id); un id repetido a
+    continuación se descarta. Solo se mantiene un bloque en memoria.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    columns = SegmentColumns()
+    blocks = []
+    total = 0
+    last_id = None
+    with open(tmp, "wb") as fh:
+        def write_block():
+            blocks.append({"rows": len(columns), "min_date": columns.dates[0], "max_date": columns.dates[-1]})
+            payload = b"".join(_little_endian(getattr(columns, name)).tobytes() for name, _ in _COLUMNS)
+            data = zlib.compress(payload, 6)
+            blocks[-1].update(offset=fh.tell(), length=len(data))
+            fh.write(data)
+            for name, typecode in _COLUMNS:  # las unidades se comparten entre bloques
+                setattr(columns, name, array(typecode))
+
+        for row in rows:
+            if row[0] == last_id:
+                continue
+            last_id = row[0]
+            columns.append(*row)
+            total += 1
+            if len(columns) == BLOCK_ROWS:
+                write_block()
+        if len(columns):
+            write_block()
+        footer = json.dumps({
+            "version": 1,
+            "rows": total,
+            "units": columns.unit_names,
+            "blocks": blocks,
+        }).encode()
+        fh.write(footer)
+        fh.write(_TRAILER.pack(len(footer)))
+        fh.write(MAGIC)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp, path)
+    return total
+
+
+class Segment:
+    """Lector de un segmento vía ``mmap``."""
+
+    def __init__(self, path):
+        self.path = path
+        self._fh = open(path, "rb")
+        try:
+            self._mm = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._fh.close()
+            raise SegmentError(f"{path}: empty file")
+        tail = len(MAGIC) + _TRAILER.size
+        if len(self._mm) < tail or self._mm[-len(MAGIC):] != MAGIC:
+            self.close()
+            raise SegmentError(f"{path}: bad magic")
+        (footer_len,) = _TRAILER.unpack(self._mm[-tail:-len(MAGIC)])
+        self.footer = json.loads(self._mm[-tail - footer_len:-tail])
+        self.units = self.footer["units"]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if getattr(self, "_mm", None) is not None:
+            self._mm.close()
+            self._mm = None
+        self._fh.close()
+
+    def read_block(self, block):
+        payload = zlib.decompress(self._mm[block["offset"]:block["offset"] + block["length"]])
+        rows = block["rows"]
+        columns = SegmentColumns()
+        columns.unit_names = list(self.units)
+        position = 0
+        for name, typecode in _COLUMNS:
+            arr = array(typecode)
+            size = rows * arr.itemsize
+            arr.frombytes(payload[position:position + size])
+            position += size
+            setattr(columns, name, _little_endian(arr))
+        return columns
+
+    def blocks(self, start_micros=None, end_micros=None):
+        for block in self.footer["blocks"]:
+            if start_micros is not None and block["max_date"] < start_micros:
+                continue
+            if end_micros is not None and block["min_date"] >= end_micros:
+                break
+            yield block
+
+    def iter_records(self):
+        """Filas (id, device_id, fecha en µs, valor, unidad) en orden de fecha."""
+        for block in self.footer["blocks"]:
+            columns = self.read_block(block)
+            units = columns.unit_names
+            for i in range(len(columns)):
+                yield columns.ids[i], columns.devices[i], columns.dates[i], columns.values[i], units[columns.units[i]]
+
+    def read_all(self):
+        """Todas las columnas del segmento."""
+        merged = SegmentColumns()
+        for record in self.iter_records():
+            merged.append(*record)
+        return merged
+
+    def iter_rows(self, start=None, end=None, device_ids=None, reverse=False):
+        start_micros = _to_micros(start) if start is not None else None
+        end_micros = _to_micros(end) if end is not None else None
+        blocks = list(self.blocks(start_micros, end_micros))
+        for block in reversed(blocks) if reverse else blocks:
+            columns = self.read_block(block)
+            units = columns.unit_names
+            for i in range(len(columns) - 1, -1, -1) if reverse else range(len(columns)):
+                date = columns.dates[i]
+                if start_micros is not None and date < start_micros:
+                    if reverse:
+                        return
+                    continue
+                if end_micros is not None and date >= end_micros:
+                    if reverse:
+                        continue
+                    return
+                device_id = columns.devices[i]
+                if device_ids is not None and device_id not in device_ids:
+                    continue
+                yield MeasurementRow(device_id, _from_micros(date), columns.values[i], units[columns.units[i]])
+
+
+def archived_months(organization_id):
+    """Meses archivados de la organización, ordenados."""
+    directory = os.path.join(archive_dir(), str(organization_id))
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    months = []
+    for name in names:
+        if name.endswith(".seg"):
+            try:
+                months.append(datetime.strptime(name[:-4], "%Y-%m").replace(tzinfo=dt_timezone.utc))
+            except ValueError:
+                continue
+    return sorted(months)
+
+
+def iter_archived_rows(organization_id, start=None, end=None, device_ids=None, reverse=False):
+    months = [
+        month for month in archived_months(organization_id)
+        if (end is None or month < end) and (start is None or next_month(month) > start)
+    ]
+    for month in reversed(months) if reverse else months:
+        with Segment(segment_path(organization_id, month)) as segment:
+            yield from segment.iter_rows(start, end, device_ids, reverse)
+
+
+def _live_queryset(organization_id, start, end, device_ids):
+    measurements = Measurement.objects.filter(organization_id=organization_id)
+    if start is not None:
+        measurements = measurements.filter(date__gte=start)
+    if end is not None:
+        measurements = measurements.filter(date__lt=end)
+    if device_ids is not None:
+        measurements = measurements.filter(device_id__in=device_ids)
+    return measurements
+
+
+def iter_live_rows(organization_id, start=None, end=None, device_ids=None, chunk_size=5000):
+    measurements = _live_queryset(organization_id, start, end, device_ids)
+    rows = iter_keyset(measurements, ("date", "id"), ("device_id", "date", "value", "unit"), chunk_size)
+    for device_id, date, value, unit in rows:
+        yield MeasurementRow(device_id, date, float(value), unit)
+
+
+def iter_measurement_rows(organization_id, start=None, end=None, device_ids=None):
+    """Lecturas archivadas y vivas de ``[start, end)`` en orden de fecha."""
+    if device_ids is not None:
+        device_ids = set(device_ids)
+    return heapq.merge(
+        iter_archived_rows(organization_id, start, end, device_ids),
+        iter_live_rows(organization_id, start, end, device_ids),
+        key=lambda row: row.date,
+    )
+
+
+def latest_measurement_rows(organization_id, start=None, end=None, device_ids=None, limit=100):
+    """Las ``limit`` lecturas más recientes de ``[start, end)`` (archivo y BD), de la más nueva a la más vieja.
+
+    La BD se consulta con ``ORDER BY date DESC LIMIT`` y el archivo se lee hacia
+    atrás, así solo se descomprimen los bloques necesarios.
+    """
+    if device_ids is not None:
+        device_ids = set(device_ids)
+    live = (
+        _live_queryset(organization_id, start, end, device_ids)
+        .order_by("-date", "-id")
+        .values_list("device_id", "date", "value", "unit")[:limit]
+    )
+    merged = heapq.merge(
+        iter_archived_rows(organization_id, start, end, device_ids, reverse=True),
+        (MeasurementRow(device_id, date, float(value), unit) for device_id, date, value, unit in live),
+        key=lambda row: row.date,
+        reverse=True,
+    )
+    return list(islice(merged, limit))
+
+
+def _iter_segment_records(path):
+    with Segment(path) as segment:  # se cierra al agotarse, antes de reemplazar el archivo
+        yield from segment.iter_records()
+
+
+def archive_month(organization_id, month, cutoff, delete_batch_size=5000):
+    """Mueve al segmento del mes las lecturas anteriores a ``cutoff`` y las borra de la BD.
+
+    El segmento existente y las filas vivas se fusionan en flujo por (fecha, id),
+    un bloque a la vez. El segmento guarda los ids y en la fusión una fila viva
+    reemplaza a la archivada con el mismo id, así que si el proceso se
+    interrumpe antes de borrar, repetirlo no duplica filas. Devuelve las filas
+    archivadas.
+    """
+    end = min(next_month(month), cutoff)
+    live = Measurement.all_objects.filter(
+        organization_id=organization_id, deleted_at__isnull=True, date__gte=month, date__lt=end,
+    )
+    archived_ids = array("q")
+
+    def live_records():
+        rows = iter_keyset(live, ("date", "id"), ("id", "device_id", "date", "value", "unit"), 5000)
+        for measurement_id, device_id, date, value, unit in rows:
+            archived_ids.append(measurement_id)
+            yield measurement_id, device_id, _to_micros(date), float(value), unit
+
+    records = live_records()
+    first = next(records, None)
+    if first is None:
+        return 0
+    path = segment_path(organization_id, month)
+    sources = [chain([first], records)]  # primero: ante ids iguales gana la fila viva
+    if os.path.exists(path):
+        sources.append(_iter_segment_records(path))
+    write_segment(path, heapq.merge(*sources, key=lambda row: (row[2], row[0])))
+
+    for start in range(0, len(archived_ids), delete_batch_size):
+        batch = archived_ids[start:start + delete_batch_size].tolist()
+        Measurement.all_objects.filter(pk__in=batch).delete()
+    from .jobs import bump_data_version  # jobs importa este módulo (vía exports)
+    bump_data_version([organization_id], "measurements")
+    return len(archived_ids)
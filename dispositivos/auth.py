@@ -0,0 +1,100 @@
+"""
+Autenticación de clientes máquina con tokens de dispositivo/gateway.
+
+La resolución token -> (dispositivo, organización) se sirve desde una caché LRU
+en memoria con TTL, así la ruta de ingesta no hace consultas de autenticación
+cuando hay acierto. Las señales de ``dispositivos.signals`` invalidan las
+entradas al rotar/revocar un token o al desactivar un dispositivo; en otros
+procesos el TTL acota cuánto tiempo puede seguir aceptándose un token revocado.
+"""
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.db.models import Q
+
+from .models import DeviceToken
+
+TokenIdentity = namedtuple("TokenIdentity", ["token_id", "device_id", "organization_id"])
+
+_MISSING = object()
+
+
+class TokenCache:
+    """LRU acotada con expiración por entrada; segura entre hilos."""
+
+    def __init__(self, max_size=10000, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return _MISSING
+            value, expires = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                return _MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def invalidate_device(self, device_id):
+        with self._lock:
+            stale = [k for k, (v, _) in self._data.items() if v is not None and v.device_id == device_id]
+            for key in stale:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+token_cache = TokenCache(
+    max_size=getattr(settings, "DEVICE_TOKEN_CACHE_SIZE", 10000),
+    ttl=getattr(settings, "DEVICE_TOKEN_CACHE_TTL", 60),
+)
+
+
+def get_request_token(request):
+    """Extrae la clave de ``Authorization: Token <clave>`` (o ``Bearer``)."""
+    header = request.headers.get("Authorization", "")
+    scheme, _, key = header.partition(" ")
+    if scheme.lower() in ("token", "bearer") and key.strip():
+        return key.strip()
+    return None
+
+
+def authenticate_token(key):
+    """Devuelve un ``TokenIdentity`` o ``None`` si la clave no es válida."""
+    if not key:
+        return None
+    key_hash = DeviceToken.hash_key(key)
+    identity = token_cache.get(key_hash)
+    if identity is not _MISSING:
+        return identity
+
+    row = (
+        DeviceToken.objects
+        .filter(key_hash=key_hash, status="ACTIVE")
+        .filter(Q(device__isnull=True) | Q(device__deleted_at__isnull=True, device__status="ACTIVE"))
+        .values_list("id", "device_id", "organization_id")
+        .first()
+    )
+    identity = TokenIdentity(*row) if row else None
+    token_cache.set(key_hash, identity)
+    return identity
@@ -0,0 +1,207 @@
+"""
+Buffer write-behind para escrituras de alta frecuencia (Measurement, Alert).
+
+Los productores encolan filas sin esperar a la BD; un hilo en segundo plano
+las vacía con un ``bulk_create`` por lote cuando se alcanza ``batch_size`` o
+pasa ``interval`` segundos. La memoria está acotada por ``max_size``: cuando
+el buffer está lleno ``put`` espera hasta ``timeout`` y luego lanza
+``BufferFull`` para que la vista responda 503 (backpressure). Si un lote
+sigue fallando tras los reintentos se divide en mitades hasta aislar las
+filas que fallan, que van al logger ``dispositivos.buffer.dead_letter``; el
+resto se escribe.
+
+Al apagar el proceso (lifespan de ASGI o ``atexit``) se vacía lo pendiente.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+logger = logging.getLogger(__name__)
+dead_letter = logging.getLogger(f"{__name__}.dead_letter")  # filas descartadas, una por registro
+
+
+def _describe(item):
+    """Campos de una instancia de modelo (o ``repr``) para el registro de descartes."""
+    meta = getattr(item, "_meta", None)
+    if meta is None:
+        return repr(item)
+    return {field.attname: getattr(item, field.attname) for field in meta.concrete_fields}
+
+
+class BufferFull(Exception):
+    """No hay espacio en el buffer dentro del tiempo de espera."""
+
+
+class WriteBehindBuffer:
+    def __init__(self, flush_func, max_size=100000, batch_size=1000, interval=1.0,
+                 max_retries=3, name="buffer", autostart=True):
+        self.flush_func = flush_func
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_retries = max_retries
+        self.name = name
+        self.autostart = autostart
+
+        self._items = deque()
+        self._lock = threading.Lock()
+        self._not_full = threading.Condition(self._lock)
+        self._write_lock = threading.Lock()  # un solo flush a la vez
+        self._wake = threading.Event()
+        self._thread = None
+        self._closed = False
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, item, timeout=0):
+        self.put_many([item], timeout=timeout)
+
+    def put_many(self, items, timeout=0):
+        """Encola ``items`` de forma atómica (todos o ninguno)."""
+        items = list(items)
+        if len(items) > self.max_size:
+            raise BufferFull(f"{self.name}: batch of {len(items)} exceeds buffer size {self.max_size}")
+        deadline = time.monotonic() + timeout
+        with self._not_full:
+            if self._closed:
+                raise BufferFull(f"{self.name} is closed")
+            while len(self._items) + len(items) > self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise BufferFull(f"{self.name} is full ({len(self._items)} pending)")
+                self._wake.set()
+                self._not_full.wait(remaining)
+            self._items.extend(items)
+            pending = len(self._items)
+        if pending >= self.batch_size:
+            self._wake.set()
+        if self.autostart:
+            self.start()
+
+    def start(self):
+        if self._thread is not None or self._closed:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f"write-behind-{self.name}", daemon=True)
+                self._thread.start()
+
+    def flush(self):
+        """Escribe todo lo pendiente en el hilo actual; devuelve las filas escritas."""
+        written = 0
+        with self._write_lock:
+            while True:
+                batch = self._take(self.batch_size)
+                if not batch:
+                    return written
+                written += self._write(batch)
+
+    def close(self, timeout=10):
+        """Detiene el hilo y vacía el buffer; es seguro llamarlo varias veces."""
+        with self._lock:
+            self._closed = True
+            self._not_full.notify_all()
+        self._wake.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+        return self.flush()
+
+    def _take(self, n):
+        with self._not_full:
+            batch = [self._items.popleft() for _ in range(min(n, len(self._items)))]
+            if batch:
+                self._not_full.notify_all()
+        return batch
+
+    def _write(self, batch):
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                self.flush_func(batch)
+                return len(batch)
+            except Exception:
+                logger.exception("%s: flush of %d rows failed (attempt %d)", self.name, len(batch), attempt)
+                close_old_connections()
+                if attempt < self.max_retries:
+                    time.sleep(min(self.interval, 1.0))
+        # Falla persistente: se parte el lote para escribir las filas buenas y aislar las malas
+        return self._bisect(batch)
+
+    def _bisect(self, batch):
+        if len(batch) == 1:
+            dead_letter.error("%s: dropping row after %d failed attempts: %s", self.name, self.max_retries, _describe(batch[0]))
+            return 0
+        written = 0
+        middle = len(batch) // 2
+        for half in (batch[:middle], batch[middle:]):
+            try:
+                self.flush_func(half)
+                written += len(half)
+            except Exception:
+                close_old_connections()
+                written += self._bisect(half)
+        return written
+
+    def _run(self):
+        try:
+            while not self._closed:
+                self._wake.wait(self.interval)
+                self._wake.clear()
+                close_old_connections()
+                self.flush()
+        finally:
+            connection.close()
+
+
+_buffers = {}
+_buffers_lock = threading.Lock()
+
+
+def write_behind_enabled():
+    return getattr(settings, "WRITE_BEHIND_ENABLED", False)
+
+
+def _get_buffer(name, flush_func):
+    buffer = _buffers.get(name)
+    if buffer is None:
+        with _buffers_lock:
+            buffer = _buffers.get(name)
+            if buffer is None:
+                buffer = WriteBehindBuffer(
+                    flush_func,
+                    max_size=getattr(settings, "WRITE_BEHIND_MAX_ROWS", 100000),
+                    batch_size=getattr(settings, "WRITE_BEHIND_BATCH_SIZE", 2000),
+                    interval=getattr(settings, "WRITE_BEHIND_INTERVAL", 1.0),
+                    name=name,
+                )
+                _buffers[name] = buffer
+    return buffer
+
+
+def get_measurement_buffer():
+    from .ingest import write_measurements
+    return _get_buffer("measurements", write_measurements)
+
+
+def get_alert_buffer():
+    from .signals import write_alerts
+    return _get_buffer("alerts", write_alerts)
+
+
+def shutdown_buffers():
+    """Vacía todos los buffers; se llama en el shutdown de ASGI y con ``atexit``."""
+    for buffer in list(_buffers.values()):
+        try:
+            written = buffer.close()
+            if written:
+                logger.info("%s: flushed %d rows on shutdown", buffer.name, written)
+        except Exception:
+            logger.exception("%s: flush on shutdown failed", buffer.name)
+
+
+atexit.register(shutdown_buffers)
@@ -0,0 +1,11 @@
+from django.utils.functional import SimpleLazyObject
+
+from .alerts import unread_counts
+
+
+def unread_alerts(request):
+    """Contadores de alertas no leídas para el menú (desde caché, ver ``dispositivos.alerts``)."""
+    organization = getattr(request, "organization", None)  # ver usuarios.middleware
+    if organization is None:
+        return {}
+    return {"unread_alerts": SimpleLazyObject(lambda: unread_counts(organization.pk))}
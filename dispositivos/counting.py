@@ -0,0 +1,171 @@
+"""
+Conteos baratos para listados grandes.
+
+``count_queryset`` cuenta de forma exacta solo hasta ``COUNT_EXACT_LIMIT`` filas
+(``COUNT(*)`` sobre una subconsulta con ``LIMIT``); por encima usa la
+estimación del planificador de la BD y la UI muestra "about N" (el admin pagina
+entonces con "hay siguiente" en lugar de números de página calculados). El resultado
+se guarda unos segundos por consulta (la SQL incluye organización y filtros)
+en la caché ``local`` del proceso: un conteo algo desactualizado es aceptable
+y así no se consulta la caché compartida.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db import DatabaseError, connections
+from django.utils.functional import cached_property
+
+
+class ResultCount:
+    EXACT = "exact"
+    ESTIMATE = "estimate"
+    LOWER_BOUND = "lower_bound"  # sin estimación disponible: "más de N"
+
+    def __init__(self, value, kind=EXACT):
+        self.value = value
+        self.kind = kind
+
+    @property
+    def estimated(self):
+        return self.kind != self.EXACT
+
+    def __int__(self):
+        return self.value
+
+    def __eq__(self, other):
+        return isinstance(other, ResultCount) and (self.value, self.kind) == (other.value, other.kind)
+
+    def __str__(self):
+        if self.kind == self.ESTIMATE:
+            return f"about {self.value:,}"
+        if self.kind == self.LOWER_BOUND:
+            return f"more than {self.value:,}"
+        return f"{self.value:,}"
+
+
+def _cache_key(queryset):
+    sql, params = queryset.query.sql_with_params()
+    digest = hashlib.md5(f"{queryset.db}:{sql}:{params!r}".encode()).hexdigest()
+    return f"count:{queryset.model._meta.label_lower}:{digest}"
+
+
+def planner_estimate(queryset):
+    """Filas estimadas por el planificador (PostgreSQL/MySQL) o ``None``."""
+    connection = connections[queryset.db]
+    try:
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+                plan = cursor.fetchone()[0]
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                return int(plan[0]["Plan"]["Plan Rows"])
+            if connection.vendor == "mysql":
+                cursor.execute(f"EXPLAIN {sql}", params)
+                columns = [col[0] for col in cursor.description]
+                row = dict(zip(columns, cursor.fetchone()))
+                rows = row.get("rows") or 0
+                filtered = row.get("filtered") or 100
+                return int(rows * filtered / 100)
+    except (DatabaseError, EmptyResultSet, LookupError, TypeError, ValueError):
+        return None
+    return None
+
+
+def count_queryset(queryset, exact_limit=None, ttl=None):
+    """Devuelve un ``ResultCount`` exacto, estimado o de cota inferior."""
+    exact_limit = exact_limit if exact_limit is not None else settings.COUNT_EXACT_LIMIT
+    ttl = ttl if ttl is not None else settings.COUNT_CACHE_TTL
+    queryset = queryset.order_by()
+    try:
+        key = _cache_key(queryset)
+    except EmptyResultSet:  # p. ej. ``.none()`` o ``id__in=[]``
+        return ResultCount(0)
+    cached = caches["local"].get(key)
+    if cached is not None:
+        return ResultCount(*cached)
+
+    bounded = queryset[:exact_limit + 1].count()
+    if bounded <= exact_limit:
+        result = ResultCount(bounded)
+    else:
+        estimate = planner_estimate(queryset)
+        if estimate and estimate > exact_limit:
+            result = ResultCount(estimate, ResultCount.ESTIMATE)
+        else:
+            result = ResultCount(exact_limit, ResultCount.LOWER_BOUND)
+    caches["local"].set(key, (result.value, result.kind), ttl)
+    return result
+
+
+class OpenEndedPage(Page):
+    """Página sin total conocido: ``has_next`` sale de leer una fila de más."""
+
+    def __init__(self, object_list, number, paginator, more):
+        super().__init__(object_list, number, paginator)
+        self.more = more
+
+    def has_next(self):
+        return self.more
+
+    def end_index(self):
+        return (self.number - 1) * self.paginator.per_page + len(self.object_list)
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator del admin que usa ``count_queryset`` en vez de un ``COUNT(*)`` completo.
+
+    Con un conteo exacto (hasta ``COUNT_EXACT_LIMIT``) se comporta como
+    ``Paginator``. Por encima el total no se usa para calcular páginas: cada
+    página lee ``per_page + 1`` filas para saber si hay siguiente y la
+    navegación muestra solo las páginas vecinas (sin "última página").
+    """
+
+    @cached_property
+    def result_count(self):
+        return count_queryset(self.object_list)
+
+    @cached_property
+    def count(self):
+        return self.result_count.value  # solo para mostrar; no define el número de páginas
+
+    def validate_number(self, number):
+        if not self.result_count.estimated:
+            return super().validate_number(number)
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger("That page number is not an integer")
+        if number < 1:
+            raise EmptyPage("That page number is less than 1")
+        return number
+
+    def page(self, number):
+        if not self.result_count.estimated:
+            return super().page(number)
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not rows and number > 1:
+            raise EmptyPage("That page contains no results")
+        return OpenEndedPage(rows[:self.per_page], number, self, more=len(rows) > self.per_page)
+
+    def get_elided_page_range(self, number=1, *, on_each_side=3, on_ends=2):
+        if not self.result_count.estimated:
+            yield from super().get_elided_page_range(number, on_each_side=on_each_side, on_ends=on_ends)
+            return
+        number = self.validate_number(number)
+        first = max(1, number - on_each_side)
+        if first > 1:
+            yield 1
+            if first > 2:
+                yield self.ELLIPSIS
+        yield from range(first, number + 1)
+        if self.page(number).has_next():
+            yield number + 1
+            yield self.ELLIPSIS
@@ -0,0 +1,116 @@
+"""
+Snapshot del dashboard por organización.
+
+``build_snapshot`` arma todos los datos del dashboard en pocas consultas
+(agregación condicional, ``values()`` con los joins necesarios y el consumo
+ya integrado en ``EnergyConsumption``) y devuelve estructuras simples que se
+guardan en caché. Las señales de Device, Zone,
+Category y Alert borran el snapshot; las mediciones solo lo marcan como
+desactualizado y se reconstruye como mucho una vez cada
+``DASHBOARD_MEASUREMENT_STALENESS`` segundos, así la ingesta continua no
+invalida la caché en cada lote.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDay
+from django.utils import timezone
+
+from .models import Alert, Category, Device, EnergyConsumption, Measurement, Zone
+
+ALL = "all"  # usuarios sin organización: snapshot vacío
+
+
+def _snapshot_key(organization_id):
+    return f"dashboard:{organization_id or ALL}"
+
+
+def _changed_key(organization_id):
+    return f"dashboard:{organization_id or ALL}:measurements"
+
+
+def build_snapshot(organization_id=None):
+    def scoped(manager):
+        if organization_id is None:
+            return manager.none()  # nunca los datos de otras organizaciones
+        return manager.filter(organization_id=organization_id)
+
+    week_ago = timezone.now() - timedelta(days=7)
+    zones = list(
+        scoped(Zone.objects)
+        .annotate(device_count=Count("devices", filter=Q(devices__deleted_at__isnull=True)))
+        .order_by("-device_count")
+        .values("id", "name", "device_count")
+    )
+    alert_counts = scoped(Alert.objects).filter(created_at__gte=week_ago).aggregate(
+        grave=Count("id", filter=Q(level="GRAVE")),
+        alta=Count("id", filter=Q(level="ALTA")),
+        media=Count("id", filter=Q(level="MEDIA")),
+    )
+    categories = list(scoped(Category.objects).values("id", "name", "description"))
+    devices = list(
+        scoped(Device.objects)
+        .values("id", "name", category_name=F("category__name"), zone_name=F("zone__name"))
+    )
+    latest_measurements = list(
+        scoped(Measurement.objects)
+        .order_by("-date")
+        .values("date", "value", "unit", device_name=F("device__name"))[:10]
+    )
+
+    # Consumo desde EnergyConsumption (kWh por hora), sin leer mediciones crudas
+    today = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+    month = today.replace(day=1)
+    energy_this_month = scoped(EnergyConsumption.objects).filter(bucket__gte=month)
+    energy = energy_this_month.aggregate(
+        month=Sum("kwh"),
+        today=Sum("kwh", filter=Q(bucket__gte=today)),
+    )
+    energy["by_zone"] = list(
+        energy_this_month.values(name=F("zone__name")).annotate(kwh=Sum("kwh")).order_by("-kwh")
+    )
+    energy["by_category"] = list(
+        energy_this_month.values(name=F("category__name")).annotate(kwh=Sum("kwh")).order_by("-kwh")
+    )
+    energy["daily"] = list(
+        scoped(EnergyConsumption.objects).filter(bucket__gte=today - timedelta(days=6))
+        .annotate(day=TruncDay("bucket")).values("day").annotate(kwh=Sum("kwh")).order_by("day")
+    )
+    return {
+        "built_at": time.time(),
+        "zones_with_devices": zones,
+        "alert_counts": alert_counts,
+        "categories": categories,
+        "devices": devices,
+        "latest_measurements": latest_measurements,
+        "energy": energy,
+    }
+
+
+def get_snapshot(organization_id=None):
+    """Snapshot en caché; normalmente una sola lectura (``get_many``)."""
+    key, changed_key = _snapshot_key(organization_id), _changed_key(organization_id)
+    cached = cache.get_many([key, changed_key])
+    snapshot = cached.get(key)
+    if snapshot is not None:
+        changed_at = cached.get(changed_key)
+        if changed_at is None or changed_at <= snapshot["built_at"]:
+            return snapshot
+        if time.time() - snapshot["built_at"] < settings.DASHBOARD_MEASUREMENT_STALENESS:
+            return snapshot
+    snapshot = build_snapshot(organization_id)
+    cache.set(key, snapshot, settings.DASHBOARD_CACHE_TTL)
+    return snapshot
+
+
+def invalidate(organization_id):
+    cache.delete(_snapshot_key(organization_id))
+
+
+def mark_measurements_changed(organization_ids):
+    now = time.time()
+    keys = {_changed_key(organization_id): now for organization_id in set(organization_ids)}
+    cache.set_many(keys, settings.DASHBOARD_CACHE_TTL)
@@ -0,0 +1,117 @@
+"""
+Reducción de series de mediciones para gráficos.
+
+Devuelve como máximo N puntos representativos de un (dispositivo, rango):
+
+* ``lttb``: Largest-Triangle-Three-Buckets, conserva la forma visual.
+* ``minmax``: mínimo y máximo por ventana, conserva picos y valles.
+
+Si el rango tiene pocas lecturas se reduce la serie cruda (archivo + BD); si es
+denso se parte de los rollups (1m/1h/1d), así el costo queda acotado sin
+importar cuántas lecturas crudas haya.
+"""
+from array import array
+
+import numpy as np
+
+from . import rollups
+from .archive import iter_measurement_rows
+
+METHODS = ("lttb", "minmax")
+DEFAULT_POINTS = 500
+MAX_POINTS = 5000
+RAW_POINT_LIMIT = 100000  # por encima se usan rollups
+
+
+def lttb(t, v, n):
+    """Selecciona ``n`` puntos con Largest-Triangle-Three-Buckets.
+
+    El primer y el último punto se conservan; en cada ventana se elige el punto
+    que forma el triángulo de mayor área con el punto elegido antes y el
+    promedio de la ventana siguiente (áreas calculadas en bloque con NumPy).
+    """
+    size = len(t)
+    if n >= size or n < 3:
+        return t, v
+    edges = np.linspace(1, size - 1, n - 1).astype(np.int64)  # n-2 ventanas interiores
+    selected = np.empty(n, dtype=np.int64)
+    selected[0], selected[-1] = 0, size - 1
+    previous = 0
+    for i in range(n - 2):
+        lo, hi = edges[i], max(edges[i + 1], edges[i] + 1)
+        if i + 2 < n - 1:
+            next_lo, next_hi = edges[i + 1], max(edges[i + 2], edges[i + 1] + 1)
+            avg_t, avg_v = t[next_lo:next_hi].mean(), v[next_lo:next_hi].mean()
+        else:
+            avg_t, avg_v = t[-1], v[-1]
+        pt, pv = t[previous], v[previous]
+        areas = np.abs((pt - avg_t) * (v[lo:hi] - pv) - (pt - t[lo:hi]) * (avg_v - pv))
+        previous = lo + int(np.argmax(areas))
+        selected[i + 1] = previous
+    return t[selected], v[selected]
+
+
+def minmax(t, v, n):
+    """Mínimo y máximo de ``n // 2`` ventanas de igual duración, en orden temporal."""
+    size = len(t)
+    buckets = max(n // 2, 1)
+    if size <= n:
+        return t, v
+    span = t[-1] - t[0]
+    if span <= 0:
+        index = np.array([np.argmin(v), np.argmax(v)])
+    else:
+        bucket = np.minimum(((t - t[0]) / span * buckets).astype(np.int64), buckets - 1)
+        order = np.lexsort((v, bucket))  # por ventana y, dentro de ella, por valor
+        ordered = bucket[order]
+        first = np.flatnonzero(np.r_[True, ordered[1:] != ordered[:-1]])
+        last = np.r_[first[1:] - 1, size - 1]
+        index = np.concatenate([order[first], order[last]])
+    index = np.unique(index)  # ordena por posición (tiempo) y quita duplicados
+    return t[index], v[index]
+
+
+def downsample(t, v, max_points=DEFAULT_POINTS, method="lttb"):
+    if method == "minmax":
+        return minmax(t, v, max_points)
+    return lttb(t, v, max_points)
+
+
+def load_raw(organization_id, device_id, start, end):
+    """Lecturas crudas como arreglos (segundos epoch, valor)."""
+    times, values = array("d"), array("d")
+    for row in iter_measurement_rows(organization_id, start, end, device_ids=[device_id]):
+        times.append(row.date.timestamp())
+        values.append(row.value)
+    return np.frombuffer(times, dtype=np.float64), np.frombuffer(values, dtype=np.float64)
+
+
+def load_rollups(device_id, start, end, max_points, method):
+    """Serie desde rollups: promedio por ventana (lttb) o mínimo y máximo (minmax)."""
+    target = max_points // 2 if method == "minmax" else max_points
+    resolution = rollups.pick_resolution(start, end, max(target, 1))
+    rows = list(rollups.series(device_id, start, end, resolution).values_list("bucket", "min", "max", "sum", "count"))
+    if not rows:
+        empty = np.empty(0, dtype=np.float64)
+        return empty, empty, resolution
+    buckets = np.array([row[0].timestamp() for row in rows], dtype=np.float64)
+    mins, maxs, sums, counts = (np.array([row[i] for row in rows], dtype=np.float64) for i in range(1, 5))
+    if method == "minmax":
+        return np.repeat(buckets, 2), np.column_stack([mins, maxs]).ravel(), resolution
+    return buckets, sums / np.maximum(counts, 1), resolution
+
+
+def load_series(organization_id, device_id, start, end, max_points=DEFAULT_POINTS, method="lttb"):
+    """Devuelve (tiempos, valores, fuente) con como máximo ``max_points`` puntos.
+
+    ``fuente`` es ``"raw"`` o ``"rollup:<resolución>"``.
+    """
+    raw_count = rollups.summarize([device_id], start, end)[device_id]["count"]
+    if raw_count <= RAW_POINT_LIMIT:
+        t, v = load_raw(organization_id, device_id, start, end)
+        source = "raw"
+    else:
+        t, v, resolution = load_rollups(device_id, start, end, max_points, method)
+        source = f"rollup:{resolution}"
+    t, v = downsample(t, v, max_points, method)
+    return t, v, source
@@ -0,0 +1,241 @@
+"""
+Integración de consumo de energía (kWh por dispositivo y hora).
+
+Las lecturas se clasifican por unidad:
+
+* ``Wh``/``kWh``/``MWh``: medidor acumulado; el consumo es la diferencia entre
+  lecturas (si el contador baja se asume un reinicio y se cuenta la lectura).
+* ``W``/``kW``/``MW``: potencia instantánea; se integra con la regla del
+  trapecio, salvo huecos de más de ``ENERGY_MAX_GAP_MINUTES``. Si el
+  dispositivo también informa un medidor, desde su primera lectura manda el
+  medidor y la potencia se ignora (no se cuenta dos veces).
+
+El consumo de cada intervalo se reparte proporcionalmente entre las horas que
+cubre y se guarda en ``EnergyConsumption`` con zona y categoría copiadas, de
+modo que los totales por zona/categoría/organización son sumas sobre pocas
+filas. ``EnergyCursor`` guarda la última lectura integrada de cada dispositivo
+para continuar con el siguiente lote; las lecturas atrasadas o editadas se
+corrigen con ``manage.py rebuild_energy``.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q, Sum
+from django.db.models.functions import TruncDay, TruncMonth
+
+from .archive import iter_measurement_rows
+from .models import Device, EnergyConsumption, EnergyCursor, Measurement
+from .rollups import bucket_start, device_batches, rebuild_in_chunks
+
+ENERGY, POWER = "energy", "power"
+# unidad en minúsculas -> (tipo, factor a kWh o kW)
+UNITS = {
+    "wh": (ENERGY, 0.001),
+    "kwh": (ENERGY, 1.0),
+    "mwh": (ENERGY, 1000.0),
+    "w": (POWER, 0.001),
+    "kw": (POWER, 1.0),
+    "mw": (POWER, 1000.0),
+}
+HOUR = timedelta(hours=1)
+PERIODS = {"day": TruncDay, "month": TruncMonth}
+GROUPS = ("device", "zone", "category")
+
+
+def classify(unit):
+    return UNITS.get((unit or "").strip().lower())
+
+
+def split_hours(start, end, kwh):
+    """Reparte ``kwh`` del intervalo ``[start, end)`` entre las horas que cubre."""
+    total = (end - start).total_seconds()
+    moment = start
+    while moment < end:
+        bucket = bucket_start(moment, "1h")
+        until = min(bucket + HOUR, end)
+        yield bucket, kwh * (until - moment).total_seconds() / total
+        moment = until
+
+
+class Integrator:
+    """Convierte lecturas ordenadas por fecha (por dispositivo) en kWh por hora."""
+
+    def __init__(self, states=None, max_gap=None):
+        self.states = dict(states or {})  # device_id -> (tipo, fecha, kWh o kW)
+        self.totals = defaultdict(float)  # (device_id, hora) -> kWh
+        self.max_gap = max_gap or timedelta(minutes=settings.ENERGY_MAX_GAP_MINUTES)
+        self.skipped = 0
+
+    def feed(self, device_id, date, value, unit):
+        spec = classify(unit)
+        if spec is None:
+            return
+        kind, factor = spec
+        value = float(value) * factor
+        previous = self.states.get(device_id)
+        if previous is not None:
+            previous_kind, previous_date, previous_value = previous
+            if previous_kind == ENERGY and kind == POWER:
+                return  # con medidor la potencia se ignora: contaría dos veces
+            if previous_kind == POWER and kind == ENERGY:
+                # primer dato del medidor: la potencia se integró hasta aquí y el medidor sigue desde esta lectura
+                self.states[device_id] = (kind, max(date, previous_date), value)
+                return
+            if date <= previous_date:
+                self.skipped += 1  # atrasada o repetida: la corrige rebuild_energy
+                return
+            energy = None
+            if previous_kind == kind == ENERGY:
+                energy = value - previous_value
+                if energy < 0:
+                    energy = value
+            elif previous_kind == kind == POWER and date - previous_date <= self.max_gap:
+                energy = (previous_value + value) / 2 * (date - previous_date).total_seconds() / 3600
+            if energy:
+                for bucket, kwh in split_hours(previous_date, date, energy):
+                    self.totals[(device_id, bucket)] += kwh
+        self.states[device_id] = (kind, date, value)
+
+    def pop_totals(self):
+        totals, self.totals = self.totals, defaultdict(float)
+        return totals
+
+
+def _merge_totals(totals):
+    """Suma ``totals`` a las filas existentes o las crea (dentro de una transacción)."""
+    if not totals:
+        return
+    device_ids = {device_id for device_id, _ in totals}
+    buckets = [bucket for _, bucket in totals]
+    existing = EnergyConsumption.objects.select_for_update().filter(
+        device_id__in=device_ids, bucket__gte=min(buckets), bucket__lte=max(buckets),
+    )
+    to_update = []
+    for row in existing:
+        kwh = totals.pop((row.device_id, row.bucket), None)
+        if kwh is not None:
+            row.kwh += kwh
+            to_update.append(row)
+    EnergyConsumption.objects.bulk_update(to_update, ["kwh"], batch_size=1000)
+
+    scopes = {
+        device_id: (organization_id, zone_id, category_id)
+        for device_id, organization_id, zone_id, category_id in Device.all_objects
+        .filter(id__in={device_id for device_id, _ in totals})
+        .values_list("id", "organization_id", "zone_id", "category_id")
+    }
+    EnergyConsumption.objects.bulk_create([
+        EnergyConsumption(
+            device_id=device_id, bucket=bucket, kwh=kwh,
+            organization_id=scopes[device_id][0], zone_id=scopes[device_id][1], category_id=scopes[device_id][2],
+        )
+        for (device_id, bucket), kwh in totals.items()
+    ], batch_size=1000)
+
+
+def apply_measurements(measurements):
+    """Integra un lote recién insertado continuando desde el cursor de cada dispositivo."""
+    rows = sorted(
+        (m.device_id, m.date, m.value, m.unit) for m in measurements if classify(m.unit)
+    )
+    if not rows:
+        return
+    device_ids = {row[0] for row in rows}
+    with transaction.atomic():
+        # El cursor bloqueado serializa lotes concurrentes del mismo dispositivo
+        EnergyCursor.objects.bulk_create([EnergyCursor(device_id=d) for d in device_ids], ignore_conflicts=True)
+        cursors = list(EnergyCursor.objects.select_for_update().filter(device_id__in=device_ids))
+        integrator = Integrator({
+            c.device_id: (c.kind, c.last_date, c.last_value) for c in cursors if c.last_date is not None
+        })
+        for row in rows:
+            integrator.feed(*row)
+        _merge_totals(integrator.totals)
+        for cursor in cursors:
+            cursor.kind, cursor.last_date, cursor.last_value = integrator.states[cursor.device_id]
+        EnergyCursor.objects.bulk_update(cursors, ["kind", "last_date", "last_value"])
+
+
+def _last_reading(device_id, start, kind):
+    units = Q()
+    for unit, (unit_kind, _) in UNITS.items():
+        if unit_kind == kind:
+            units |= Q(unit__iexact=unit)
+    return (
+        Measurement.objects.filter(units, device_id=device_id, date__lt=start)
+        .order_by("-date").values_list("date", "value", "unit").first()
+    )
+
+
+def _anchor(device_id, start):
+    """Última lectura anterior a ``start`` (punto de partida): la del medidor si lo hay, si no la de potencia."""
+    row = _last_reading(device_id, start, ENERGY) or _last_reading(device_id, start, POWER)
+    if row is None:
+        return None
+    kind, factor = classify(row[2])
+    return kind, row[0], float(row[1]) * factor
+
+
+def _rebuild_devices(org_id, ids, start):
+    states = {}
+    if start is not None:
+        states = {d: state for d in ids if (state := _anchor(d, start)) is not None}
+    integrator = Integrator(states)
+    written = 0
+
+    def feed(row):
+        integrator.feed(row.device_id, row.date, row.value, row.unit)
+
+    def flush(lo, hi):
+        nonlocal written
+        totals = integrator.pop_totals()
+        with transaction.atomic():
+            consumption = EnergyConsumption.objects.filter(device_id__in=ids)
+            if lo is not None:
+                consumption = consumption.filter(bucket__gte=lo)
+            if hi is not None:
+                consumption = consumption.filter(bucket__lt=hi)
+            consumption.delete()
+            # Un intervalo que cruza el borde suma a horas del tramo anterior, ya reconstruido
+            _merge_totals(totals)
+        written += len(totals)
+
+    rebuild_in_chunks(iter_measurement_rows(org_id, start, None, device_ids=ids), start, None, feed, flush)
+    with transaction.atomic():
+        EnergyCursor.objects.filter(device_id__in=ids).delete()
+        EnergyCursor.objects.bulk_create([
+            EnergyCursor(device_id=device_id, kind=kind, last_date=date, last_value=value)
+            for device_id, (kind, date, value) in integrator.states.items()
+        ])
+    return written
+
+
+def rebuild(device_ids=None, organization_id=None, start=None):
+    """Recalcula el consumo desde las lecturas (BD y archivo); devuelve las horas escritas.
+
+    Se confirma por grupo de dispositivos y tramo de días (ver ``rollups.rebuild_in_chunks``).
+    """
+    if start is not None:
+        start = bucket_start(start, "1h")
+    return sum(_rebuild_devices(org_id, ids, start) for org_id, ids in device_batches(device_ids, organization_id))
+
+
+def consumption(organization_id, start, end, period="day", group_by=None):
+    """kWh por período (``day``/``month``, en la zona horaria local) y opcionalmente por
+    ``device``, ``zone`` o ``category``; sin ``group_by`` es el total de la organización."""
+    rows = EnergyConsumption.objects.filter(organization_id=organization_id, bucket__gte=start, bucket__lt=end)
+    fields = ["period"]
+    if group_by is not None:
+        if group_by not in GROUPS:
+            raise ValueError(f"group_by must be one of {', '.join(GROUPS)}")
+        fields += [f"{group_by}_id"]
+        rows = rows.annotate(name=F(f"{group_by}__name"))
+        fields += ["name"]
+    return list(
+        rows.annotate(period=PERIODS[period]("bucket"))
+        .values(*fields)
+        .annotate(kwh=Sum("kwh"))
+        .order_by(*fields)
+    )
@@ -0,0 +1,242 @@
+"""
+Exportaciones de mediciones y dispositivos con memoria constante.
+
+Las filas se leen en bloques por clave (``iter_keyset`` / ``values_list`` y los
+segmentos archivados) sin crear instancias de modelo. Excel usa el modo write-only de
+openpyxl, que va volcando las filas a disco; CSV y NDJSON se generan como
+flujo de texto (opcionalmente gzip) para ``StreamingHttpResponse``.
+"""
+import csv
+import io
+import json
+import zlib
+from collections import namedtuple
+from datetime import datetime, time, timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from openpyxl import Workbook
+
+from .archive import iter_measurement_rows
+from .models import Device
+from .pagination import iter_keyset
+
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+MEASUREMENT_HEADERS = ["Device", "Value", "Unit", "Date"]
+DEVICE_HEADERS = ["Name", "Category", "Zone", "Reference", "Status"]
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+XLSX_MAX_ROWS = 1048576  # límite de filas de una hoja de Excel (incluye el encabezado)
+
+CSV_CONTENT_TYPE = "text/csv; charset=utf-8"
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
+STREAM_FIELDS = ["device_id", "device", "date", "value", "unit"]
+STREAM_CHUNK_ROWS = 1000  # filas por bloque enviado al cliente
+
+ExportFilters = namedtuple("ExportFilters", ["start", "end", "device_ids", "category_id", "zone_id", "search"])
+
+
+class ExportFilterError(ValueError):
+    """Parámetros de filtro inválidos."""
+
+
+def _getlist(params, name):
+    if hasattr(params, "getlist"):
+        return params.getlist(name)
+    value = params.get(name)
+    if value in (None, ""):
+        return []
+    return value if isinstance(value, (list, tuple)) else [value]
+
+
+def _parse_day(params, name):
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        day = parse_date(value)
+    except ValueError:
+        day = None
+    if day is None:
+        raise ExportFilterError(f"{name}: expected a date in YYYY-MM-DD format.")
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _parse_id(value, name):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ExportFilterError(f"{name}: expected an integer id.")
+
+
+def parse_filters(params):
+    """Filtros desde GET (o un dict guardado): start/end (YYYY-MM-DD, end inclusive),
+    device (repetible), category, zone y search."""
+    start, end = _parse_day(params, "start"), _parse_day(params, "end")
+    if end is not None:
+        end += timedelta(days=1)
+    if start is not None and end is not None and start >= end:
+        raise ExportFilterError("start must not be after end.")
+    device_ids = [_parse_id(value, "device") for value in _getlist(params, "device") if value != ""]
+    category, zone = params.get("category"), params.get("zone")
+    return ExportFilters(
+        start=start,
+        end=end,
+        device_ids=device_ids or None,
+        category_id=_parse_id(category, "category") if category else None,
+        zone_id=_parse_id(zone, "zone") if zone else None,
+        search=params.get("search") or None,
+    )
+
+
+def device_queryset(organization_id, filters, manager=Device.objects):
+    devices = manager.filter(organization_id=organization_id)
+    if filters.device_ids is not None:
+        devices = devices.filter(id__in=filters.device_ids)
+    if filters.category_id:
+        devices = devices.filter(category_id=filters.category_id)
+    if filters.zone_id:
+        devices = devices.filter(zone_id=filters.zone_id)
+    if filters.search:
+        devices = devices.filter(
+            Q(name__icontains=filters.search)
+            | Q(reference__icontains=filters.search)
+            | Q(category__name__icontains=filters.search)
+            | Q(zone__name__icontains=filters.search)
+        )
+    return devices
+
+
+def measurement_device_ids(organization_id, filters):
+    """Ids de dispositivo a exportar, o ``None`` si no hay filtro por dispositivo/zona/categoría."""
+    if filters.device_ids is None and not filters.category_id and not filters.zone_id:
+        return None
+    # all_objects: las lecturas de dispositivos dados de baja siguen siendo exportables
+    return list(device_queryset(organization_id, filters._replace(search=None), Device.all_objects)
+                .values_list("id", flat=True))
+
+
+def iter_measurements(organization_id, filters):
+    """(MeasurementRow, nombre del dispositivo) en orden de fecha, archivo incluido."""
+    device_names = dict(Device.all_objects.filter(organization_id=organization_id).values_list("id", "name"))
+    device_ids = measurement_device_ids(organization_id, filters)
+    for row in iter_measurement_rows(organization_id, filters.start, filters.end, device_ids=device_ids):
+        yield row, device_names.get(row.device_id, "")
+
+
+def iter_measurement_export_rows(organization_id, filters):
+    """Filas (dispositivo, valor, unidad, fecha) para Excel."""
+    for row, name in iter_measurements(organization_id, filters):
+        yield [name, row.value, row.unit, row.date.strftime(DATE_FORMAT)]
+
+
+def iter_measurement_stream_rows(organization_id, filters):
+    """Filas con ``STREAM_FIELDS`` (CSV/NDJSON)."""
+    for row, name in iter_measurements(organization_id, filters):
+        yield [row.device_id, name, row.date.isoformat(), row.value, row.unit]
+
+
+def iter_device_export_rows(organization_id, filters):
+    rows = iter_keyset(
+        device_queryset(organization_id, filters), ("name", "id"),
+        ("name", "category__name", "zone__name", "reference", "status"), chunk_size=2000,
+    )
+    for row in rows:
+        yield list(row)
+
+
+def write_xlsx(fh, title, headers, rows, rows_per_sheet=XLSX_MAX_ROWS - 1):
+    """Escribe ``fh`` en modo write-only; devuelve las filas escritas.
+
+    Al llenarse una hoja (límite de Excel) sigue en otra, "Título (2)", "Título (3)"...
+    """
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title)
+    sheet.append(headers)
+    count = 0
+    for row in rows:
+        if count and count % rows_per_sheet == 0:
+            sheet = workbook.create_sheet(f"{title} ({count // rows_per_sheet + 1})")
+            sheet.append(headers)
+        sheet.append(row)
+        count += 1
+    workbook.save(fh)
+    return count
+
+
+def write_csv(fh, headers, rows):
+    """Escribe CSV UTF-8 en el archivo binario ``fh``; devuelve las filas escritas."""
+    text = io.TextIOWrapper(fh, encoding="utf-8", newline="")
+    writer = csv.writer(text)
+    writer.writerow(headers)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    text.flush()
+    text.detach()
+    return count
+
+
+def stream_csv(organization_id, filters):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(STREAM_FIELDS)
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    for count, row in enumerate(iter_measurement_stream_rows(organization_id, filters), 1):
+        writer.writerow(row)
+        if count % STREAM_CHUNK_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def stream_ndjson(organization_id, filters):
+    lines = []
+    for row, name in iter_measurements(organization_id, filters):
+        lines.append(json.dumps({
+            "device_id": row.device_id,
+            "device": name,
+            "date": row.date.isoformat(),
+            "value": row.value,
+            "unit": row.unit,
+        }))
+        if len(lines) == STREAM_CHUNK_ROWS:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+def accepts_gzip(accept_encoding):
+    """Si ``Accept-Encoding`` admite gzip según sus valores q (``gzip;q=0`` lo rechaza)."""
+    qualities = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.strip().lower()] = quality
+    for coding in ("gzip", "x-gzip", "*"):
+        if coding in qualities:
+            return qualities[coding] > 0
+    return False
+
+
+def gzip_stream(chunks, level=6):
+    """Comprime un flujo de texto en formato gzip; cada bloque se envía sin esperar al final."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8")) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -13,16 +13,11 @@ class DeviceForm(forms.ModelForm):
         }
 
     def __init__(self, *args, **kwargs):
-        self.user = kwargs.pop('user', None)
+        self.organization = kwargs.pop('organization', None)
         super().__init__(*args, **kwargs)
-        if self.user:
-            try:
-                organization = self.user.userprofile.organization
-                self.fields['category'].queryset = Category.objects.filter(organization=organization)
-                self.fields['zone'].queryset = Zone.objects.filter(organization=organization)
-            except:
-                self.fields['category'].queryset = Category.objects.none()
-                self.fields['zone'].queryset = Zone.objects.none()
+        # Solo categorías y zonas de la organización (request.organization)
+        self.fields['category'].queryset = Category.objects.for_org(self.organization)
+        self.fields['zone'].queryset = Zone.objects.for_org(self.organization)
 
 class MeasurementForm(forms.ModelForm):
     class Meta:
@@ -36,14 +31,9 @@ class MeasurementForm(forms.ModelForm):
         }
 
     def __init__(self, *args, **kwargs):
-        self.user = kwargs.pop('user', None)
+        self.organization = kwargs.pop('organization', None)
         super().__init__(*args, **kwargs)
-        if self.user:
-            try:
-                organization = self.user.userprofile.organization
-                self.fields['device'].queryset = Device.objects.filter(organization=organization)
-            except:
-                self.fields['device'].queryset = Device.objects.none()
+        self.fields['device'].queryset = Device.objects.for_org(self.organization)
 
 class CategoryForm(forms.ModelForm):
     class Meta:
@@ -75,14 +65,9 @@ class SensorForm(forms.ModelForm):
         }
 
     def __init__(self, *args, **kwargs):
-        self.user = kwargs.pop('user', None)
+        self.organization = kwargs.pop('organization', None)
         super().__init__(*args, **kwargs)
-        if self.user:
-            try:
-                organization = self.user.userprofile.organization
-                self.fields['device'].queryset = Device.objects.filter(organization=organization)
-            except:
-                self.fields['device'].queryset = Device.objects.none()
+        self.fields['device'].queryset = Device.objects.for_org(self.organization)
 
 class AlertForm(forms.ModelForm):
     class Meta:
@@ -95,11 +80,6 @@ class AlertForm(forms.ModelForm):
         }
 
     def __init__(self, *args, **kwargs):
-        self.user = kwargs.pop('user', None)
+        self.organization = kwargs.pop('organization', None)
         super().__init__(*args, **kwargs)
-        if self.user:
-            try:
-                organization = self.user.userprofile.organization
-                self.fields['device'].queryset = Device.objects.filter(organization=organization)
-            except:
-                self.fields['device'].queryset = Device.objects.none()
+        self.fields['device'].queryset = Device.objects.for_org(self.organization)
@@ -0,0 +1,89 @@
+"""
+Caché de fragmentos de plantilla por organización.
+
+``{% orgcache "nombre" var1 var2 %}...{% endorgcache %}`` (ver
+``templatetags/fragment_cache.py``) guarda el HTML renderizado bajo una clave
+con la organización del request, su "versión de datos" y las variables
+indicadas. Las señales de Device, Zone y Category incrementan la versión de la
+organización, así un fragmento sin cambios se sirve desde la caché sin evaluar
+consultas ni recorrer los bucles de la plantilla, y uno desactualizado
+simplemente deja de leerse (expira con ``FRAGMENT_CACHE_TTL``).
+
+Los aciertos y fallos se cuentan por fragmento en cada proceso y se muestran en
+``admin_dashboard``.
+"""
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+def _version_key(organization_id):
+    return f"fragments:version:{organization_id}"
+
+
+def data_version(organization_id):
+    key = _version_key(organization_id)
+    version = cache.get(key)
+    if version is None:
+        # Si la versión se perdió (expulsión, reinicio) se parte de un valor
+        # nuevo: los fragmentos guardados con la anterior no vuelven a leerse.
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump(organization_id):
+    try:
+        cache.incr(_version_key(organization_id))
+    except ValueError:
+        cache.set(_version_key(organization_id), time.time_ns(), None)
+
+
+def fragment_key(name, organization_id, version, vary_on=()):
+    digest = hashlib.md5(":".join(str(value) for value in vary_on).encode()).hexdigest()
+    return f"fragments:{name}:{organization_id}:{version}:{digest}"
+
+
+class FragmentStats:
+    def __init__(self):
+        self._counts = {}  # nombre -> [aciertos, fallos]
+        self._lock = threading.Lock()
+
+    def record(self, name, hit):
+        with self._lock:
+            counts = self._counts.setdefault(name, [0, 0])
+            counts[0 if hit else 1] += 1
+
+    def snapshot(self):
+        """[{name, hits, misses, hit_rate}, ...] ordenado por nombre."""
+        with self._lock:
+            items = sorted((name, hits, misses) for name, (hits, misses) in self._counts.items())
+        return [
+            {"name": name, "hits": hits, "misses": misses, "hit_rate": hits / (hits + misses)}
+            for name, hits, misses in items
+        ]
+
+    def clear(self):
+        with self._lock:
+            self._counts.clear()
+
+
+stats = FragmentStats()
+
+
+def get_or_render(name, organization_id, vary_on, render, version=None):
+    """HTML del fragmento desde la caché o recién renderizado con ``render()``."""
+    if organization_id is None:
+        return render()  # sin organización no hay datos que compartir
+    if version is None:
+        version = data_version(organization_id)
+    key = fragment_key(name, organization_id, version, vary_on)
+    html = cache.get(key)
+    stats.record(name, hit=html is not None)
+    if html is None:
+        html = render()
+        cache.set(key, html, settings.FRAGMENT_CACHE_TTL)
+    return html
@@ -0,0 +1,260 @@
+"""
+Ingesta masiva de mediciones.
+
+Valida lotes de lecturas (dispositivo, valor, unidad, fecha) en memoria y los
+inserta con ``bulk_create`` por bloques. Las filas inválidas se reportan una a
+una sin rechazar el lote completo.
+"""
+import json
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Device, Measurement
+from .signals import measurements_created
+
+DEFAULT_BATCH_SIZE = 1000
+MAX_ROWS_PER_REQUEST = 50000
+
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+JSON_CONTENT_TYPES = ("application/json",)
+
+_VALUE_QUANTUM = Decimal("0.001")
+_VALUE_LIMIT = Decimal(10) ** 9  # max_digits=12, decimal_places=3
+_UNIT_MAX_LENGTH = Measurement._meta.get_field("unit").max_length
+
+
+class PayloadError(ValueError):
+    """El cuerpo de la petición no se puede interpretar como un lote."""
+
+
+class RowError(ValueError):
+    """Una fila del lote no es válida; ``errors`` es un dict campo -> mensaje."""
+
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+
+def parse_payload(body, content_type):
+    """Devuelve la lista de filas de un cuerpo JSON (array) o NDJSON.
+
+    En NDJSON una línea mal formada no invalida el lote: se deja en su lugar
+    un ``PayloadError`` que luego se reporta como error de esa fila.
+    """
+    if isinstance(body, bytes):
+        try:
+            body = body.decode("utf-8")
+        except UnicodeDecodeError:
+            raise PayloadError("Body must be UTF-8 encoded.")
+
+    if content_type in NDJSON_CONTENT_TYPES:
+        return list(iter_ndjson(body.splitlines()))
+
+    try:
+        data = json.loads(body)
+    except ValueError as e:
+        raise PayloadError(f"Invalid JSON: {e}")
+    if isinstance(data, dict) and isinstance(data.get("measurements"), list):
+        data = data["measurements"]
+    if not isinstance(data, list):
+        raise PayloadError("Expected a JSON array of measurements.")
+    return data
+
+
+def iter_ndjson(lines):
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield PayloadError(f"Invalid JSON line: {e}")
+
+
+class DeviceMap:
+    """Resuelve referencias de dispositivo (id o ``reference``) sin tocar la BD por fila."""
+
+    def __init__(self, pairs=(), default=None):
+        self.by_id = set()
+        self.by_reference = {}
+        self.default = default  # dispositivo implícito (token de dispositivo)
+        for device_id, reference in pairs:
+            self.by_id.add(device_id)
+            if reference:
+                self.by_reference.setdefault(reference, device_id)
+
+    @classmethod
+    def for_organization(cls, organization_id, keys=None, device_id=None):
+        """Carga en una sola consulta los dispositivos de la organización.
+
+        Si se pasan ``keys`` solo se cargan los dispositivos referenciados; con
+        ``device_id`` el mapa se limita a ese dispositivo, que además es el
+        valor por defecto de las filas sin ``device``.
+        """
+        devices = Device.objects.filter(organization_id=organization_id)
+        if device_id is not None:
+            pairs = list(devices.filter(id=device_id).values_list("id", "reference"))
+            return cls(pairs, default=pairs[0][0] if pairs else None)
+        if keys is not None:
+            ids, references = set(), set()
+            for key in keys:
+                if isinstance(key, int) and not isinstance(key, bool):
+                    ids.add(key)
+                elif isinstance(key, str):
+                    references.add(key)
+                    if key.isdigit():
+                        ids.add(int(key))
+            if not ids and not references:
+                return cls()
+            devices = devices.filter(Q(id__in=ids) | Q(reference__in=references))
+        return cls(devices.values_list("id", "reference"))
+
+    def resolve(self, key):
+        if key is None or key == "":
+            return self.default
+        if isinstance(key, bool):
+            return None
+        if isinstance(key, int):
+            return key if key in self.by_id else None
+        if isinstance(key, str):
+            device_id = self.by_reference.get(key)
+            if device_id is None and key.isdigit() and int(key) in self.by_id:
+                device_id = int(key)
+            return device_id
+        return None
+
+
+def parse_value(raw):
+    if isinstance(raw, bool) or raw is None or raw == "":
+        raise ValueError("A numeric value is required.")
+    try:
+        value = Decimal(str(raw))
+    except InvalidOperation:
+        raise ValueError("Enter a number.")
+    if not value.is_finite():
+        raise ValueError("Enter a finite number.")
+    # Se acota antes de redondear: quantize lanza InvalidOperation con exponentes grandes ("1e30")
+    if abs(value) < _VALUE_LIMIT:
+        value = value.quantize(_VALUE_QUANTUM)
+    if abs(value) >= _VALUE_LIMIT:
+        raise ValueError("Ensure there are no more than 9 digits before the decimal point.")
+    return value
+
+
+def parse_date(raw, default=None):
+    if raw is None or raw == "":
+        return default or timezone.now()
+    if isinstance(raw, (int, float)) and not isinstance(raw, bool):
+        try:
+            return datetime.fromtimestamp(raw, tz=dt_timezone.utc)
+        except (OverflowError, OSError, ValueError):
+            raise ValueError("Timestamp out of range.")
+    if isinstance(raw, datetime):
+        value = raw
+    elif isinstance(raw, str):
+        try:
+            value = parse_datetime(raw.strip())
+        except ValueError:
+            value = None
+        if value is None:
+            raise ValueError("Enter a valid ISO 8601 date/time.")
+    else:
+        raise ValueError("Enter a valid ISO 8601 date/time.")
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value
+
+
+def build_measurement(row, devices, organization_id, now=None):
+    """Valida una fila y devuelve un ``Measurement`` sin guardar.
+
+    Lanza ``RowError`` con los errores por campo.
+    """
+    if isinstance(row, PayloadError):
+        raise RowError({"__all__": str(row)})
+    if not isinstance(row, dict):
+        raise RowError({"__all__": "Each measurement must be an object."})
+
+    errors = {}
+    device_id = devices.resolve(row.get("device"))
+    if device_id is None:
+        errors["device"] = "Unknown device." if row.get("device") not in (None, "") else "This field is required."
+
+    try:
+        value = parse_value(row.get("value"))
+    except ValueError as e:
+        errors["value"] = str(e)
+
+    unit = row.get("unit") or ""
+    if not isinstance(unit, str):
+        errors["unit"] = "Must be a string."
+    elif len(unit) > _UNIT_MAX_LENGTH:
+        errors["unit"] = f"Ensure this value has at most {_UNIT_MAX_LENGTH} characters."
+
+    try:
+        date = parse_date(row.get("date"), default=now)
+    except ValueError as e:
+        errors["date"] = str(e)
+
+    if errors:
+        raise RowError(errors)
+    return Measurement(device_id=device_id, value=value, unit=unit, date=date, organization_id=organization_id)
+
+
+def write_measurements(measurements, batch_size=DEFAULT_BATCH_SIZE):
+    """Inserta mediciones ya validadas en bloques dentro de una transacción.
+
+    Envía ``measurements_created`` en la misma transacción para que los datos
+    derivados (rollups) queden consistentes con las filas insertadas.
+    """
+    if not measurements:
+        return 0
+    with transaction.atomic():
+        Measurement.objects.bulk_create(measurements, batch_size=batch_size)
+        measurements_created.send(sender=Measurement, measurements=measurements)
+    return len(measurements)
+
+
+def validate_rows(rows, organization_id, devices=None, device_id=None):
+    """Valida un lote; devuelve (mediciones válidas, errores por índice de fila)."""
+    if devices is None:
+        keys = [row.get("device") for row in rows if isinstance(row, dict)]
+        devices = DeviceMap.for_organization(organization_id, keys=keys, device_id=device_id)
+
+    now = timezone.now()
+    measurements, errors = [], []
+    for index, row in enumerate(rows):
+        try:
+            measurements.append(build_measurement(row, devices, organization_id, now=now))
+        except RowError as e:
+            errors.append({"index": index, "errors": e.errors})
+    return measurements, errors
+
+
+def ingest_rows(rows, organization_id, device_id=None, batch_size=DEFAULT_BATCH_SIZE, buffer=None, timeout=0):
+    """Valida y guarda un lote; devuelve un resumen serializable a JSON.
+
+    ``device_id`` limita el lote a un dispositivo (token de dispositivo). Con
+    ``buffer`` (write-behind) las filas válidas se encolan en vez de
+    insertarse; si no hay espacio se propaga ``BufferFull``.
+    """
+    measurements, errors = validate_rows(rows, organization_id, device_id=device_id)
+    created = queued = 0
+    if buffer is not None:
+        buffer.put_many(measurements, timeout=timeout)
+        queued = len(measurements)
+    else:
+        created = write_measurements(measurements, batch_size=batch_size)
+    return {
+        "received": len(rows),
+        "created": created,
+        "queued": queued,
+        "rejected": len(errors),
+        "errors": errors,
+    }
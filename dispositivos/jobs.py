@@ -0,0 +1,207 @@
+"""
+Exportaciones en segundo plano.
+
+La vista solo crea un ``ExportJob`` (o reutiliza uno idéntico sobre los mismos
+datos); ``manage.py run_export_jobs`` los toma respetando
+``EXPORT_MAX_CONCURRENT``, genera el archivo por bloques informando el
+progreso y borra los artefactos vencidos.
+"""
+import hashlib
+import json
+import logging
+import tempfile
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files import File
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .exports import (
+    DEVICE_HEADERS, MEASUREMENT_HEADERS, STREAM_FIELDS,
+    device_queryset, iter_device_export_rows, iter_measurement_export_rows,
+    iter_measurement_stream_rows, measurement_device_ids, parse_filters, write_csv, write_xlsx,
+)
+from .models import ExportJob, Measurement
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_EVERY = 5000  # filas entre actualizaciones de progreso
+FILTER_PARAMS = ("start", "end", "category", "zone", "search")
+
+SOURCES = {
+    ("measurements", "xlsx"): ("Measurements", MEASUREMENT_HEADERS, iter_measurement_export_rows),
+    ("measurements", "csv"): ("Measurements", STREAM_FIELDS, iter_measurement_stream_rows),
+    ("devices", "xlsx"): ("Devices", DEVICE_HEADERS, iter_device_export_rows),
+    ("devices", "csv"): ("Devices", DEVICE_HEADERS, iter_device_export_rows),
+}
+
+
+def normalize_params(params):
+    """Filtros no vacíos de un QueryDict/dict, en una forma estable para el fingerprint."""
+    normalized = {name: params.get(name) for name in FILTER_PARAMS if params.get(name)}
+    devices = params.getlist("device") if hasattr(params, "getlist") else params.get("device") or []
+    devices = sorted({str(device) for device in devices if device != ""})
+    if devices:
+        normalized["device"] = devices
+    return normalized
+
+
+def _version_key(organization_id, kind):
+    return f"exports:version:{organization_id}:{kind}"
+
+
+def data_version(organization_id, kind):
+    """Versión de los datos exportables; las señales la incrementan cuando cambian (ver signals.py)."""
+    key = _version_key(organization_id, kind)
+    version = cache.get(key)
+    if version is None:
+        # Perdida (expulsión, reinicio): un valor nuevo no coincide con jobs anteriores
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_data_version(organization_ids, kind):
+    for organization_id in set(organization_ids):
+        if organization_id is None:
+            continue
+        try:
+            cache.incr(_version_key(organization_id, kind))
+        except ValueError:
+            cache.set(_version_key(organization_id, kind), time.time_ns(), None)
+
+
+def fingerprint(organization_id, kind, fmt, params):
+    payload = json.dumps([kind, fmt, params, data_version(organization_id, kind)], sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def request_export(organization_id, kind, fmt, params, user=None):
+    """Crea un job o devuelve uno equivalente en curso o aún vigente; devuelve (job, created).
+
+    Lanza ``ExportFilterError`` si los filtros no son válidos.
+    """
+    params = normalize_params(params)
+    parse_filters(params)
+    key = fingerprint(organization_id, kind, fmt, params)
+    existing = (
+        ExportJob.objects.filter(organization_id=organization_id, fingerprint=key)
+        .filter(Q(state__in=[ExportJob.PENDING, ExportJob.RUNNING]) | Q(state=ExportJob.DONE, expires_at__gt=timezone.now()))
+        .first()
+    )
+    if existing is not None:
+        return existing, False
+    job = ExportJob.objects.create(
+        organization_id=organization_id, requested_by=user, kind=kind, format=fmt, params=params, fingerprint=key,
+    )
+    return job, True
+
+
+def _used_slots():
+    return set(ExportJob.objects.filter(slot__isnull=False).values_list("slot", flat=True))
+
+
+def claim_next_job(max_concurrent=None):
+    """Marca como RUNNING el job pendiente más antiguo, si hay cupo.
+
+    Cada job en curso ocupa un ``slot`` único entre ``0`` y ``max_concurrent - 1``;
+    si dos workers eligen el mismo a la vez, la restricción UNIQUE rechaza al
+    segundo, así el límite se respeta sin bloquear la tabla.
+    """
+    max_concurrent = max_concurrent or settings.EXPORT_MAX_CONCURRENT
+    with transaction.atomic():
+        used = _used_slots()
+        free = [slot for slot in range(max_concurrent) if slot not in used]
+        if not free:
+            return None
+        job = (
+            ExportJob.objects.select_for_update(skip_locked=True)
+            .filter(state=ExportJob.PENDING)
+            .order_by("created_at", "id")
+            .first()
+        )
+        if job is None:
+            return None
+        job.state = ExportJob.RUNNING
+        job.started_at = timezone.now()
+        job.slot = free[0]
+        try:
+            with transaction.atomic():
+                job.save(update_fields=["state", "started_at", "slot"])
+        except IntegrityError:
+            return None  # otro worker tomó el cupo; se reintenta en la próxima vuelta
+    return job
+
+
+def _estimate_total(job, filters):
+    if job.kind == "devices":
+        return device_queryset(job.organization_id, filters).count()
+    # Solo filas vivas: las archivadas no se cuentan, el progreso se limita a 99%
+    measurements = Measurement.objects.filter(organization_id=job.organization_id)
+    if filters.start:
+        measurements = measurements.filter(date__gte=filters.start)
+    if filters.end:
+        measurements = measurements.filter(date__lt=filters.end)
+    device_ids = measurement_device_ids(job.organization_id, filters)
+    if device_ids is not None:
+        measurements = measurements.filter(device_id__in=device_ids)
+    return measurements.count()
+
+
+def _track_progress(rows, job_id):
+    for count, row in enumerate(rows, 1):
+        yield row
+        if count % PROGRESS_EVERY == 0:
+            ExportJob.objects.filter(pk=job_id).update(rows_written=count)
+
+
+def run_job(job):
+    """Genera el archivo del job; los errores quedan registrados en el job."""
+    ttl = timedelta(hours=settings.EXPORT_JOB_TTL_HOURS)
+    try:
+        filters = parse_filters(job.params)
+        title, headers, source = SOURCES[(job.kind, job.format)]
+        job.total_rows = _estimate_total(job, filters)
+        job.save(update_fields=["total_rows"])
+        rows = _track_progress(source(job.organization_id, filters), job.pk)
+        with tempfile.TemporaryFile() as fh:
+            if job.format == "xlsx":
+                count = write_xlsx(fh, title, headers, rows)
+            else:
+                count = write_csv(fh, headers, rows)
+            fh.seek(0)
+            job.file.save(job.filename, File(fh), save=False)
+        job.state = ExportJob.DONE
+        job.rows_written = count
+    except Exception:
+        logger.exception("export job %s failed", job.pk)
+        job.state = ExportJob.FAILED
+        job.error = "Export failed. Please try again or contact support."
+    job.slot = None
+    job.finished_at = timezone.now()
+    job.expires_at = job.finished_at + ttl
+    job.save()
+    return job
+
+
+def cleanup_jobs(now=None):
+    """Marca como fallidos los jobs colgados y borra los vencidos con su archivo."""
+    now = now or timezone.now()
+    ExportJob.objects.filter(
+        state=ExportJob.RUNNING,
+        started_at__lt=now - timedelta(minutes=settings.EXPORT_JOB_TIMEOUT_MINUTES),
+    ).update(
+        state=ExportJob.FAILED, error="Timed out.", slot=None, finished_at=now,
+        expires_at=now + timedelta(hours=settings.EXPORT_JOB_TTL_HOURS),
+    )
+    removed = 0
+    for job in ExportJob.objects.filter(expires_at__lt=now).iterator():
+        if job.file:
+            job.file.delete(save=False)
+        job.delete()
+        removed += 1
+    return removed
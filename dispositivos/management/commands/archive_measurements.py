@@ -0,0 +1,50 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Min
+from django.utils import timezone
+
+from dispositivos import archive
+from dispositivos.models import Measurement
+
+
+class Command(BaseCommand):
+    help = (
+        "Mueve las mediciones más antiguas que --older-than-days a segmentos comprimidos "
+        "por organización y mes, y luego las borra de la BD por lotes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than-days", type=int, default=settings.MEASUREMENT_ARCHIVE_AFTER_DAYS,
+            help="Antigüedad mínima de las lecturas a archivar",
+        )
+        parser.add_argument("--organization", type=int, help="Solo esta organización")
+        parser.add_argument("--batch-size", type=int, default=5000, help="Filas por DELETE")
+        parser.add_argument("--dry-run", action="store_true", help="Solo mostrar qué se archivaría")
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options["older_than_days"])
+        pending = Measurement.objects.filter(date__lt=cutoff, organization__isnull=False)
+        if options["organization"]:
+            pending = pending.filter(organization_id=options["organization"])
+        scopes = pending.values("organization_id").annotate(first=Min("date"), total=Count("id"))
+
+        total = 0
+        for scope in scopes.order_by("organization_id"):
+            organization_id = scope["organization_id"]
+            if options["dry_run"]:
+                self.stdout.write(
+                    f"org {organization_id}: {scope['total']} measurements since {scope['first']:%Y-%m-%d}"
+                )
+                continue
+            month = archive.month_start(scope["first"])
+            while month < cutoff:
+                moved = archive.archive_month(organization_id, month, cutoff, options["batch_size"])
+                if moved:
+                    self.stdout.write(f"org {organization_id} {month:%Y-%m}: {moved} measurements archived")
+                total += moved
+                month = archive.next_month(month)
+
+        self.stdout.write(self.style.SUCCESS(f"{total} measurements archived (cutoff {cutoff:%Y-%m-%d})"))
@@ -0,0 +1,81 @@
+import math
+import statistics
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from dispositivos import analytics
+from dispositivos.models import Measurement
+from usuarios.models import Organization
+
+
+def naive_stats(organization_id, start, end):
+    """Enfoque de referencia: instancias de Measurement, Decimal y bucles de Python."""
+    readings = defaultdict(list)
+    measurements = Measurement.objects.filter(organization_id=organization_id, date__gte=start, date__lt=end)
+    for measurement in measurements.order_by("date"):
+        readings[measurement.device_id].append((measurement.date, measurement.value))
+    result = {}
+    for device_id, rows in readings.items():
+        values = sorted(value for _, value in rows)
+        hours = (rows[-1][0] - rows[0][0]).total_seconds() / 3600
+        result[device_id] = {
+            "count": len(values),
+            "mean": float(statistics.fmean(values)),
+            "std": float(statistics.pstdev(values)),
+            "min": float(values[0]),
+            "max": float(values[-1]),
+            "p95": float(statistics.quantiles(values, n=100, method="inclusive")[94]) if len(values) > 1 else float(values[0]),
+            "rate_per_hour": float(rows[-1][1] - rows[0][1]) / hours if hours else None,
+        }
+    return result
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara el cálculo de estadísticas por dispositivo con NumPy (dispositivos.analytics) "
+        "contra el enfoque ORM con bucles de Python, y verifica que den lo mismo."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--organization", type=int, required=True, help="ID de la organización")
+        parser.add_argument("--days", type=int, default=30, help="Ventana hacia atrás desde ahora")
+        parser.add_argument("--repeat", type=int, default=3, help="Repeticiones (se informa la mejor)")
+
+    def _best(self, func, repeat):
+        best, result = math.inf, None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = func()
+            best = min(best, time.perf_counter() - started)
+        return best, result
+
+    def handle(self, *args, **options):
+        if not Organization.objects.filter(pk=options["organization"]).exists():
+            raise CommandError(f"Organization {options['organization']} does not exist")
+        end = timezone.now()
+        start = end - timedelta(days=options["days"])
+        organization_id = options["organization"]
+
+        naive_time, naive = self._best(lambda: naive_stats(organization_id, start, end), options["repeat"])
+        fast_time, fast = self._best(lambda: analytics.device_stats(organization_id, start, end), options["repeat"])
+
+        # Solo lecturas vivas en la referencia: se compara sobre los mismos dispositivos
+        mismatches = [
+            device_id for device_id, expected in naive.items()
+            if any(
+                not math.isclose(expected[key], fast[device_id][key], rel_tol=1e-6, abs_tol=1e-6)
+                for key in ("mean", "std", "min", "max", "p95")
+            )
+        ]
+        rows = sum(stats["count"] for stats in fast.values())
+        self.stdout.write(f"{len(fast)} devices, {rows} measurements, {options['days']} days")
+        self.stdout.write(f"ORM + Python: {naive_time * 1000:.1f} ms")
+        self.stdout.write(f"NumPy:        {fast_time * 1000:.1f} ms")
+        if fast_time:
+            self.stdout.write(self.style.SUCCESS(f"speedup x{naive_time / fast_time:.1f}"))
+        if mismatches:
+            self.stdout.write(self.style.WARNING(f"results differ for devices {mismatches}"))
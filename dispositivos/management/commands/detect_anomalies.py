@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from dispositivos import anomalies
+from dispositivos.suppression import suppressor
+from usuarios.models import Organization
+
+
+class Command(BaseCommand):
+    help = (
+        "Evalúa las mediciones nuevas desde la última corrida (z-score móvil e IQR por "
+        "dispositivo) y crea alertas para las anómalas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--organization", type=int, action="append", help="ID de la organización (repetible)")
+        parser.add_argument("--dry-run", action="store_true", help="Muestra el resultado sin crear alertas")
+
+    def handle(self, *args, **options):
+        organizations = Organization.objects.order_by("id")
+        if options["organization"]:
+            organizations = organizations.filter(id__in=options["organization"])
+        for organization_id in organizations.values_list("id", flat=True):
+            result = anomalies.detect(organization_id, dry_run=options["dry_run"])
+            self.stdout.write(self.style.SUCCESS(
+                f"Organization {organization_id}: {result.examined} readings examined, "
+                f"{result.anomalies} anomalous, {len(result.alerts)} alerts"
+            ))
+        suppressor.flush()
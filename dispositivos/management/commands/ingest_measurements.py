@@ -0,0 +1,145 @@
+import csv
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dispositivos.ingest import (
+    DeviceMap, RowError, PayloadError, build_measurement, write_measurements,
+)
+from usuarios.models import Organization
+
+
+class Command(BaseCommand):
+    help = (
+        "Carga mediciones históricas desde un archivo CSV o NDJSON en streaming. "
+        "Inserta por bloques dentro de transacciones y reporta el offset en bytes "
+        "confirmado, desde el que se puede reanudar con --offset o --checkpoint."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Archivo CSV (cabecera device,value,unit,date) o NDJSON")
+        parser.add_argument("--organization", type=int, required=True, help="ID de la organización")
+        parser.add_argument("--format", choices=["csv", "ndjson"], help="Por defecto se deduce de la extensión")
+        parser.add_argument("--chunk-size", type=int, default=5000, help="Filas por transacción")
+        parser.add_argument("--offset", type=int, help="Reanudar desde este offset en bytes")
+        parser.add_argument(
+            "--checkpoint",
+            help="Archivo donde se guarda el último offset confirmado; si existe se reanuda desde él",
+        )
+        parser.add_argument("--max-errors", type=int, default=20, help="Errores de fila a mostrar")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        if not os.path.exists(path):
+            raise CommandError(f"No existe el archivo {path}")
+        try:
+            organization = Organization.objects.get(pk=options["organization"])
+        except Organization.DoesNotExist:
+            raise CommandError(f"No existe la organización {options['organization']}")
+
+        fmt = options["format"] or ("csv" if path.lower().endswith(".csv") else "ndjson")
+        chunk_size = max(1, options["chunk_size"])
+        checkpoint = options["checkpoint"]
+        offset = options["offset"]
+        if offset is None and checkpoint and os.path.exists(checkpoint):
+            with open(checkpoint) as fh:
+                offset = int(fh.read().strip() or 0)
+
+        # Mapa en memoria: una sola consulta para todo el archivo
+        devices = DeviceMap.for_organization(organization.pk)
+
+        self.max_errors = options["max_errors"]
+        self.errors_shown = 0
+        total_size = os.path.getsize(path)
+        created = rejected = 0
+        started = time.monotonic()
+
+        with open(path, "rb") as fh:
+            header = None
+            if fmt == "csv":
+                header = self._read_header(fh)
+            if offset:
+                fh.seek(max(offset, fh.tell()))
+            position = fh.tell()
+            self.stdout.write(f"Ingesting {path} ({fmt}) from offset {position}")
+
+            while True:
+                lines, end = self._read_chunk(fh, chunk_size)
+                if not lines:
+                    break
+                rows = self._parse_lines(lines, header)
+                measurements = []
+                for line_offset, row in rows:
+                    try:
+                        measurements.append(build_measurement(row, devices, organization.pk))
+                    except RowError as e:
+                        rejected += 1
+                        self._report_error(line_offset, e.errors)
+                created += write_measurements(measurements)
+                position = end
+                if checkpoint:
+                    self._save_checkpoint(checkpoint, position)
+
+                elapsed = time.monotonic() - started
+                rate = created / elapsed if elapsed else 0
+                pct = 100 * position / total_size if total_size else 100
+                self.stdout.write(
+                    f"offset={position} ({pct:.1f}%) created={created} rejected={rejected} "
+                    f"rows/s={rate:,.0f}"
+                )
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {created} measurements created, {rejected} rejected in {elapsed:.1f}s"
+        ))
+
+    def _read_header(self, fh):
+        line = fh.readline().decode("utf-8-sig").strip()
+        header = [name.strip().lower() for name in next(csv.reader([line]))] if line else []
+        missing = {"device", "value"} - set(header)
+        if missing:
+            raise CommandError(f"Faltan columnas en la cabecera CSV: {', '.join(sorted(missing))}")
+        return header
+
+    def _read_chunk(self, fh, chunk_size):
+        """Lee hasta ``chunk_size`` líneas; devuelve [(offset, línea)] y el offset final."""
+        lines = []
+        while len(lines) < chunk_size:
+            start = fh.tell()
+            raw = fh.readline()
+            if not raw:
+                break
+            if raw.strip():
+                lines.append((start, raw))
+        return lines, fh.tell()
+
+    def _parse_lines(self, lines, header):
+        rows = []
+        if header is None:
+            for line_offset, raw in lines:
+                try:
+                    row = json.loads(raw)
+                except ValueError as e:
+                    row = PayloadError(f"Invalid JSON line: {e}")
+                rows.append((line_offset, row))
+            return rows
+
+        decoded = [raw.decode("utf-8", errors="replace") for _, raw in lines]
+        # Las filas CSV no pueden contener saltos de línea entre comillas
+        for (line_offset, _), fields in zip(lines, csv.reader(decoded)):
+            rows.append((line_offset, dict(zip(header, fields))))
+        return rows
+
+    def _report_error(self, line_offset, errors):
+        if self.errors_shown >= self.max_errors:
+            return
+        self.errors_shown += 1
+        self.stderr.write(f"offset={line_offset}: {errors}")
+
+    def _save_checkpoint(self, checkpoint, position):
+        tmp = f"{checkpoint}.tmp"
+        with open(tmp, "w") as fh:
+            fh.write(str(position))
+        os.replace(tmp, checkpoint)
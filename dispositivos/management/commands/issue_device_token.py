@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from dispositivos.models import Device, DeviceToken
+from usuarios.models import Organization
+
+
+class Command(BaseCommand):
+    help = (
+        "Emite un token de API para un dispositivo o, sin --device, para un gateway "
+        "de toda la organización. La clave se muestra una sola vez."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--organization", type=int, required=True, help="ID de la organización")
+        parser.add_argument("--device", type=int, help="ID del dispositivo")
+        parser.add_argument("--name", default="", help="Nombre descriptivo del token")
+
+    def handle(self, *args, **options):
+        try:
+            organization = Organization.objects.get(pk=options["organization"])
+        except Organization.DoesNotExist:
+            raise CommandError(f"No existe la organización {options['organization']}")
+
+        device = None
+        if options["device"] is not None:
+            try:
+                device = Device.objects.get(pk=options["device"], organization=organization)
+            except Device.DoesNotExist:
+                raise CommandError(f"No existe el dispositivo {options['device']} en esa organización")
+
+        token, key = DeviceToken.issue(organization, device=device, name=options["name"])
+        self.stdout.write(self.style.SUCCESS(f"Token {token.pk} ({token.prefix}…) emitido"))
+        self.stdout.write(key)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from dispositivos import alerts
+
+
+class Command(BaseCommand):
+    help = "Recalcula los contadores de alertas no leídas, p. ej. tras modificar alertas con update()."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--organization", type=int, help="ID de la organización")
+
+    def handle(self, *args, **options):
+        alerts.rebuild_counters(options["organization"])
+        self.stdout.write(self.style.SUCCESS("Alert counters rebuilt"))
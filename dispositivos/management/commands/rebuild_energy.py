@@ -0,0 +1,33 @@
+from datetime import datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from dispositivos import energy
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula el consumo por hora (kWh) desde las lecturas de energía/potencia, "
+        "p. ej. tras un backfill o lecturas atrasadas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--organization", type=int, help="ID de la organización")
+        parser.add_argument("--device", type=int, action="append", help="ID de dispositivo (repetible)")
+        parser.add_argument("--since", help="Fecha inicial YYYY-MM-DD (por defecto todo el historial)")
+
+    def handle(self, *args, **options):
+        start = None
+        if options["since"]:
+            day = parse_date(options["since"])
+            if day is None:
+                raise CommandError("--since must be YYYY-MM-DD")
+            start = timezone.make_aware(datetime.combine(day, time.min))
+        written = energy.rebuild(
+            device_ids=options["device"],
+            organization_id=options["organization"],
+            start=start,
+        )
+        self.stdout.write(self.style.SUCCESS(f"{written} hourly energy rows written"))
@@ -0,0 +1,38 @@
+from datetime import datetime, time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from dispositivos import rollups
+
+
+class Command(BaseCommand):
+    help = "Recalcula los rollups (1m/1h/1d) desde las lecturas (BD y archivo), p. ej. tras un backfill."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--organization", type=int, help="ID de la organización")
+        parser.add_argument("--device", type=int, action="append", help="ID de dispositivo (repetible)")
+        parser.add_argument("--since", help="Fecha inicial YYYY-MM-DD (inclusive)")
+        parser.add_argument("--until", help="Fecha final YYYY-MM-DD (inclusive)")
+
+    def handle(self, *args, **options):
+        start = self._parse_day(options["since"])
+        end = self._parse_day(options["until"])
+        if end is not None:
+            end = end + timedelta(days=1)
+        written = rollups.rebuild(
+            device_ids=options["device"],
+            organization_id=options["organization"],
+            start=start,
+            end=end,
+        )
+        self.stdout.write(self.style.SUCCESS(f"{written} rollups written"))
+
+    def _parse_day(self, value):
+        if not value:
+            return None
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f"Fecha inválida: {value}")
+        return timezone.make_aware(datetime.combine(day, time.min))
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from dispositivos import jobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Procesa las exportaciones pendientes de a una, respetando EXPORT_MAX_CONCURRENT "
+        "entre todos los workers, y borra los archivos vencidos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Procesar lo pendiente y salir")
+        parser.add_argument("--poll", type=float, default=2.0, help="Segundos entre consultas sin trabajo")
+        parser.add_argument("--max-concurrent", type=int, help="Cupo de jobs en curso (por defecto el de settings)")
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            removed = jobs.cleanup_jobs()
+            if removed:
+                self.stdout.write(f"{removed} expired exports removed")
+            job = jobs.claim_next_job(options["max_concurrent"])
+            if job is not None:
+                started = time.monotonic()
+                job = jobs.run_job(job)
+                self.stdout.write(
+                    f"export #{job.pk} {job.kind}.{job.format}: {job.state}, "
+                    f"{job.rows_written} rows in {time.monotonic() - started:.1f}s"
+                )
+                continue
+            if options["once"]:
+                break
+            time.sleep(options["poll"])
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.6 on 2026-10-18 14:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dispositivos', '0004_devicetoken'),
+        ('usuarios', '0003_userprofile_profile_image'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MeasurementRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(choices=[('1m', '1 minuto'), ('1h', '1 hora'), ('1d', '1 día')], max_length=2)),
+                ('bucket', models.DateTimeField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('sum', models.FloatField(default=0)),
+                ('min', models.FloatField()),
+                ('max', models.FloatField()),
+                ('last', models.FloatField()),
+                ('last_date', models.DateTimeField()),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='dispositivos.device')),
+                ('organization', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='usuarios.organization')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('device', 'resolution', 'bucket'), name='unique_rollup_bucket')],
+            },
+        ),
+    ]
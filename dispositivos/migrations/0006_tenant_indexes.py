@@ -0,0 +1,46 @@
+# Generated by Django 5.2.6 on 2026-10-18 14:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dispositivos', '0005_measurementrollup'),
+        ('usuarios', '0003_userprofile_profile_image'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='alert',
+            index=models.Index(fields=['organization', 'created_at', 'level'], name='alert_org_created_level_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='alert',
+            index=models.Index(fields=['organization', 'deleted_at'], name='alert_org_deleted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(fields=['organization', 'deleted_at'], name='category_org_deleted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='device',
+            index=models.Index(fields=['organization', 'deleted_at'], name='device_org_deleted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='measurement',
+            index=models.Index(fields=['organization', 'device', 'date'], name='meas_org_device_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='measurement',
+            index=models.Index(fields=['organization', 'date'], name='meas_org_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sensor',
+            index=models.Index(fields=['organization', 'deleted_at'], name='sensor_org_deleted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='zone',
+            index=models.Index(fields=['organization', 'deleted_at'], name='zone_org_deleted_idx'),
+        ),
+    ]
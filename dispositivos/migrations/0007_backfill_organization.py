@@ -0,0 +1,34 @@
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+BATCH_SIZE = 10000
+
+
+def backfill_organization(apps, schema_editor):
+    """Copia la organización del dispositivo a las filas que no la tienen, por lotes de pk."""
+    Device = apps.get_model("dispositivos", "Device")
+    device_org = Subquery(Device.objects.filter(pk=OuterRef("device_id")).values("organization_id")[:1])
+
+    for model_name in ("Measurement", "Alert", "Sensor", "MeasurementRollup"):
+        model = apps.get_model("dispositivos", model_name)
+        pending = model.objects.filter(organization__isnull=True, device__organization__isnull=False)
+        last_pk = 0
+        while True:
+            pks = list(pending.filter(pk__gt=last_pk).order_by("pk").values_list("pk", flat=True)[:BATCH_SIZE])
+            if not pks:
+                break
+            model.objects.filter(pk__in=pks).update(organization=device_org)
+            last_pk = pks[-1]
+
+
+class Migration(migrations.Migration):
+    # Cada lote se confirma por separado para no bloquear tablas grandes en una sola transacción
+    atomic = False
+
+    dependencies = [
+        ('dispositivos', '0006_tenant_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_organization, migrations.RunPython.noop),
+    ]
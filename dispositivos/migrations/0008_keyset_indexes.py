@@ -0,0 +1,30 @@
+# Generated by Django 5.2.6 on 2026-10-18 14:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dispositivos', '0007_backfill_organization'),
+        ('usuarios', '0003_userprofile_profile_image'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='measurement',
+            name='meas_org_date_idx',
+        ),
+        migrations.AddIndex(
+            model_name='device',
+            index=models.Index(fields=['organization', 'name', 'id'], name='device_org_name_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='device',
+            index=models.Index(fields=['organization', 'created_at', 'id'], name='device_org_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='measurement',
+            index=models.Index(fields=['organization', 'date', 'id'], name='meas_org_date_id_idx'),
+        ),
+    ]
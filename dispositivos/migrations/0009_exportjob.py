@@ -0,0 +1,43 @@
+# Generated by Django 5.2.6 on 2026-10-18 14:28
+
+import dispositivos.models
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dispositivos', '0008_keyset_indexes'),
+        ('usuarios', '0003_userprofile_profile_image'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('measurements', 'Measurements'), ('devices', 'Devices')], max_length=20)),
+                ('format', models.CharField(choices=[('xlsx', 'Excel'), ('csv', 'CSV')], max_length=10)),
+                ('params', models.JSONField(blank=True, default=dict)),
+                ('fingerprint', models.CharField(max_length=64)),
+                ('state', models.CharField(choices=[('PENDING', 'Pendiente'), ('RUNNING', 'En curso'), ('DONE', 'Lista'), ('FAILED', 'Fallida')], default='PENDING', max_length=10)),
+                ('rows_written', models.PositiveIntegerField(default=0)),
+                ('total_rows', models.PositiveIntegerField(blank=True, null=True)),
+                ('file', models.FileField(blank=True, storage=dispositivos.models.export_storage, upload_to=dispositivos.models.export_upload_to)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('expires_at', models.DateTimeField(blank=True, null=True)),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='usuarios.organization')),
+                ('requested_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ('-created_at',),
+                'indexes': [models.Index(fields=['state', 'created_at'], name='exportjob_state_created_idx'), models.Index(fields=['organization', 'fingerprint'], name='exportjob_org_fingerprint_idx')],
+            },
+        ),
+    ]
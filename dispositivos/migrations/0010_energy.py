@@ -0,0 +1,40 @@
+# Generated by Django 5.2.6 on 2026-10-18 14:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dispositivos', '0009_exportjob'),
+        ('usuarios', '0003_userprofile_profile_image'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EnergyCursor',
+            fields=[
+                ('device', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='energy_cursor', serialize=False, to='dispositivos.device')),
+                ('kind', models.CharField(blank=True, max_length=10)),
+                ('last_date', models.DateTimeField(blank=True, null=True)),
+                ('last_value', models.FloatField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='EnergyConsumption',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('kwh', models.FloatField(default=0)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='dispositivos.category')),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='energy', to='dispositivos.device')),
+                ('organization', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='usuarios.organization')),
+                ('zone', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='dispositivos.zone')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['organization', 'bucket'], name='energy_org_bucket_idx'), models.Index(fields=['zone', 'bucket'], name='energy_zone_bucket_idx'), models.Index(fields=['category', 'bucket'], name='energy_category_bucket_idx')],
+                'constraints': [models.UniqueConstraint(fields=('device', 'bucket'), name='unique_energy_bucket')],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.6 on 2026-10-18 14:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dispositivos', '0011_anomalywatermark'),
+        ('usuarios', '0003_userprofile_profile_image'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlertRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('ACTIVE', 'Active'), ('INACTIVE', 'Inactive')], default='ACTIVE', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('deleted_at', models.DateTimeField(blank=True, null=True)),
+                ('name', models.CharField(max_length=100)),
+                ('kind', models.CharField(choices=[('THRESHOLD', 'Umbral'), ('RATE', 'Tasa de cambio'), ('SUSTAINED', 'Sostenido')], default='THRESHOLD', max_length=10)),
+                ('operator', models.CharField(choices=[('gt', 'Mayor que'), ('lt', 'Menor que')], default='gt', max_length=2)),
+                ('threshold', models.FloatField()),
+                ('duration_seconds', models.PositiveIntegerField(default=0)),
+                ('unit', models.CharField(blank=True, help_text='Vacío: cualquier unidad', max_length=20)),
+                ('level', models.CharField(choices=[('GRAVE', 'Grave'), ('ALTA', 'Alta'), ('MEDIA', 'Media')], default='MEDIA', max_length=10)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='alert_rules', to='dispositivos.category')),
+                ('device', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='alert_rules', to='dispositivos.device')),
+                ('organization', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='usuarios.organization')),
+                ('zone', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='alert_rules', to='dispositivos.zone')),
+            ],
+            options={
+                'ordering': ('-created_at',),
+                'abstract': False,
+                'constraints': [models.CheckConstraint(condition=models.Q(models.Q(('category__isnull', True), ('device__isnull', False), ('zone__isnull', True)), models.Q(('category__isnull', False), ('device__isnull', True), ('zone__isnull', True)), models.Q(('category__isnull', True), ('device__isnull', True), ('zone__isnull', False)), _connector='OR'), name='alert_rule_single_scope')],
+            },
+        ),
+    ]
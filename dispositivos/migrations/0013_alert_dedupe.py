@@ -0,0 +1,34 @@
+# Generated by Django 5.2.6 on 2026-10-18 14:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dispositivos', '0012_alertrule'),
+        ('usuarios', '0003_userprofile_profile_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='alert',
+            name='last_seen_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='alert',
+            name='occurrences',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='alert',
+            name='rule',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='alerts', to='dispositivos.alertrule'),
+        ),
+        migrations.AddIndex(
+            model_name='alert',
+            index=models.Index(fields=['device', 'last_seen_at'], name='alert_device_seen_idx'),
+        ),
+    ]
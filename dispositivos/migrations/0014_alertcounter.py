@@ -0,0 +1,51 @@
+# Generated by Django 5.2.6 on 2026-10-18 14:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_unread_alerts(apps, schema_editor):
+    Alert = apps.get_model('dispositivos', 'Alert')
+    AlertCounter = apps.get_model('dispositivos', 'AlertCounter')
+    rows = (
+        Alert.objects.filter(read=False, deleted_at__isnull=True, organization__isnull=False)
+        .order_by().values('organization_id', 'level').annotate(total=Count('id'))
+    )
+    AlertCounter.objects.bulk_create([
+        AlertCounter(organization_id=row['organization_id'], level=row['level'], unread=row['total'])
+        for row in rows
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dispositivos', '0013_alert_dedupe'),
+        ('usuarios', '0003_userprofile_profile_image'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlertCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('level', models.CharField(max_length=10)),
+                ('unread', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='alert',
+            index=models.Index(fields=['organization', 'read', 'created_at'], name='alert_org_read_created_idx'),
+        ),
+        migrations.AddField(
+            model_name='alertcounter',
+            name='organization',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alert_counters', to='usuarios.organization'),
+        ),
+        migrations.AddConstraint(
+            model_name='alertcounter',
+            constraint=models.UniqueConstraint(fields=('organization', 'level'), name='unique_alert_counter'),
+        ),
+        migrations.RunPython(count_unread_alerts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 15:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dispositivos', '0014_alertcounter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exportjob',
+            name='slot',
+            field=models.PositiveSmallIntegerField(blank=True, null=True, unique=True),
+        ),
+    ]
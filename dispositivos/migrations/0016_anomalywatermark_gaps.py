@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 15:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dispositivos', '0015_exportjob_slot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='anomalywatermark',
+            name='gaps',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
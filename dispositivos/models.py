@@ -1,7 +1,17 @@
+import hashlib
+import os
+import secrets
+import uuid
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.storage import FileSystemStorage
 from django.db import models
 from django.utils import timezone
 from usuarios.models import Organization
 
+from . import tenancy
+
 # Constante de estados
 STATUS = [
     ("ACTIVE", "Active"),
@@ -22,6 +32,68 @@ class SoftDeleteManager(models.Manager):
         return SoftDeleteQuerySet(self.model, using=self._db).filter(deleted_at__isnull=True)
 
 
+# QuerySet por tenant: for_org() en las vistas, unscoped() para agregados globales (ver tenancy.py)
+class TenantQuerySet(SoftDeleteQuerySet):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._unscoped = False
+
+    def for_org(self, organization):
+        """Filas de la organización (instancia o id); vacío si no hay organización."""
+        if organization is None:
+            return self.none()
+        return self.filter(organization=organization)
+
+    def unscoped(self):
+        """Opt-in explícito para consultas de todas las organizaciones."""
+        clone = self._chain()
+        clone._unscoped = True
+        return clone
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._unscoped = self._unscoped
+        return clone
+
+    def _check_scope(self):
+        if settings.DEBUG and not self._unscoped and tenancy.is_strict() and not tenancy.is_scoped(self.query):
+            raise tenancy.UnscopedQueryError(
+                f"Unscoped {self.model.__name__} query in a view; use for_org() or unscoped()."
+            )
+
+    def _fetch_all(self):
+        if self._result_cache is None:
+            self._check_scope()
+        super()._fetch_all()
+
+    def iterator(self, *args, **kwargs):
+        self._check_scope()
+        return super().iterator(*args, **kwargs)
+
+    def count(self):
+        if self._result_cache is None:
+            self._check_scope()
+        return super().count()
+
+    def exists(self):
+        if self._result_cache is None:
+            self._check_scope()
+        return super().exists()
+
+    def aggregate(self, *args, **kwargs):
+        self._check_scope()
+        return super().aggregate(*args, **kwargs)
+
+    def update(self, **kwargs):
+        self._check_scope()
+        return super().update(**kwargs)
+
+
+class TenantManager(models.Manager.from_queryset(TenantQuerySet)):
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
 # Clase base para herencia
 class BaseModel(models.Model):
     status = models.CharField(max_length=10, choices=STATUS, default="ACTIVE")
@@ -29,7 +101,7 @@ class BaseModel(models.Model):
     updated_at = models.DateTimeField(auto_now=True)       # última actualización
     deleted_at = models.DateTimeField(null=True, blank=True)  # borrado lógico
 
-    objects = SoftDeleteManager()   # por defecto, solo activos
+    objects = TenantManager()       # por defecto, solo activos; for_org()/unscoped()
     all_objects = models.Manager()  # incluye eliminados
 
     class Meta:
@@ -51,6 +123,15 @@ class BaseModel(models.Model):
         self.save()
 
 
+class OrganizationFromDeviceMixin:
+    """Completa ``organization`` desde el dispositivo para filtrar por tenant sin join."""
+
+    def save(self, *args, **kwargs):
+        if self.organization_id is None and self.device_id is not None:
+            self.organization_id = self.device.organization_id
+        super().save(*args, **kwargs)
+
+
 # MODELOS DEL PROYECTO
 
 class Category(BaseModel):
@@ -58,6 +139,11 @@ class Category(BaseModel):
     description = models.TextField(blank=True)
     organization = models.ForeignKey(Organization, on_delete=models.CASCADE, null=True, blank=True)
 
+    class Meta(BaseModel.Meta):
+        indexes = [
+            models.Index(fields=["organization", "deleted_at"], name="category_org_deleted_idx"),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -67,6 +153,11 @@ class Zone(BaseModel):
     description = models.TextField(blank=True)
     organization = models.ForeignKey(Organization, on_delete=models.CASCADE, null=True, blank=True)
 
+    class Meta(BaseModel.Meta):
+        indexes = [
+            models.Index(fields=["organization", "deleted_at"], name="zone_org_deleted_idx"),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -78,33 +169,283 @@ class Device(BaseModel):
     reference = models.CharField(max_length=100, blank=True)
     organization = models.ForeignKey(Organization, on_delete=models.CASCADE, null=True, blank=True)
 
+    class Meta(BaseModel.Meta):
+        indexes = [
+            models.Index(fields=["organization", "deleted_at"], name="device_org_deleted_idx"),
+            # claves de paginación por cursor de device_list
+            models.Index(fields=["organization", "name", "id"], name="device_org_name_id_idx"),
+            models.Index(fields=["organization", "created_at", "id"], name="device_org_created_id_idx"),
+        ]
+
     def __str__(self):
         return self.name
 
 
-class Measurement(BaseModel):
+class DeviceToken(BaseModel):
+    """Token de API para un dispositivo o, sin ``device``, para un gateway de toda la organización.
+
+    Solo se guarda el hash SHA-256 de la clave; la clave en claro se muestra una vez al emitirla.
+    """
+    name = models.CharField(max_length=100, blank=True)
+    key_hash = models.CharField(max_length=64, unique=True, editable=False)
+    prefix = models.CharField(max_length=8, editable=False)  # para identificarlo sin exponer la clave
+    device = models.ForeignKey(Device, on_delete=models.CASCADE, null=True, blank=True, related_name="tokens")
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE)
+
+    def __str__(self):
+        return f"{self.name or self.prefix} ({self.device or self.organization})"
+
+    @staticmethod
+    def hash_key(key):
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def set_key(self):
+        """Genera una clave nueva y devuelve el texto en claro (no se guarda)."""
+        key = secrets.token_urlsafe(32)
+        self.key_hash = self.hash_key(key)
+        self.prefix = key[:8]
+        return key
+
+    @classmethod
+    def issue(cls, organization, device=None, name=""):
+        token = cls(organization=organization, device=device, name=name)
+        key = token.set_key()
+        token.save()
+        return token, key
+
+    def rotate(self):
+        """Reemplaza la clave; la anterior deja de ser válida de inmediato."""
+        from .auth import token_cache
+        old_hash = self.key_hash
+        key = self.set_key()
+        self.save()
+        token_cache.invalidate(old_hash)
+        return key
+
+
+class MeasurementQuerySet(TenantQuerySet):
+    """Los borrados en bloque cambian la versión de datos de las exportaciones (ver jobs.py)."""
+
+    def _organization_ids(self):
+        return list(self.order_by().values_list("organization_id", flat=True).distinct())
+
+    def delete(self):
+        from .jobs import bump_data_version  # jobs importa este módulo
+        organization_ids = self._organization_ids()
+        deleted = super().delete()
+        bump_data_version(organization_ids, "measurements")
+        return deleted
+
+    def hard_delete(self):
+        from .jobs import bump_data_version
+        organization_ids = self._organization_ids()
+        deleted = super().hard_delete()
+        bump_data_version(organization_ids, "measurements")
+        return deleted
+
+
+class MeasurementManager(TenantManager.from_queryset(MeasurementQuerySet)):
+    pass
+
+
+class Measurement(OrganizationFromDeviceMixin, BaseModel):
     device = models.ForeignKey(Device, on_delete=models.CASCADE, related_name="measurements")
     value = models.DecimalField(max_digits=12, decimal_places=3)
     unit = models.CharField(max_length=20, blank=True)
     date = models.DateTimeField(default=timezone.now)
     organization = models.ForeignKey(Organization, on_delete=models.CASCADE, null=True, blank=True)
 
+    objects = MeasurementManager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Dispositivo y fecha al cargar: al editarlos hay que recalcular también la ventana anterior
+        instance._loaded_bucket = (instance.__dict__.get("device_id"), instance.__dict__.get("date"))
+        return instance
+
+    class Meta(BaseModel.Meta):
+        indexes = [
+            models.Index(fields=["organization", "device", "date"], name="meas_org_device_date_idx"),
+            models.Index(fields=["organization", "date", "id"], name="meas_org_date_id_idx"),
+        ]
+
+    def hard_delete(self):
+        from .jobs import bump_data_version  # sin post_delete de Measurement (ver signals.py)
+        super().hard_delete()
+        bump_data_version([self.organization_id], "measurements")
+
     def __str__(self):
         return f"{self.device.name} — {self.value} {self.unit}"
 
 
-class Sensor(BaseModel):
+class MeasurementRollup(models.Model):
+    """Agregados de mediciones por dispositivo y ventana (1 minuto, 1 hora, 1 día).
+
+    Se mantienen de forma incremental al ingerir (ver ``dispositivos.rollups``)
+    y se pueden reconstruir con ``manage.py rebuild_rollups``.
+    """
+    RESOLUTION = [
+        ("1m", "1 minuto"),
+        ("1h", "1 hora"),
+        ("1d", "1 día"),
+    ]
+    device = models.ForeignKey(Device, on_delete=models.CASCADE, related_name="rollups")
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE, null=True, blank=True)
+    resolution = models.CharField(max_length=2, choices=RESOLUTION)
+    bucket = models.DateTimeField()  # inicio de la ventana (UTC)
+    count = models.PositiveIntegerField(default=0)
+    sum = models.FloatField(default=0)
+    min = models.FloatField()
+    max = models.FloatField()
+    last = models.FloatField()
+    last_date = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["device", "resolution", "bucket"], name="unique_rollup_bucket"),
+        ]
+
+    def __str__(self):
+        return f"{self.device_id} {self.resolution} {self.bucket:%Y-%m-%d %H:%M}"
+
+
+class EnergyConsumption(models.Model):
+    """kWh consumidos por un dispositivo en una hora (ver ``dispositivos.energy``).
+
+    Zona y categoría se copian del dispositivo al escribir para agregar por
+    zona/categoría/organización sin joins.
+    """
+    device = models.ForeignKey(Device, on_delete=models.CASCADE, related_name="energy")
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE, null=True, blank=True)
+    zone = models.ForeignKey(Zone, on_delete=models.SET_NULL, null=True, blank=True)
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True)
+    bucket = models.DateTimeField()  # inicio de la hora (UTC)
+    kwh = models.FloatField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["device", "bucket"], name="unique_energy_bucket"),
+        ]
+        indexes = [
+            models.Index(fields=["organization", "bucket"], name="energy_org_bucket_idx"),
+            models.Index(fields=["zone", "bucket"], name="energy_zone_bucket_idx"),
+            models.Index(fields=["category", "bucket"], name="energy_category_bucket_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.device_id} {self.bucket:%Y-%m-%d %H:%M} {self.kwh:.3f} kWh"
+
+
+class EnergyCursor(models.Model):
+    """Última lectura de energía/potencia integrada de cada dispositivo."""
+    device = models.OneToOneField(Device, on_delete=models.CASCADE, primary_key=True, related_name="energy_cursor")
+    kind = models.CharField(max_length=10, blank=True)  # "energy" (medidor acumulado) o "power"
+    last_date = models.DateTimeField(null=True, blank=True)
+    last_value = models.FloatField(null=True, blank=True)  # kWh del medidor o kW instantáneos
+
+    def __str__(self):
+        return f"{self.device_id} {self.kind} @ {self.last_date}"
+
+
+class AnomalyWatermark(models.Model):
+    """Última medición examinada por el detector de anomalías en cada organización."""
+    organization = models.OneToOneField(Organization, on_delete=models.CASCADE, primary_key=True)
+    last_measurement_id = models.BigIntegerField(default=0)
+    gaps = models.JSONField(default=list, blank=True)  # [[desde_id, hasta_id, visto_ts], ...] aún sin confirmar
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.organization_id} @ {self.last_measurement_id}"
+
+
+class Sensor(OrganizationFromDeviceMixin, BaseModel):
     device = models.ForeignKey(Device, on_delete=models.CASCADE, related_name="sensors")
     name = models.CharField(max_length=100)
     type = models.CharField(max_length=50)  # Tipo de sensor, ej. temperatura, humedad
     unit = models.CharField(max_length=20)  # Unidad de medida, ej. °C, %
     organization = models.ForeignKey(Organization, on_delete=models.CASCADE, null=True, blank=True)
 
+    class Meta(BaseModel.Meta):
+        indexes = [
+            models.Index(fields=["organization", "deleted_at"], name="sensor_org_deleted_idx"),
+        ]
+
     def __str__(self):
         return f"{self.device.name} - {self.name}"
 
 
-class Alert(BaseModel):
+class AlertRule(BaseModel):
+    """Regla de alerta evaluada al ingerir (ver ``dispositivos.rules``).
+
+    Aplica a un dispositivo, a una categoría o a una zona:
+
+    * ``THRESHOLD``: el valor cruza ``threshold`` según ``operator``.
+    * ``RATE``: la variación por minuto respecto de la lectura anterior cruza ``threshold``.
+    * ``SUSTAINED``: el valor se mantiene del lado de ``threshold`` al menos ``duration_seconds``.
+    """
+    KIND = [
+        ("THRESHOLD", "Umbral"),
+        ("RATE", "Tasa de cambio"),
+        ("SUSTAINED", "Sostenido"),
+    ]
+    OPERATOR = [
+        ("gt", "Mayor que"),
+        ("lt", "Menor que"),
+    ]
+    name = models.CharField(max_length=100)
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE, null=True, blank=True)
+    device = models.ForeignKey(Device, on_delete=models.CASCADE, null=True, blank=True, related_name="alert_rules")
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, blank=True, related_name="alert_rules")
+    zone = models.ForeignKey(Zone, on_delete=models.CASCADE, null=True, blank=True, related_name="alert_rules")
+    kind = models.CharField(max_length=10, choices=KIND, default="THRESHOLD")
+    operator = models.CharField(max_length=2, choices=OPERATOR, default="gt")
+    threshold = models.FloatField()
+    duration_seconds = models.PositiveIntegerField(default=0)
+    unit = models.CharField(max_length=20, blank=True, help_text="Vacío: cualquier unidad")
+    level = models.CharField(max_length=10, choices=[("GRAVE", "Grave"), ("ALTA", "Alta"), ("MEDIA", "Media")], default="MEDIA")
+
+    class Meta(BaseModel.Meta):
+        constraints = [
+            models.CheckConstraint(
+                condition=(
+                    models.Q(device__isnull=False, category__isnull=True, zone__isnull=True)
+                    | models.Q(device__isnull=True, category__isnull=False, zone__isnull=True)
+                    | models.Q(device__isnull=True, category__isnull=True, zone__isnull=False)
+                ),
+                name="alert_rule_single_scope",
+            ),
+        ]
+
+    def clean(self):
+        scopes = [self.device_id, self.category_id, self.zone_id]
+        if sum(scope is not None for scope in scopes) != 1:
+            raise ValidationError("Choose exactly one of device, category or zone.")
+        if self.kind == "SUSTAINED" and not self.duration_seconds:
+            raise ValidationError({"duration_seconds": "Sustained rules need a duration."})
+
+    def save(self, *args, **kwargs):
+        if self.organization_id is None:
+            scope = self.device or self.category or self.zone
+            self.organization_id = scope.organization_id if scope else None
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return self.name
+
+
+class AlertQuerySet(TenantQuerySet):
+    def delete(self):
+        """Soft delete en bloque que descuenta las no leídas de ``AlertCounter``."""
+        from .alerts import soft_delete  # alerts importa este módulo
+        return soft_delete(self)
+
+
+class AlertManager(TenantManager.from_queryset(AlertQuerySet)):
+    pass
+
+
+class Alert(OrganizationFromDeviceMixin, BaseModel):
     LEVEL = [
         ("GRAVE", "Grave"),
         ("ALTA", "Alta"),
@@ -115,6 +456,133 @@ class Alert(BaseModel):
     level = models.CharField(max_length=10, choices=LEVEL, default="MEDIA")
     read = models.BooleanField(default=False)
     organization = models.ForeignKey(Organization, on_delete=models.CASCADE, null=True, blank=True)
+    # Deduplicación (ver dispositivos/suppression.py): repeticiones agrupadas en esta alerta
+    rule = models.ForeignKey(AlertRule, on_delete=models.SET_NULL, null=True, blank=True, related_name="alerts")
+    occurrences = models.PositiveIntegerField(default=1)
+    last_seen_at = models.DateTimeField(null=True, blank=True)
+
+    objects = AlertManager()
+
+    class Meta(BaseModel.Meta):
+        indexes = [
+            models.Index(fields=["organization", "created_at", "level"], name="alert_org_created_level_idx"),
+            models.Index(fields=["organization", "deleted_at"], name="alert_org_deleted_idx"),
+            models.Index(fields=["device", "last_seen_at"], name="alert_device_seen_idx"),
+            models.Index(fields=["organization", "read", "created_at"], name="alert_org_read_created_idx"),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Estado al cargar, para ajustar AlertCounter al guardar (ver dispositivos/alerts.py)
+        instance._counted_state = instance.counter_state()
+        return instance
+
+    def counter_state(self):
+        """(organización, nivel) si la alerta cuenta como no leída; si no, ``None``."""
+        if self.read or self.deleted_at is not None or self.organization_id is None:
+            return None
+        return self.organization_id, self.level
+
+    def save(self, *args, **kwargs):
+        if self.last_seen_at is None:
+            self.last_seen_at = timezone.now()
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"[{self.level}] {self.device.name} — {self.message}"
+
+
+class AlertCounter(models.Model):
+    """Alertas no leídas por organización y nivel, mantenidas de forma incremental
+    (ver ``dispositivos.alerts``) para que el contador del menú no recuente."""
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE, related_name="alert_counters")
+    level = models.CharField(max_length=10)
+    unread = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["organization", "level"], name="unique_alert_counter"),
+        ]
+
+    def __str__(self):
+        return f"{self.organization_id} {self.level}: {self.unread}"
+
+
+class ExportStorage(FileSystemStorage):
+    """Almacenamiento en ``EXPORT_ROOT``, fuera de MEDIA_ROOT: los archivos solo se
+    descargan a través de la vista, que verifica la organización."""
+
+    @property
+    def base_location(self):
+        return str(settings.EXPORT_ROOT)
+
+    @property
+    def location(self):
+        return os.path.abspath(self.base_location)
+
+
+def export_storage():
+    return ExportStorage()
+
+
+def export_upload_to(instance, filename):
+    return f"{instance.organization_id}/{uuid.uuid4().hex}-{filename}"
+
+
+class ExportJob(models.Model):
+    """Exportación generada en segundo plano por ``manage.py run_export_jobs``."""
+    PENDING, RUNNING, DONE, FAILED = "PENDING", "RUNNING", "DONE", "FAILED"
+    STATE = [
+        (PENDING, "Pendiente"),
+        (RUNNING, "En curso"),
+        (DONE, "Lista"),
+        (FAILED, "Fallida"),
+    ]
+    KIND = [
+        ("measurements", "Measurements"),
+        ("devices", "Devices"),
+    ]
+    FORMAT = [
+        ("xlsx", "Excel"),
+        ("csv", "CSV"),
+    ]
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE)
+    requested_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    kind = models.CharField(max_length=20, choices=KIND)
+    format = models.CharField(max_length=10, choices=FORMAT)
+    params = models.JSONField(default=dict, blank=True)  # filtros tal como llegaron (start, end, device...)
+    fingerprint = models.CharField(max_length=64)  # parámetros + versión de los datos, para deduplicar
+    state = models.CharField(max_length=10, choices=STATE, default=PENDING)
+    rows_written = models.PositiveIntegerField(default=0)
+    total_rows = models.PositiveIntegerField(null=True, blank=True)  # estimado, para el progreso
+    file = models.FileField(upload_to=export_upload_to, storage=export_storage, blank=True)
+    error = models.TextField(blank=True)
+    slot = models.PositiveSmallIntegerField(null=True, blank=True, unique=True)  # cupo de EXPORT_MAX_CONCURRENT mientras corre
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ("-created_at",)
+        indexes = [
+            models.Index(fields=["state", "created_at"], name="exportjob_state_created_idx"),
+            models.Index(fields=["organization", "fingerprint"], name="exportjob_org_fingerprint_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.format} #{self.pk} ({self.state})"
+
+    @property
+    def progress(self):
+        """Porcentaje aproximado (0-100)."""
+        if self.state == self.DONE:
+            return 100
+        if not self.total_rows:
+            return 0
+        return min(99, self.rows_written * 100 // self.total_rows)
+
+    @property
+    def filename(self):
+        return f"{self.kind}.{self.format}"
@@ -0,0 +1,142 @@
+"""
+Paginación por cursor (keyset) para listados grandes.
+
+En vez de ``COUNT(*)`` + ``OFFSET``, cada página filtra por la clave de
+ordenamiento de la última fila vista, así la página N cuesta lo mismo que la
+primera. Los cursores son opacos y firmados; un cursor inválido vuelve a la
+primera página.
+"""
+from datetime import date, datetime
+
+from django.core import signing
+from django.db.models import Q
+from django.utils.dateparse import parse_date, parse_datetime
+
+_SALT = "dispositivos.pagination"
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return ["dt", value.isoformat()]
+    if isinstance(value, date):
+        return ["d", value.isoformat()]
+    return ["v", value]
+
+
+def _decode(item):
+    kind, value = item
+    if kind == "dt":
+        return parse_datetime(value)
+    if kind == "d":
+        return parse_date(value)
+    return value
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """Pagina ``queryset`` según ``ordering``, p. ej. ``("-date", "-id")``.
+
+    El último campo debe ser único (normalmente ``id``) para que el orden sea total.
+    """
+
+    def __init__(self, queryset, ordering, per_page):
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.per_page = per_page
+        self.fields = [name.lstrip("-") for name in self.ordering]
+
+    def _cursor(self, obj, direction):
+        values = [_encode(getattr(obj, name)) for name in self.fields]
+        return signing.dumps({"k": values, "d": direction}, salt=_SALT, compress=True)
+
+    def _after(self, values, reverse):
+        """Q de las filas estrictamente posteriores a ``values`` en el orden (o anterior si ``reverse``)."""
+        condition = Q()
+        for i, name in enumerate(self.ordering):
+            descending = name.startswith("-") != reverse
+            field = self.fields[i]
+            step = Q(**{f"{field}__{'lt' if descending else 'gt'}": values[i]})
+            for prev_field, prev_value in zip(self.fields[:i], values[:i]):
+                step &= Q(**{prev_field: prev_value})
+            condition |= step
+        return condition
+
+    def _reversed_ordering(self):
+        return [name[1:] if name.startswith("-") else f"-{name}" for name in self.ordering]
+
+    def get_page(self, cursor=None):
+        direction, values = "next", None
+        if cursor:
+            try:
+                payload = signing.loads(cursor, salt=_SALT)
+                values = [_decode(item) for item in payload["k"]]
+                direction = payload["d"]
+                if len(values) != len(self.fields) or direction not in ("next", "prev"):
+                    values = None
+            except (signing.BadSignature, KeyError, TypeError, ValueError):
+                values = None
+        if values is None:
+            direction = "next"
+
+        backwards = direction == "prev"
+        queryset = self.queryset.order_by(*(self._reversed_ordering() if backwards else self.ordering))
+        if values is not None:
+            queryset = queryset.filter(self._after(values, reverse=backwards))
+        rows = list(queryset[:self.per_page + 1])
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+
+        if not rows:
+            return KeysetPage([])
+        has_next = more if not backwards else True
+        has_previous = (values is not None) if not backwards else more
+        return KeysetPage(
+            rows,
+            next_cursor=self._cursor(rows[-1], "next") if has_next else None,
+            previous_cursor=self._cursor(rows[0], "prev") if has_previous else None,
+        )
+
+
+def iter_keyset(queryset, ordering, fields, chunk_size=5000):
+    """Tuplas ``values_list(*fields)`` de ``queryset`` en orden ``ordering``, por bloques.
+
+    Cada bloque es una consulta con LIMIT que sigue a la última clave vista; a
+    diferencia de ``iterator()``, MySQL no retiene el resultado entero en el
+    cliente ni se mantiene un cursor abierto durante toda la exportación.
+    """
+    paginator = KeysetPaginator(queryset, ordering, chunk_size)
+    columns = list(fields) + [name for name in paginator.fields if name not in fields]
+    positions = [columns.index(name) for name in paginator.fields]
+    ordered = queryset.order_by(*paginator.ordering)
+    values = None
+    while True:
+        chunk = ordered if values is None else ordered.filter(paginator._after(values, reverse=False))
+        rows = list(chunk.values_list(*columns)[:chunk_size])
+        for row in rows:
+            yield row[:len(fields)]
+        if len(rows) < chunk_size:
+            return
+        values = [rows[-1][i] for i in positions]
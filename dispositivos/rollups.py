@@ -0,0 +1,289 @@
+"""
+Rollups de mediciones por ventana de tiempo.
+
+Cada ``MeasurementRollup`` guarda count/sum/min/max/last de un dispositivo en
+una ventana de 1 minuto, 1 hora o 1 día. Se actualizan de forma incremental con
+cada lote ingerido (``apply_measurements``) y las lecturas usan la ventana más
+gruesa que responde la consulta, así el costo no crece con la tabla cruda.
+"""
+from collections import defaultdict
+from datetime import timedelta, timezone as dt_timezone
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+
+from .archive import iter_measurement_rows
+from .models import Device, MeasurementRollup
+
+RESOLUTIONS = {
+    "1m": timedelta(minutes=1),
+    "1h": timedelta(hours=1),
+    "1d": timedelta(days=1),
+}
+RESOLUTION_ORDER = ("1m", "1h", "1d")  # de más fina a más gruesa
+
+# Reconstrucciones: dispositivos leídos juntos y días confirmados por transacción
+REBUILD_DEVICE_BATCH = 100
+REBUILD_CHUNK_DAYS = 7
+
+
+def bucket_start(dt, resolution):
+    """Inicio (UTC) de la ventana que contiene ``dt``."""
+    dt = dt.astimezone(dt_timezone.utc)
+    if resolution == "1m":
+        return dt.replace(second=0, microsecond=0)
+    if resolution == "1h":
+        return dt.replace(minute=0, second=0, microsecond=0)
+    return dt.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _ceil_bucket(dt, resolution):
+    start = bucket_start(dt, resolution)
+    return start if start == dt else start + RESOLUTIONS[resolution]
+
+
+class Aggregate:
+    __slots__ = ("organization_id", "count", "sum", "min", "max", "last", "last_date")
+
+    def __init__(self, organization_id=None):
+        self.organization_id = organization_id
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+        self.last = None
+        self.last_date = None
+
+    def add(self, value, date):
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        if self.last_date is None or date >= self.last_date:
+            self.last, self.last_date = value, date
+
+    def merge(self, other):
+        """Combina otro agregado (o un ``MeasurementRollup``) en este."""
+        if not other.count:
+            return
+        self.count += other.count
+        self.sum += other.sum
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        if self.last_date is None or other.last_date >= self.last_date:
+            self.last, self.last_date = other.last, other.last_date
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min,
+            "max": self.max,
+            "avg": self.sum / self.count if self.count else None,
+            "last": self.last,
+            "last_date": self.last_date,
+        }
+
+
+def accumulate(rows, aggregates=None):
+    """Agrega filas ``(device_id, organization_id, date, value)`` por ventana."""
+    if aggregates is None:
+        aggregates = {}
+    for device_id, organization_id, date, value in rows:
+        value = float(value)
+        for resolution in RESOLUTION_ORDER:
+            key = (device_id, resolution, bucket_start(date, resolution))
+            agg = aggregates.get(key)
+            if agg is None:
+                agg = aggregates[key] = Aggregate(organization_id)
+            agg.add(value, date)
+    return aggregates
+
+
+def _to_rollup(key, agg):
+    device_id, resolution, bucket = key
+    return MeasurementRollup(
+        device_id=device_id, organization_id=agg.organization_id, resolution=resolution, bucket=bucket,
+        count=agg.count, sum=agg.sum, min=agg.min, max=agg.max, last=agg.last, last_date=agg.last_date,
+    )
+
+
+def _merge_into_db(aggregates):
+    buckets = [key[2] for key in aggregates]
+    existing = (
+        MeasurementRollup.objects
+        .select_for_update()
+        .filter(
+            device_id__in={key[0] for key in aggregates},
+            resolution__in={key[1] for key in aggregates},
+            bucket__gte=min(buckets),
+            bucket__lte=max(buckets),
+        )
+    )
+    to_update = []
+    for rollup in existing:
+        agg = aggregates.pop((rollup.device_id, rollup.resolution, rollup.bucket), None)
+        if agg is None:
+            continue
+        agg.merge(rollup)
+        rollup.count, rollup.sum, rollup.min, rollup.max = agg.count, agg.sum, agg.min, agg.max
+        rollup.last, rollup.last_date = agg.last, agg.last_date
+        to_update.append(rollup)
+    if to_update:
+        MeasurementRollup.objects.bulk_update(
+            to_update, ["count", "sum", "min", "max", "last", "last_date"], batch_size=1000
+        )
+    MeasurementRollup.objects.bulk_create(
+        [_to_rollup(key, agg) for key, agg in aggregates.items()], batch_size=1000
+    )
+
+
+def apply_measurements(measurements):
+    """Suma un lote de mediciones recién insertadas a sus rollups."""
+    rows = [(m.device_id, m.organization_id, m.date, m.value) for m in measurements]
+    if not rows:
+        return
+    aggregates = accumulate(rows)
+    for attempt in range(2):
+        try:
+            with transaction.atomic():
+                # copia: _merge_into_db consume el dict y un reintento necesita el original
+                _merge_into_db(dict(aggregates))
+            return
+        except IntegrityError:
+            # Otro proceso creó la misma ventana a la vez; al reintentar ya existe
+            if attempt:
+                raise
+
+
+def rebuild_in_chunks(rows, start, end, feed, flush, days=REBUILD_CHUNK_DAYS):
+    """Pasa ``rows`` (ordenadas por fecha) a ``feed`` y cierra tramos de ``days`` días con ``flush(desde, hasta)``.
+
+    Los tramos son contiguos (cada uno empieza donde terminó el anterior, así
+    los días sin lecturas también se limpian) y el último llega hasta ``end``;
+    ``None`` deja ese extremo abierto. ``flush`` confirma su tramo en una
+    transacción propia: una reconstrucción larga no retiene los bloqueos.
+    """
+    lo, hi = start, None
+    for row in rows:
+        if hi is not None and row.date >= hi:
+            flush(lo, hi)
+            lo, hi = hi, None
+        if hi is None:
+            hi = bucket_start(row.date, "1d") + timedelta(days=days)
+        feed(row)
+    flush(lo, end)
+
+
+def device_batches(device_ids=None, organization_id=None):
+    """[(organización, [ids de dispositivo])] en grupos de ``REBUILD_DEVICE_BATCH``."""
+    devices = Device.all_objects.filter(organization__isnull=False)
+    if device_ids is not None:
+        devices = devices.filter(id__in=device_ids)
+    if organization_id is not None:
+        devices = devices.filter(organization_id=organization_id)
+    by_organization = defaultdict(list)
+    for device_id, org_id in devices.order_by("organization_id", "id").values_list("id", "organization_id"):
+        by_organization[org_id].append(device_id)
+    return [
+        (org_id, ids[offset:offset + REBUILD_DEVICE_BATCH])
+        for org_id, ids in by_organization.items()
+        for offset in range(0, len(ids), REBUILD_DEVICE_BATCH)
+    ]
+
+
+def _rebuild_devices(org_id, ids, start, end):
+    aggregates = {}
+    written = 0
+
+    def feed(row):
+        accumulate([(row.device_id, org_id, row.date, row.value)], aggregates)
+
+    def flush(lo, hi):
+        nonlocal written
+        with transaction.atomic():
+            rollups = MeasurementRollup.objects.filter(device_id__in=ids)
+            if lo is not None:
+                rollups = rollups.filter(bucket__gte=lo)
+            if hi is not None:
+                rollups = rollups.filter(bucket__lt=hi)
+            rollups.delete()
+            # Los tramos son de días completos: ninguna ventana queda repartida entre dos
+            MeasurementRollup.objects.bulk_create(
+                [_to_rollup(key, agg) for key, agg in aggregates.items()], batch_size=1000
+            )
+        written += len(aggregates)
+        aggregates.clear()
+
+    rebuild_in_chunks(iter_measurement_rows(org_id, start, end, device_ids=ids), start, end, feed, flush)
+    return written
+
+
+def rebuild(device_ids=None, organization_id=None, start=None, end=None):
+    """Recalcula los rollups desde las lecturas (BD y archivo); devuelve las ventanas escritas.
+
+    El rango se amplía a días completos para que las tres resoluciones queden
+    consistentes. Se confirma por grupo de dispositivos y tramo de días.
+    """
+    if start is not None:
+        start = bucket_start(start, "1d")
+    if end is not None:
+        end = _ceil_bucket(end, "1d")
+    return sum(_rebuild_devices(org_id, ids, start, end) for org_id, ids in device_batches(device_ids, organization_id))
+
+
+def pick_resolution(start, end, max_points=500):
+    """La resolución más fina que no supera ``max_points`` ventanas en el rango."""
+    span = end - start
+    for resolution in RESOLUTION_ORDER:
+        if span / RESOLUTIONS[resolution] <= max_points:
+            return resolution
+    return RESOLUTION_ORDER[-1]
+
+
+def series(device_id, start, end, resolution=None, max_points=500):
+    """Rollups de un dispositivo en ``[start, end)`` a la resolución indicada o elegida."""
+    resolution = resolution or pick_resolution(start, end, max_points)
+    return (
+        MeasurementRollup.objects
+        .filter(device_id=device_id, resolution=resolution,
+                bucket__gte=bucket_start(start, resolution), bucket__lt=end)
+        .order_by("bucket")
+    )
+
+
+def _cover(start, end):
+    """Descompone ``[start, end)`` en rangos alineados usando la ventana más gruesa posible.
+
+    Devuelve [(resolución, desde, hasta)]; los bordes bajo el minuto se redondean
+    al minuto completo que los contiene.
+    """
+    lo, hi = bucket_start(start, "1m"), _ceil_bucket(end, "1m")
+    ranges = []
+    middle = "1m"
+    for coarse, fine in (("1h", "1m"), ("1d", "1h")):
+        lo_aligned, hi_aligned = _ceil_bucket(lo, coarse), bucket_start(hi, coarse)
+        if lo_aligned >= hi_aligned:
+            break
+        if lo < lo_aligned:
+            ranges.append((fine, lo, lo_aligned))
+        if hi_aligned < hi:
+            ranges.append((fine, hi_aligned, hi))
+        lo, hi, middle = lo_aligned, hi_aligned, coarse
+    if lo < hi:
+        ranges.append((middle, lo, hi))
+    return ranges
+
+
+def summarize(device_ids, start, end):
+    """count/sum/min/max/avg/last por dispositivo en ``[start, end)`` en una consulta."""
+    condition = Q()
+    for resolution, lo, hi in _cover(start, end):
+        condition |= Q(resolution=resolution, bucket__gte=lo, bucket__lt=hi)
+    summary = {device_id: Aggregate() for device_id in device_ids}
+    if not condition or not summary:
+        return {device_id: agg.as_dict() for device_id, agg in summary.items()}
+    rollups = MeasurementRollup.objects.filter(condition, device_id__in=list(summary))
+    for rollup in rollups:
+        summary[rollup.device_id].merge(rollup)
+    return {device_id: agg.as_dict() for device_id, agg in summary.items()}
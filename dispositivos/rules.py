@@ -0,0 +1,196 @@
+"""
+Evaluación de ``AlertRule`` en la ruta de ingesta.
+
+Las reglas activas se compilan en un ``RuleIndex`` en memoria indexado por
+dispositivo (las reglas de categoría y zona se expanden a sus dispositivos),
+así cada lectura se compara solo con sus reglas con una búsqueda en un dict y
+sin consultas. Las señales de ``AlertRule`` y ``Device`` incrementan una
+versión en la caché compartida; cada proceso la lee una vez por lote y
+recompila el índice si cambió.
+
+La evaluación corre una vez confirmada la transacción de ingesta (ver
+signals.py), así una ingesta revertida no deja rastro. El estado de las reglas
+de tasa (lectura anterior) y sostenidas (inicio del incumplimiento) se guarda
+en la caché compartida, con ``ALERT_RULE_STATE_TTL``: lo ven todos los
+procesos y sobrevive a un reinicio. Se lee y escribe con un ``get_many`` y un
+``set_many`` por lote, solo para los dispositivos con reglas de ese tipo.
+"""
+import operator
+import threading
+import time
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+from .models import Alert, AlertRule, Device
+
+VERSION_KEY = "alert_rules:version"
+OPERATORS = {"gt": operator.gt, "lt": operator.lt}
+SYMBOLS = {"gt": ">", "lt": "<"}
+
+CompiledRule = namedtuple(
+    "CompiledRule", ["id", "name", "organization_id", "kind", "operator", "threshold", "duration", "unit", "level"],
+)
+
+
+def bump_version():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        # Valor nuevo si la versión se perdió: no coincide con la de ningún proceso
+        cache.set(VERSION_KEY, time.time_ns(), None)
+
+
+def current_version():
+    return cache.get(VERSION_KEY, 0)
+
+
+def compile_rules():
+    """{device_id: (CompiledRule, ...)} con las reglas activas de cada dispositivo."""
+    rules = AlertRule.objects.unscoped().filter(status="ACTIVE")  # índice de todas las organizaciones
+    by_scope = defaultdict(list)  # ("device"|"category"|"zone", id) -> reglas
+    for rule in rules:
+        compiled = CompiledRule(
+            id=rule.pk,
+            name=rule.name,
+            organization_id=rule.organization_id,
+            kind=rule.kind,
+            operator=rule.operator,
+            threshold=rule.threshold,
+            duration=timedelta(seconds=rule.duration_seconds),
+            unit=rule.unit.strip().lower(),
+            level=rule.level,
+        )
+        for scope in ("device", "category", "zone"):
+            scope_id = getattr(rule, f"{scope}_id")
+            if scope_id is not None:
+                by_scope[(scope, scope_id)].append(compiled)
+    if not by_scope:
+        return {}
+
+    category_ids = [scope_id for scope, scope_id in by_scope if scope == "category"]
+    zone_ids = [scope_id for scope, scope_id in by_scope if scope == "zone"]
+    device_ids = [scope_id for scope, scope_id in by_scope if scope == "device"]
+    devices = Device.objects.filter(
+        Q(id__in=device_ids) | Q(category_id__in=category_ids) | Q(zone_id__in=zone_ids)
+    ).values_list("id", "category_id", "zone_id")
+    index = {}
+    for device_id, category_id, zone_id in devices:
+        applicable = (
+            by_scope.get(("device", device_id), [])
+            + by_scope.get(("category", category_id), [])
+            + by_scope.get(("zone", zone_id), [])
+        )
+        if applicable:
+            index[device_id] = tuple(applicable)
+    return index
+
+
+def _previous_key(device_id, unit):
+    return f"alert_rules:previous:{device_id}:{unit}"
+
+
+def _breach_key(rule_id, device_id):
+    return f"alert_rules:breach:{rule_id}:{device_id}"
+
+
+class RuleIndex:
+    """Índice de reglas por dispositivo; seguro entre hilos. El estado vive en la caché."""
+
+    def __init__(self):
+        self.version = None
+        self.rules = {}
+        self._lock = threading.Lock()
+
+    def refresh(self, force=False):
+        version = current_version()
+        if force or version != self.version:
+            rules = compile_rules()
+            with self._lock:
+                self.rules, self.version = rules, version
+
+    def clear(self):
+        with self._lock:
+            self.version, self.rules = None, {}
+
+    def evaluate(self, measurements):
+        """Alertas (sin guardar) que disparan las mediciones; a lo sumo una por regla y
+        dispositivo en cada lote, con la última lectura que la cumplió."""
+        self.refresh()
+        rules = self.rules
+        readings = sorted((m for m in measurements if m.device_id in rules), key=lambda m: (m.device_id, m.date))
+        if not readings:
+            return []
+        state = self._load_state(readings, rules)
+        changed, removed = {}, set()
+        fired = {}
+        for m in readings:
+            device_rules = rules[m.device_id]
+            value = float(m.value)
+            unit = (m.unit or "").strip().lower()
+            previous_key = _previous_key(m.device_id, unit)
+            previous = state.get(previous_key)
+            if any(rule.kind == "RATE" for rule in device_rules) and (previous is None or m.date > previous[0]):
+                state[previous_key] = changed[previous_key] = (m.date, value)
+            for rule in device_rules:
+                if rule.unit and rule.unit != unit:
+                    continue
+                message = self._check(rule, m, value, previous, state, changed, removed)
+                if message:
+                    fired[(rule.id, m.device_id)] = Alert(
+                        device_id=m.device_id,
+                        organization_id=m.organization_id,  # bulk_create no pasa por save()
+                        rule_id=rule.id,
+                        level=rule.level,
+                        message=message[:250],
+                    )
+        if changed:
+            cache.set_many(changed, settings.ALERT_RULE_STATE_TTL)
+        if removed - changed.keys():
+            cache.delete_many(list(removed - changed.keys()))
+        return list(fired.values())
+
+    def _load_state(self, readings, rules):
+        keys = set()
+        for m in readings:
+            for rule in rules[m.device_id]:
+                if rule.kind == "RATE":
+                    keys.add(_previous_key(m.device_id, (m.unit or "").strip().lower()))
+                elif rule.kind == "SUSTAINED":
+                    keys.add(_breach_key(rule.id, m.device_id))
+        return cache.get_many(keys) if keys else {}
+
+    def _check(self, rule, m, value, previous, state, changed, removed):
+        compare = OPERATORS[rule.operator]
+        reading = f"{value:g} {m.unit}".strip()
+        condition = f"{SYMBOLS[rule.operator]} {rule.threshold:g}"
+        if rule.kind == "THRESHOLD":
+            if compare(value, rule.threshold):
+                return f"{rule.name}: {reading} {condition}"
+        elif rule.kind == "RATE":
+            if previous is None or m.date <= previous[0]:
+                return None
+            rate = (value - previous[1]) / ((m.date - previous[0]).total_seconds() / 60)
+            if compare(rate, rule.threshold):
+                return f"{rule.name}: {rate:+g}/min {condition}/min (ahora {reading})"
+        elif rule.kind == "SUSTAINED":
+            key = _breach_key(rule.id, m.device_id)
+            if not compare(value, rule.threshold):
+                if state.pop(key, None) is not None:
+                    changed.pop(key, None)
+                    removed.add(key)
+                return None
+            since = state.get(key)
+            if since is None:
+                since = state[key] = changed[key] = m.date
+            if m.date - since >= rule.duration:
+                state[key] = changed[key] = m.date  # vuelve a disparar tras otro período completo
+                minutes = int((m.date - since).total_seconds() // 60)
+                return f"{rule.name}: {reading} {condition} durante {minutes} min"
+        return None
+
+
+rule_index = RuleIndex()
@@ -0,0 +1,160 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from . import alerts, dashboard, energy, fragments, jobs, rollups, rules
+from .auth import token_cache
+from .buffer import BufferFull, get_alert_buffer, write_behind_enabled
+from .suppression import suppressor
+from .models import Alert, AlertRule, Category, Device, DeviceToken, Measurement, Zone
+
+# Se envía tras insertar mediciones en bloque (bulk_create no dispara post_save).
+# Argumentos: measurements (lista de instancias con device_id, organization_id, date y value).
+measurements_created = Signal()
+
+
+@receiver(post_save, sender=DeviceToken)
+@receiver(post_delete, sender=DeviceToken)
+def invalidate_token(sender, instance, **kwargs):
+    token_cache.invalidate(instance.key_hash)
+
+
+@receiver(post_save, sender=Device)
+def invalidate_device_tokens(sender, instance, created, **kwargs):
+    if not created and (instance.deleted_at is not None or instance.status != "ACTIVE"):
+        token_cache.invalidate_device(instance.pk)
+
+
+@receiver(post_delete, sender=Device)
+def invalidate_deleted_device_tokens(sender, instance, **kwargs):
+    token_cache.invalidate_device(instance.pk)
+
+
+@receiver(measurements_created)
+def update_rollups(sender, measurements, **kwargs):
+    rollups.apply_measurements(measurements)
+
+
+@receiver(measurements_created)
+def update_energy(sender, measurements, **kwargs):
+    energy.apply_measurements(measurements)
+
+
+# Cambios de reglas o de la categoría/zona de un dispositivo recompilan el índice
+@receiver(post_save, sender=AlertRule)
+@receiver(post_delete, sender=AlertRule)
+@receiver(post_save, sender=Device)
+@receiver(post_delete, sender=Device)
+def invalidate_alert_rules(sender, instance, **kwargs):
+    rules.bump_version()
+
+
+def write_alerts(alerts):
+    """Escribe (o agrupa) las alertas e invalida el dashboard de sus organizaciones."""
+    created = suppressor.submit(alerts)
+    for organization_id in {alert.organization_id for alert in created}:
+        dashboard.invalidate(organization_id)
+
+
+def _evaluate_alert_rules(measurements):
+    alerts = rules.rule_index.evaluate(measurements)
+    if not alerts:
+        return
+    if write_behind_enabled():
+        try:
+            get_alert_buffer().put_many(alerts)
+            return
+        except BufferFull:
+            pass  # buffer lleno: se escriben en este hilo
+    write_alerts(alerts)
+
+
+@receiver(measurements_created)
+def evaluate_alert_rules(sender, measurements, **kwargs):
+    # Tras el commit: el estado de tasa/sostenidas no avanza con lecturas revertidas
+    transaction.on_commit(lambda: _evaluate_alert_rules(measurements))
+
+
+@receiver(post_save, sender=Device)
+@receiver(post_delete, sender=Device)
+@receiver(post_save, sender=Zone)
+@receiver(post_delete, sender=Zone)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Alert)
+@receiver(post_delete, sender=Alert)
+def invalidate_dashboard(sender, instance, **kwargs):
+    dashboard.invalidate(instance.organization_id)
+
+
+# Listas de zonas/categorías/dispositivos en plantillas: nueva versión de datos de la organización
+@receiver(post_save, sender=Device)
+@receiver(post_delete, sender=Device)
+@receiver(post_save, sender=Zone)
+@receiver(post_delete, sender=Zone)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def bump_fragment_version(sender, instance, **kwargs):
+    if instance.organization_id is not None:
+        fragments.bump(instance.organization_id)
+
+
+# Fingerprint de las exportaciones en segundo plano (ver jobs.data_version). Los
+# nombres de dispositivo, categoría y zona también aparecen en las exportaciones.
+@receiver(post_save, sender=Device)
+@receiver(post_delete, sender=Device)
+@receiver(post_save, sender=Zone)
+@receiver(post_delete, sender=Zone)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def bump_export_versions(sender, instance, **kwargs):
+    jobs.bump_data_version([instance.organization_id], "devices")
+    jobs.bump_data_version([instance.organization_id], "measurements")
+
+
+@receiver(measurements_created)
+def bump_measurement_export_version(sender, measurements, **kwargs):
+    jobs.bump_data_version((m.organization_id for m in measurements), "measurements")
+
+
+@receiver(post_save, sender=Alert)
+def count_saved_alert(sender, instance, created, **kwargs):
+    alerts.track_saved(instance, created)
+
+
+@receiver(post_delete, sender=Alert)
+def count_deleted_alert(sender, instance, **kwargs):
+    alerts.track_deleted(instance)
+
+
+# Sin post_delete de Measurement a propósito: un receptor obligaría a
+# QuerySet.delete() a cargar cada fila (p. ej. al archivar); el borrado
+# lógico es un save y sí se detecta.
+@receiver(measurements_created)
+def mark_dashboard_measurements(sender, measurements, **kwargs):
+    dashboard.mark_measurements_changed(m.organization_id for m in measurements)
+
+
+@receiver(post_save, sender=Measurement)
+def measurement_saved(sender, instance, created, **kwargs):
+    if created:
+        measurements_created.send(sender=Measurement, measurements=[instance])
+    else:
+        dashboard.mark_measurements_changed([instance.organization_id])
+        jobs.bump_data_version([instance.organization_id], "measurements")
+        # Editar o borrar (soft delete) no se puede restar de min/max: se recalcula el día,
+        # y también el de antes si la lectura cambió de fecha o de dispositivo
+        buckets = {(instance.device_id, rollups.bucket_start(instance.date, "1d"))}
+        device_id, date = getattr(instance, "_loaded_bucket", (None, None))
+        if device_id is not None and date is not None:
+            buckets.add((device_id, rollups.bucket_start(date, "1d")))
+        # Tras el commit: no alarga la transacción de la edición ni recalcula cambios revertidos
+        transaction.on_commit(lambda: _rebuild_days(buckets))
+        instance._loaded_bucket = (instance.device_id, instance.date)
+
+
+def _rebuild_days(buckets):
+    for device_id, day in buckets:
+        rollups.rebuild(device_ids=[device_id], start=day, end=day + timedelta(days=1))
@@ -0,0 +1,174 @@
+"""
+Deduplicación de alertas repetidas (sensores que oscilan).
+
+Las alertas de reglas, del detector de anomalías y del buffer de alertas pasan
+por ``suppressor.submit``. Si ya hay una alerta abierta (no leída) para el
+mismo (dispositivo, nivel, regla) vista hace menos de
+``ALERT_DEDUPE_WINDOW_MINUTES``, no se inserta una fila nueva: se suman las
+repeticiones en memoria y se vuelcan cada ``ALERT_DEDUPE_FLUSH_SECONDS`` con un
+``UPDATE`` de ``occurrences``/``last_seen_at`` (``F()``) por alerta.
+
+El estado es por proceso; cuando una clave no está en memoria se busca su
+alerta abierta en la BD (una consulta por lote) para no duplicar tras un
+reinicio o entre procesos. Si la alerta se marcó como leída, el próximo
+volcado la suelta y la siguiente repetición abre una alerta nueva.
+
+Los cambios en memoria se aplican con ``transaction.on_commit``: si la
+transacción del llamador se revierte no quedan ids de alertas inexistentes ni
+repeticiones de lecturas descartadas. Un hilo en segundo plano vuelca cada
+``ALERT_DEDUPE_FLUSH_SECONDS`` aunque no lleguen más alertas.
+"""
+import atexit
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .alerts import record_created
+from .models import Alert
+
+logger = logging.getLogger(__name__)
+
+
+def alert_key(alert):
+    return alert.device_id, alert.level, alert.rule_id
+
+
+class AlertSuppressor:
+    def __init__(self, autostart=True):
+        self.autostart = autostart
+        self._open = {}  # (device_id, nivel, regla) -> [alert_id, visto por última vez]
+        self._pending = {}  # alert_id -> [repeticiones sin volcar, visto por última vez, clave]
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, alerts, now=None):
+        """Inserta las alertas nuevas y acumula las repetidas; devuelve las creadas."""
+        if not alerts:
+            return []
+        now = now or timezone.now()
+        since = now - timedelta(minutes=settings.ALERT_DEDUPE_WINDOW_MINUTES)
+        batch = {}  # repetidas dentro del lote: queda la última, con el total
+        for alert in alerts:
+            key = alert_key(alert)
+            count = batch[key][1] + 1 if key in batch else 1
+            batch[key] = (alert, count)
+
+        with self._lock:
+            open_ids = {key: self._open[key][0] for key in batch if self._is_open(key, since)}
+        missing = [key for key in batch if key not in open_ids]
+        if missing:
+            # Dentro de una transacción también ve las alertas aún sin confirmar
+            open_ids.update(self._load_open(missing, since))
+        repeated = {}  # alert_id -> (repeticiones, clave)
+        to_create = []
+        for key, (alert, count) in batch.items():
+            if key in open_ids:
+                repeated[open_ids[key]] = (count, key)
+            else:
+                alert.occurrences, alert.last_seen_at = count, now
+                to_create.append(alert)
+        created = Alert.objects.bulk_create(to_create)
+        record_created(created)
+        opened = {alert_key(alert): alert.pk for alert in created if alert.pk is not None}
+        transaction.on_commit(lambda: self._register(opened, repeated, now, since))
+        if self.autostart:
+            self.start()
+        return created
+
+    def _register(self, opened, repeated, now, since):
+        """Aplica en memoria lo que ``submit`` dejó confirmado en la BD."""
+        with self._lock:
+            for alert_id, (count, key) in repeated.items():
+                self._open[key] = [alert_id, now]
+                pending = self._pending.setdefault(alert_id, [0, now, key])
+                pending[0] += count
+                pending[1] = max(pending[1], now)
+            for key, alert_id in opened.items():
+                self._open[key] = [alert_id, now]
+            self._open = {key: entry for key, entry in self._open.items() if entry[1] >= since}
+            due = time.monotonic() - self._last_flush >= settings.ALERT_DEDUPE_FLUSH_SECONDS
+        if due:
+            self.flush()
+
+    def _is_open(self, key, since):
+        entry = self._open.get(key)
+        return entry is not None and entry[1] >= since
+
+    def _load_open(self, keys, since):
+        """{clave: alert_id} de las alertas abiertas en la BD para ``keys``."""
+        wanted = set(keys)
+        found = {}
+        rows = (
+            Alert.objects.filter(device_id__in={key[0] for key in keys}, read=False, last_seen_at__gte=since)
+            .order_by("last_seen_at")
+            .values_list("id", "device_id", "level", "rule_id")
+        )
+        for alert_id, device_id, level, rule_id in rows:
+            key = (device_id, level, rule_id)
+            if key in wanted:
+                found[key] = alert_id  # la más reciente queda al final
+        return found
+
+    def start(self):
+        """Arranca el hilo que vuelca periódicamente; es seguro llamarlo varias veces."""
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="alert-suppression", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        try:
+            while True:
+                time.sleep(settings.ALERT_DEDUPE_FLUSH_SECONDS)
+                close_old_connections()
+                try:
+                    self.flush()
+                except Exception:
+                    logger.exception("alert suppression: periodic flush failed")
+        finally:
+            connection.close()
+
+    def flush(self):
+        """Vuelca las repeticiones acumuladas; devuelve cuántas alertas se actualizaron."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+        updated = 0
+        for alert_id, (count, last_seen, key) in pending.items():
+            rows = Alert.objects.filter(pk=alert_id, read=False).update(
+                occurrences=F("occurrences") + count, last_seen_at=last_seen,
+            )
+            updated += rows
+            if not rows:
+                with self._lock:
+                    entry = self._open.get(key)
+                    if entry is not None and entry[0] == alert_id:
+                        del self._open[key]
+        return updated
+
+    def clear(self):
+        with self._lock:
+            self._open.clear()
+            self._pending.clear()
+
+
+suppressor = AlertSuppressor()
+
+
+def _flush_on_exit():
+    try:
+        suppressor.flush()
+    except Exception:
+        logger.exception("alert suppression: flush on shutdown failed")
+
+
+atexit.register(_flush_on_exit)
@@ -0,0 +1,45 @@
+from django import template
+
+from .. import fragments
+
+register = template.Library()
+
+
+class OrgCacheNode(template.Node):
+    def __init__(self, nodelist, name, vary_on):
+        self.nodelist = nodelist
+        self.name = name
+        self.vary_on = vary_on
+
+    def render(self, context):
+        request = context.get("request")
+        organization = getattr(request, "organization", None)
+        if organization is None:
+            return self.nodelist.render(context)
+        # Una sola lectura de la versión por request aunque haya varios fragmentos
+        version = getattr(request, "_fragment_version", None)
+        if version is None:
+            version = request._fragment_version = fragments.data_version(organization.pk)
+        vary_on = [var.resolve(context) for var in self.vary_on]
+        return fragments.get_or_render(
+            self.name, organization.pk, vary_on, lambda: self.nodelist.render(context), version=version,
+        )
+
+
+@register.tag
+def orgcache(parser, token):
+    """
+    Cachea el bloque por organización y versión de datos (ver ``dispositivos.fragments``).
+
+    Uso: ``{% orgcache "nombre" var1 var2 %}...{% endorgcache %}``; las variables
+    opcionales distinguen variantes del fragmento (filtros, rol del usuario).
+    """
+    nodelist = parser.parse(("endorgcache",))
+    parser.delete_first_token()
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' tag requires a fragment name.")
+    name = bits[1]
+    if not (name[0] == name[-1] and name[0] in ('"', "'")):
+        raise template.TemplateSyntaxError(f"'{bits[0]}' fragment name must be a quoted string.")
+    return OrgCacheNode(nodelist, name[1:-1], [parser.compile_filter(bit) for bit in bits[2:]])
@@ -0,0 +1,51 @@
+"""
+Guardia de consultas por tenant.
+
+Los modelos de ``dispositivos`` usan ``TenantQuerySet`` (ver ``models``): las
+vistas consultan con ``.for_org(organización)`` y los agregados de toda la
+plataforma (``admin_dashboard``, índices globales) lo piden explícitamente con
+``.unscoped()``. ``usuarios.middleware.OrganizationMiddleware`` activa el modo
+estricto mientras corre una vista (salvo el admin de Django, que filtra en
+``get_queryset``); con ``DEBUG`` activo, evaluar ahí una consulta sin
+organización, clave única ni clave foránea que la acote lanza
+``UnscopedQueryError`` en lugar de recorrer las filas de todos los tenants.
+"""
+from contextvars import ContextVar
+
+from django.db.models.sql.where import AND, WhereNode
+
+_strict = ContextVar("tenant_strict", default=False)
+
+
+class UnscopedQueryError(RuntimeError):
+    pass
+
+
+def activate():
+    """Activa el modo estricto; devuelve el token para ``deactivate``."""
+    return _strict.set(True)
+
+
+def deactivate(token):
+    _strict.reset(token)
+
+
+def is_strict():
+    return _strict.get()
+
+
+def _is_bounded(node):
+    """True si el WHERE limita la consulta a un tenant, una fila o un padre (FK)."""
+    if getattr(node, "negated", False):
+        return False
+    if isinstance(node, WhereNode):
+        bounded = [_is_bounded(child) for child in node.children]
+        return any(bounded) if node.connector == AND else bool(bounded) and all(bounded)
+    target = getattr(getattr(node, "lhs", None), "target", None)
+    if target is None or getattr(node, "lookup_name", None) == "isnull":
+        return False
+    return target.unique or target.many_to_one or target.one_to_one
+
+
+def is_scoped(query):
+    return query.is_empty() or _is_bounded(query.where)
@@ -1,7 +1,42 @@
-from django.test import TestCase
-from django.contrib.auth.models import User, Group
+import csv
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import threading
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import BytesIO, StringIO
+from unittest import mock
+
+import numpy as np
+
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.core.paginator import EmptyPage
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.contrib.auth.models import User, Group, Permission
 from django.urls import reverse
-from .models import Device, Measurement, Category, Zone, Organization
+from openpyxl import load_workbook
+from .models import Alert, AlertCounter, AlertRule, AnomalyWatermark, Device, DeviceToken, EnergyConsumption, EnergyCursor, ExportJob, Measurement, MeasurementRollup, Category, Zone, Organization
+from . import alerts, analytics, anomalies, archive, dashboard, downsampling, energy, exports, fragments, jobs, rollups, rules, signals, tenancy
+from .ingest import ingest_rows
+from .pagination import KeysetPaginator
+from .counting import EstimatedCountPaginator, ResultCount, count_queryset
+from .auth import authenticate_token, token_cache
+from .buffer import BufferFull, WriteBehindBuffer
+from .suppression import suppressor
+from usuarios.models import UserProfile
+from monitoreo.cache import InstrumentedFileBasedCache, InstrumentedLocMemCache
+
+suppressor.autostart = False  # los tests vuelcan a mano
+
+ARCHIVE_TEST_DIR = os.path.join(tempfile.gettempdir(), "ecoenergy-test-archive")
 
 class DeviceTestCase(TestCase):
     def setUp(self):
@@ -35,3 +70,1442 @@ class DeviceTestCase(TestCase):
         )
         self.assertEqual(measurement.device.name, "Test Device")
         self.assertEqual(measurement.value, 25.5)
+
+
+class MeasurementIngestTestCase(TestCase):
+    def setUp(self):
+        self.organization = Organization.objects.create(name="Ingest Org", email="ingest@org.com")
+        category = Category.objects.create(name="Energía", organization=self.organization)
+        zone = Zone.objects.create(name="Zona Norte", organization=self.organization)
+        self.device = Device.objects.create(
+            name="Medidor", category=category, zone=zone, reference="REF-1", organization=self.organization
+        )
+        self.user = User.objects.create_user(username="gateway", password="testpass123")
+        UserProfile.objects.create(user=self.user, organization=self.organization)
+        self.client.login(username="gateway", password="testpass123")
+
+    def test_json_batch_reports_row_errors(self):
+        rows = [
+            {"device": self.device.pk, "value": 12.5, "unit": "kWh", "date": "2025-01-01T10:00:00Z"},
+            {"device": "REF-1", "value": "13.25", "unit": "kWh"},
+            {"device": 9999, "value": 1},
+            {"device": "REF-1", "value": "abc"},
+            {"device": "REF-1", "value": "1e30"},
+        ]
+        response = self.client.post(
+            reverse('measurement_ingest'), data=json.dumps(rows), content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 200)
+        result = response.json()
+        self.assertEqual(result["created"], 2)
+        self.assertEqual(result["rejected"], 3)
+        self.assertEqual([e["index"] for e in result["errors"]], [2, 3, 4])
+        self.assertIn("device", result["errors"][0]["errors"])
+        self.assertIn("value", result["errors"][1]["errors"])
+        self.assertEqual(Measurement.objects.filter(device=self.device).count(), 2)
+        self.assertTrue(Measurement.objects.filter(organization=self.organization, value="13.250").exists())
+
+    def test_ndjson_batch_with_bad_line(self):
+        body = "\n".join([
+            json.dumps({"device": "REF-1", "value": 1, "unit": "W"}),
+            "{not json",
+            json.dumps({"device": "REF-1", "value": 2, "unit": "W"}),
+        ])
+        response = self.client.post(
+            reverse('measurement_ingest'), data=body, content_type="application/x-ndjson"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["created"], 2)
+        self.assertEqual(response.json()["errors"][0]["index"], 1)
+
+    def test_rejects_unauthenticated_and_form_posts(self):
+        response = self.client.post(reverse('measurement_ingest'), data={"device": "REF-1"})
+        self.assertEqual(response.status_code, 415)
+        self.client.logout()
+        response = self.client.post(reverse('measurement_ingest'), data="[]", content_type="application/json")
+        self.assertEqual(response.status_code, 401)
+
+
+class IngestMeasurementsCommandTestCase(TestCase):
+    def setUp(self):
+        self.organization = Organization.objects.create(name="Backfill Org", email="backfill@org.com")
+        category = Category.objects.create(name="Energía", organization=self.organization)
+        zone = Zone.objects.create(name="Zona Sur", organization=self.organization)
+        self.device = Device.objects.create(
+            name="Medidor", category=category, zone=zone, reference="M-1", organization=self.organization
+        )
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def _write(self, name, content):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, "w") as fh:
+            fh.write(content)
+        return path
+
+    def test_csv_in_chunks_with_checkpoint(self):
+        path = self._write("data.csv", "device,value,unit,date\n" + "".join(
+            f"M-1,{i},kWh,2025-01-01T00:{i:02d}:00Z\n" for i in range(7)
+        ) + "UNKNOWN,1,kWh,\n")
+        checkpoint = os.path.join(self.tmpdir, "ckpt")
+        out, err = StringIO(), StringIO()
+        call_command(
+            "ingest_measurements", path, organization=self.organization.pk,
+            chunk_size=3, checkpoint=checkpoint, stdout=out, stderr=err,
+        )
+        self.assertEqual(Measurement.objects.filter(device=self.device).count(), 7)
+        self.assertIn("rejected=1", out.getvalue())
+        with open(checkpoint) as fh:
+            self.assertEqual(int(fh.read()), os.path.getsize(path))
+
+        # Reanudar desde el checkpoint final no duplica filas
+        call_command(
+            "ingest_measurements", path, organization=self.organization.pk,
+            checkpoint=checkpoint, stdout=StringIO(), stderr=StringIO(),
+        )
+        self.assertEqual(Measurement.objects.filter(device=self.device).count(), 7)
+
+    def test_ndjson_resume_from_offset(self):
+        lines = [json.dumps({"device": "M-1", "value": i, "unit": "W"}) + "\n" for i in range(4)]
+        path = self._write("data.ndjson", "".join(lines))
+        call_command(
+            "ingest_measurements", path, organization=self.organization.pk,
+            offset=len(lines[0]) + len(lines[1]), stdout=StringIO(),
+        )
+        values = sorted(Measurement.objects.values_list("value", flat=True))
+        self.assertEqual([int(v) for v in values], [2, 3])
+
+
+class WriteBehindBufferTestCase(SimpleTestCase):
+    def test_backpressure_and_flush_on_close(self):
+        written = []
+        buffer = WriteBehindBuffer(written.append, max_size=5, batch_size=2, autostart=False)
+        buffer.put_many([1, 2, 3])
+        buffer.put(4)
+        with self.assertRaises(BufferFull):
+            buffer.put_many([5, 6], timeout=0.01)
+        self.assertEqual(len(buffer), 4)
+
+        self.assertEqual(buffer.flush(), 4)
+        self.assertEqual(written, [[1, 2], [3, 4]])
+
+        buffer.put(5)
+        self.assertEqual(buffer.close(), 1)
+        self.assertEqual(written[-1], [5])
+        with self.assertRaises(BufferFull):
+            buffer.put(6)
+
+    def test_background_thread_flushes_by_size(self):
+        flushed = threading.Event()
+        written = []
+
+        def sink(batch):
+            written.extend(batch)
+            flushed.set()
+
+        buffer = WriteBehindBuffer(sink, max_size=100, batch_size=3, interval=60)
+        buffer.put_many(range(3))
+        self.assertTrue(flushed.wait(5))
+        buffer.close()
+        self.assertEqual(written, [0, 1, 2])
+
+    def test_failed_batches_are_retried(self):
+        attempts = []
+
+        def flaky(batch):
+            attempts.append(list(batch))
+            if len(attempts) == 1:
+                raise RuntimeError("db down")
+
+        buffer = WriteBehindBuffer(flaky, batch_size=10, interval=0.01, autostart=False)
+        buffer.put_many([1, 2])
+        with self.assertLogs("dispositivos.buffer", level="ERROR"):
+            self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(attempts, [[1, 2], [1, 2]])
+
+    def test_persistent_failure_isolates_the_bad_row(self):
+        written = []
+
+        def sink(batch):
+            if 3 in batch:
+                raise ValueError("fk violation")
+            written.extend(batch)
+
+        buffer = WriteBehindBuffer(sink, batch_size=10, interval=0.01, max_retries=2, autostart=False)
+        buffer.put_many([1, 2, 3, 4, 5])
+        with self.assertLogs("dispositivos.buffer", level="ERROR") as logs:
+            self.assertEqual(buffer.flush(), 4)
+        self.assertEqual(sorted(written), [1, 2, 4, 5])
+        dead = [record for record in logs.records if record.name == "dispositivos.buffer.dead_letter"]
+        self.assertEqual(len(dead), 1)
+        self.assertIn("3", dead[0].getMessage())
+
+
+class DeviceTokenTestCase(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.organization = Organization.objects.create(name="Token Org", email="token@org.com")
+        category = Category.objects.create(name="Energía", organization=self.organization)
+        zone = Zone.objects.create(name="Zona Este", organization=self.organization)
+        self.device = Device.objects.create(
+            name="Medidor", category=category, zone=zone, reference="T-1", organization=self.organization
+        )
+        self.other = Device.objects.create(
+            name="Otro", category=category, zone=zone, reference="T-2", organization=self.organization
+        )
+        self.token, self.key = DeviceToken.issue(self.organization, device=self.device)
+
+    def _post(self, rows, key):
+        return self.client.post(
+            reverse('measurement_ingest'), data=json.dumps(rows), content_type="application/json",
+            HTTP_AUTHORIZATION=f"Token {key}",
+        )
+
+    def test_only_hash_is_stored(self):
+        self.assertNotEqual(self.token.key_hash, self.key)
+        self.assertEqual(self.token.key_hash, DeviceToken.hash_key(self.key))
+
+    def test_cache_hit_needs_no_queries(self):
+        identity = authenticate_token(self.key)
+        self.assertEqual(identity.device_id, self.device.pk)
+        self.assertEqual(identity.organization_id, self.organization.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(authenticate_token(self.key), identity)
+
+    def test_device_token_ingest_is_limited_to_its_device(self):
+        response = self._post([{"value": 1, "unit": "W"}, {"device": "T-2", "value": 2}], self.key)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["created"], 1)
+        self.assertEqual(response.json()["errors"][0]["errors"]["device"], "Unknown device.")
+        self.assertEqual(Measurement.objects.get().device, self.device)
+        self.assertEqual(self._post([{"value": 1}], "bogus").status_code, 401)
+
+    def test_soft_deleted_device_and_rotation_invalidate_cache(self):
+        self.assertIsNotNone(authenticate_token(self.key))
+        self.device.delete()
+        self.assertIsNone(authenticate_token(self.key))
+
+        gateway, key = DeviceToken.issue(self.organization, name="gateway")
+        self.assertIsNone(authenticate_token(key).device_id)
+        new_key = gateway.rotate()
+        self.assertIsNone(authenticate_token(key))
+        self.assertIsNotNone(authenticate_token(new_key))
+
+    def test_admin_status_actions_invalidate_tokens(self):
+        gateway, key = DeviceToken.issue(self.organization, name="gateway")
+        self.assertIsNotNone(authenticate_token(self.key))
+        self.assertIsNotNone(authenticate_token(key))
+        self.client.force_login(User.objects.create_superuser(username="root", password="testpass123"))
+        for model, pk in (("devicetoken", gateway.pk), ("device", self.device.pk)):
+            self.client.post(reverse(f"admin:dispositivos_{model}_changelist"), {
+                "action": "mark_inactive", "_selected_action": [pk],
+            })
+        self.assertIsNone(authenticate_token(key))
+        self.assertIsNone(authenticate_token(self.key))
+
+
+class MeasurementRollupTestCase(TestCase):
+    def setUp(self):
+        self.organization = Organization.objects.create(name="Rollup Org", email="rollup@org.com")
+        category = Category.objects.create(name="Temperatura", organization=self.organization)
+        zone = Zone.objects.create(name="Zona Central", organization=self.organization)
+        self.device = Device.objects.create(
+            name="Termómetro", category=category, zone=zone, reference="R-1", organization=self.organization
+        )
+        self.base = datetime(2025, 3, 1, 23, 58, tzinfo=dt_timezone.utc)
+
+    def _ingest(self, values, start=0):
+        rows = [
+            {"device": self.device.pk, "value": v, "date": (self.base + timedelta(minutes=i)).isoformat()}
+            for i, v in enumerate(values, start)
+        ]
+        ingest_rows(rows, self.organization.pk)
+
+    def _snapshot(self):
+        return sorted(
+            MeasurementRollup.objects.values_list("resolution", "bucket", "count", "sum", "min", "max", "last")
+        )
+
+    def test_incremental_rollups_match_rebuild(self):
+        self._ingest([1, 5, 3])
+        self._ingest([7], start=3)  # segundo lote: se fusiona con las ventanas existentes
+        day = MeasurementRollup.objects.get(resolution="1d", bucket=datetime(2025, 3, 2, tzinfo=dt_timezone.utc))
+        self.assertEqual((day.count, day.sum, day.min, day.max, day.last), (2, 10.0, 3.0, 7.0, 7.0))
+        self.assertEqual(MeasurementRollup.objects.filter(resolution="1m").count(), 4)
+
+        incremental = self._snapshot()
+        rollups.rebuild(device_ids=[self.device.pk])
+        self.assertEqual(self._snapshot(), incremental)
+
+    def test_summarize_uses_coarsest_buckets(self):
+        self._ingest([1, 5, 3, 7])
+        self.assertEqual(
+            [r for r, _, _ in rollups._cover(self.base, self.base + timedelta(days=2, hours=3))],
+            ["1m", "1m", "1h", "1d"],
+        )
+        summary = rollups.summarize([self.device.pk], self.base, self.base + timedelta(days=2))[self.device.pk]
+        self.assertEqual((summary["count"], summary["min"], summary["max"], summary["avg"]), (4, 1.0, 7.0, 4.0))
+        partial = rollups.summarize([self.device.pk], self.base + timedelta(minutes=2), self.base + timedelta(hours=1))
+        self.assertEqual(partial[self.device.pk]["count"], 2)
+
+    def test_edit_recomputes_day(self):
+        self._ingest([1, 5])
+        measurement = Measurement.objects.get(value=5)
+        measurement.value = 2
+        with self.captureOnCommitCallbacks(execute=True):  # el día se recalcula tras el commit
+            measurement.save()
+        minute = MeasurementRollup.objects.get(resolution="1m", bucket=self.base + timedelta(minutes=1))
+        self.assertEqual(minute.max, 2.0)
+        with self.captureOnCommitCallbacks(execute=True):
+            measurement.delete()
+        self.assertFalse(MeasurementRollup.objects.filter(resolution="1m", bucket=minute.bucket).exists())
+
+    def test_moving_a_reading_rebuilds_its_old_day(self):
+        self._ingest([1, 5])  # 23:58 y 23:59 del 1 de marzo
+        measurement = Measurement.objects.get(value=5)
+        measurement.date = self.base + timedelta(days=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            measurement.save()
+        first_day = MeasurementRollup.objects.get(resolution="1d", bucket=datetime(2025, 3, 1, tzinfo=dt_timezone.utc))
+        second_day = MeasurementRollup.objects.get(resolution="1d", bucket=datetime(2025, 3, 2, tzinfo=dt_timezone.utc))
+        self.assertEqual((first_day.count, first_day.max), (1, 1.0))
+        self.assertEqual((second_day.count, second_day.max), (1, 5.0))
+
+    def test_rebuild_commits_contiguous_day_chunks(self):
+        Row = namedtuple("Row", "date")
+        day = datetime(2025, 3, 1, 12, tzinfo=dt_timezone.utc)
+        fed, flushed = [], []
+        rollups.rebuild_in_chunks(
+            [Row(day), Row(day + timedelta(days=1)), Row(day + timedelta(days=10))], None, None,
+            fed.append, lambda lo, hi: flushed.append((lo, hi)), days=7,
+        )
+        self.assertEqual(len(fed), 3)
+        # El segundo tramo empieza donde terminó el primero: los días sin lecturas también se limpian
+        self.assertEqual(flushed, [(None, datetime(2025, 3, 8, tzinfo=dt_timezone.utc)),
+                                   (datetime(2025, 3, 8, tzinfo=dt_timezone.utc), None)])
+
+
+class OrganizationDenormalizationTestCase(TestCase):
+    def test_device_owned_rows_inherit_organization(self):
+        organization = Organization.objects.create(name="Tenant Org", email="tenant@org.com")
+        category = Category.objects.create(name="Ruido", organization=organization)
+        zone = Zone.objects.create(name="Zona Oeste", organization=organization)
+        device = Device.objects.create(name="Sonómetro", category=category, zone=zone, organization=organization)
+
+        measurement = Measurement.objects.create(device=device, value=70, unit="dB")
+        alert = Alert.objects.create(device=device, message="Ruido excesivo", level="ALTA")
+        self.assertEqual(measurement.organization, organization)
+        self.assertEqual(alert.organization, organization)
+        self.assertEqual(Measurement.objects.filter(organization=organization).count(), 1)
+
+
+@override_settings(MEASUREMENT_ARCHIVE_DIR=ARCHIVE_TEST_DIR)
+class MeasurementArchiveTestCase(TestCase):
+    def setUp(self):
+        self.addCleanup(shutil.rmtree, ARCHIVE_TEST_DIR, ignore_errors=True)
+        self.organization = Organization.objects.create(name="Archive Org", email="archive@org.com")
+        category = Category.objects.create(name="Presión", organization=self.organization)
+        zone = Zone.objects.create(name="Zona Norte", organization=self.organization)
+        self.device = Device.objects.create(name="Barómetro", category=category, zone=zone, organization=self.organization)
+        self.other = Device.objects.create(name="Otro", category=category, zone=zone, organization=self.organization)
+        self.old = datetime(2024, 1, 15, 12, tzinfo=dt_timezone.utc)
+        rows = [{"device": self.device.pk, "value": i, "unit": "Pa", "date": (self.old + timedelta(days=i)).isoformat()}
+                for i in range(40)]
+        rows.append({"device": self.other.pk, "value": 99, "unit": "hPa", "date": self.old.isoformat()})
+        ingest_rows(rows, self.organization.pk)
+        self.recent = Measurement.objects.create(device=self.device, value=1000, unit="Pa", date=timezone.now())
+
+    def test_archive_moves_old_rows_and_reads_are_merged(self):
+        call_command("archive_measurements", older_than_days=30, stdout=StringIO())
+        self.assertEqual(list(Measurement.all_objects.values_list("pk", flat=True)), [self.recent.pk])
+        self.assertEqual(sorted(os.listdir(os.path.join(ARCHIVE_TEST_DIR, str(self.organization.pk)))),
+                         ["2024-01.seg", "2024-02.seg"])
+
+        rows = list(archive.iter_measurement_rows(self.organization.pk, device_ids=[self.device.pk]))
+        self.assertEqual([r.value for r in rows], [float(i) for i in range(40)] + [1000.0])
+        self.assertEqual(rows[0].date, self.old)
+        self.assertEqual(rows[0].unit, "Pa")
+
+        window = list(archive.iter_measurement_rows(
+            self.organization.pk, start=self.old + timedelta(days=10), end=self.old + timedelta(days=20)
+        ))
+        self.assertEqual([r.value for r in window], [float(i) for i in range(10, 20)])
+
+        user = User.objects.create_user(username="archivist", password="testpass123")
+        UserProfile.objects.create(user=user, organization=self.organization)
+        self.client.login(username="archivist", password="testpass123")
+        response = self.client.get(
+            reverse('device_detail', args=[self.device.pk]), {"start": "2024-01-01", "end": "2024-01-31"}
+        )
+        self.assertEqual([m.value for m in response.context["measurements"]], [float(i) for i in range(16, -1, -1)])
+
+    def test_latest_rows_and_rollup_rebuild_read_the_archive(self):
+        call_command("archive_measurements", older_than_days=30, stdout=StringIO())
+        Measurement.objects.create(device=self.device, value=-1, unit="Pa", date=self.old + timedelta(hours=1))
+        latest = archive.latest_measurement_rows(self.organization.pk, end=self.old + timedelta(days=3),
+                                                 device_ids=[self.device.pk], limit=3)
+        self.assertEqual([r.value for r in latest], [2.0, 1.0, -1.0])
+
+        MeasurementRollup.objects.all().delete()
+        rollups.rebuild(device_ids=[self.device.pk], end=self.old + timedelta(days=1))
+        day = MeasurementRollup.objects.get(device=self.device, resolution="1d", bucket=archive.month_start(self.old) + timedelta(days=14))
+        self.assertEqual((day.count, day.min, day.last), (2, -1.0, -1.0))
+
+    def test_rerun_after_interrupted_delete_does_not_duplicate(self):
+        month = archive.month_start(self.old)
+        cutoff = timezone.now() - timedelta(days=30)
+        archive.archive_month(self.organization.pk, month, cutoff)
+        # Simula que la fila archivada sigue en la BD (caída antes del DELETE)
+        path = archive.segment_path(self.organization.pk, month)
+        with archive.Segment(path) as segment:
+            first = segment.read_all()
+        self.assertEqual(len(first), 18)
+        Measurement.all_objects.bulk_create([
+            Measurement(id=first.ids[0], device=self.device, value=0, unit="Pa", date=self.old,
+                        organization=self.organization)
+        ])
+        archive.archive_month(self.organization.pk, month, cutoff)
+        with archive.Segment(path) as segment:
+            self.assertEqual(len(segment.read_all()), 18)
+
+
+class KeysetPaginationTestCase(TestCase):
+    def setUp(self):
+        self.organization = Organization.objects.create(name="Paging Org", email="paging@org.com")
+        category = Category.objects.create(name="Humedad", organization=self.organization)
+        zone = Zone.objects.create(name="Zona Sur", organization=self.organization)
+        self.device = Device.objects.create(name="Higrómetro", category=category, zone=zone, organization=self.organization)
+        base = datetime(2025, 5, 1, tzinfo=dt_timezone.utc)
+        # Fechas repetidas: el desempate por id debe mantener el orden total
+        ingest_rows(
+            [{"device": self.device.pk, "value": i, "date": (base + timedelta(minutes=i // 2)).isoformat()}
+             for i in range(45)],
+            self.organization.pk,
+        )
+        user = User.objects.create_user(username="pager", password="testpass123")
+        UserProfile.objects.create(user=user, organization=self.organization)
+        self.client.login(username="pager", password="testpass123")
+
+    def test_paginator_walks_forward_and_back(self):
+        queryset = Measurement.objects.filter(organization=self.organization)
+        paginator = KeysetPaginator(queryset, ("-date", "-id"), 20)
+        expected = list(queryset.order_by("-date", "-id").values_list("pk", flat=True))
+
+        first = paginator.get_page()
+        second = paginator.get_page(first.next_cursor)
+        third = paginator.get_page(second.next_cursor)
+        self.assertEqual([m.pk for page in (first, second, third) for m in page], expected)
+        self.assertFalse(first.has_previous())
+        self.assertFalse(third.has_next())
+
+        back = paginator.get_page(third.previous_cursor)
+        self.assertEqual([m.pk for m in back], [m.pk for m in second])
+        self.assertEqual([m.pk for m in paginator.get_page("tampered")], [m.pk for m in first])
+
+    def test_measurement_list_uses_cursor_and_sort_whitelist(self):
+        response = self.client.get(reverse('measurement_list'), {"sort": "device__zone__name"})
+        self.assertEqual(response.context["sort_by"], "-date")
+        page = response.context["page_obj"]
+        self.assertEqual(len(page), 20)
+        response = self.client.get(reverse('measurement_list'), {"cursor": page.next_cursor})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context["page_obj"].has_previous())
+        self.assertContains(response, "cursor=")
+
+
+class ResultCountTestCase(TestCase):
+    def setUp(self):
+        caches["local"].clear()
+        self.organization = Organization.objects.create(name="Count Org", email="count@org.com")
+        category = Category.objects.create(name="Presión", organization=self.organization)
+        zone = Zone.objects.create(name="Zona Este", organization=self.organization)
+        self.device = Device.objects.create(name="Manómetro", category=category, zone=zone, organization=self.organization)
+        ingest_rows([{"device": self.device.pk, "value": i} for i in range(12)], self.organization.pk)
+
+    def test_exact_count_below_limit_is_cached(self):
+        queryset = Measurement.objects.filter(organization=self.organization)
+        self.assertEqual(count_queryset(queryset, exact_limit=100), ResultCount(12))
+        with self.assertNumQueries(0):
+            self.assertEqual(str(count_queryset(queryset, exact_limit=100)), "12")
+
+    def test_count_above_limit_is_bounded(self):
+        queryset = Measurement.objects.filter(organization=self.organization)
+        # SQLite no expone estimaciones del planificador: se informa "más de N"
+        result = count_queryset(queryset, exact_limit=5)
+        self.assertTrue(result.estimated)
+        self.assertEqual(str(result), "more than 5")
+        self.assertEqual(count_queryset(queryset.filter(value__lt=3), exact_limit=5), ResultCount(3))
+
+    @override_settings(COUNT_EXACT_LIMIT=5)
+    def test_paginator_pages_by_has_next_above_limit(self):
+        paginator = EstimatedCountPaginator(Measurement.objects.filter(organization=self.organization).order_by("id"), 5)
+        self.assertTrue(paginator.result_count.estimated)
+        second, last = paginator.page(2), paginator.page(3)
+        self.assertEqual((len(second), second.has_next(), second.end_index()), (5, True, 10))
+        self.assertEqual((len(last), last.has_next(), last.end_index()), (2, False, 12))
+        with self.assertRaises(EmptyPage):
+            paginator.page(4)
+        self.assertEqual(list(paginator.get_elided_page_range(2, on_each_side=1)), [1, 2, 3, paginator.ELLIPSIS])
+        self.assertEqual(list(paginator.get_elided_page_range(3, on_each_side=1)), [1, 2, 3])
+
+        small = EstimatedCountPaginator(Measurement.objects.filter(organization=self.organization, value__lt=3), 2)
+        self.assertEqual((small.count, small.num_pages), (3, 2))
+
+
+class DashboardSnapshotTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.organization = Organization.objects.create(name="Dash Org", email="dash@org.com")
+        self.category = Category.objects.create(name="Luz", organization=self.organization)
+        self.zone = Zone.objects.create(name="Zona Oeste", organization=self.organization)
+        self.device = Device.objects.create(name="Luxómetro", category=self.category, zone=self.zone, organization=self.organization)
+        ingest_rows([{"device": self.device.pk, "value": i} for i in range(3)], self.organization.pk)
+        Alert.objects.create(device=self.device, level="GRAVE", message="Sin luz")
+
+    def test_snapshot_is_cached_until_invalidated(self):
+        snapshot = dashboard.get_snapshot(self.organization.pk)
+        self.assertEqual(snapshot["alert_counts"], {"grave": 1, "alta": 0, "media": 0})
+        self.assertEqual(snapshot["devices"][0]["zone_name"], "Zona Oeste")
+        self.assertEqual(snapshot["zones_with_devices"][0]["device_count"], 1)
+        with self.assertNumQueries(0):
+            dashboard.get_snapshot(self.organization.pk)
+
+        Device.objects.create(name="Luxómetro 2", category=self.category, zone=self.zone, organization=self.organization)
+        self.assertEqual(len(dashboard.get_snapshot(self.organization.pk)["devices"]), 2)
+
+    @override_settings(DASHBOARD_MEASUREMENT_STALENESS=3600)
+    def test_measurements_respect_staleness_window(self):
+        dashboard.get_snapshot(self.organization.pk)
+        ingest_rows([{"device": self.device.pk, "value": 99}], self.organization.pk)
+        with self.assertNumQueries(0):
+            dashboard.get_snapshot(self.organization.pk)
+        with override_settings(DASHBOARD_MEASUREMENT_STALENESS=0):
+            latest = dashboard.get_snapshot(self.organization.pk)["latest_measurements"]
+        self.assertEqual(len(latest), 4)
+
+
+class ExcelExportTestCase(TestCase):
+    def setUp(self):
+        self.organization = Organization.objects.create(name="Export Org", email="export@org.com")
+        category = Category.objects.create(name="Agua", organization=self.organization)
+        zone = Zone.objects.create(name="Zona Norte", organization=self.organization)
+        self.meter = Device.objects.create(name="Caudalímetro", category=category, zone=zone, organization=self.organization)
+        self.other = Device.objects.create(name="Válvula", category=category, zone=zone, organization=self.organization)
+        base = datetime(2025, 3, 1, tzinfo=dt_timezone.utc)
+        ingest_rows(
+            [{"device": device.pk, "value": day, "unit": "m3", "date": (base + timedelta(days=day)).isoformat()}
+             for day in range(5) for device in (self.meter, self.other)],
+            self.organization.pk,
+        )
+        user = User.objects.create_user(username="exporter", password="testpass123")
+        UserProfile.objects.create(user=user, organization=self.organization)
+        self.client.login(username="exporter", password="testpass123")
+
+    def _rows(self, response):
+        self.assertEqual(response.status_code, 200)
+        workbook = load_workbook(BytesIO(b"".join(response.streaming_content)), read_only=True)
+        return [list(row) for row in workbook.active.iter_rows(values_only=True)]
+
+    def test_measurement_export_filters_by_device_and_range(self):
+        response = self.client.get(reverse('export_measurements'), {
+            "device": self.meter.pk, "start": "2025-03-02", "end": "2025-03-03",
+        })
+        rows = self._rows(response)
+        self.assertEqual(rows[0], ["Device", "Value", "Unit", "Date"])
+        self.assertEqual(rows[1:], [
+            ["Caudalímetro", 1, "m3", "2025-03-02 00:00:00"],
+            ["Caudalímetro", 2, "m3", "2025-03-03 00:00:00"],
+        ])
+
+    def test_rows_past_the_sheet_limit_continue_on_new_sheets(self):
+        fh = BytesIO()
+        self.assertEqual(exports.write_xlsx(fh, "Measurements", ["N"], ([n] for n in range(5)), rows_per_sheet=2), 5)
+        workbook = load_workbook(fh, read_only=True)
+        self.assertEqual(workbook.sheetnames, ["Measurements", "Measurements (2)", "Measurements (3)"])
+        self.assertEqual([[list(row) for row in sheet.iter_rows(values_only=True)] for sheet in workbook],
+                         [[["N"], [0], [1]], [["N"], [2], [3]], [["N"], [4]]])
+
+    def test_device_export_and_invalid_filters(self):
+        rows = self._rows(self.client.get(reverse('export_devices'), {"search": "Válv"}))
+        self.assertEqual(rows[1:], [["Válvula", "Agua", "Zona Norte", None, "ACTIVE"]])
+        response = self.client.get(reverse('export_measurements'), {"start": "ayer"})
+        self.assertRedirects(response, reverse('measurement_list'))
+
+
+class StreamingExportTestCase(TestCase):
+    def setUp(self):
+        self.organization = Organization.objects.create(name="Stream Org", email="stream@org.com")
+        category = Category.objects.create(name="Gas", organization=self.organization)
+        self.north = Zone.objects.create(name="Norte", organization=self.organization)
+        south = Zone.objects.create(name="Sur", organization=self.organization)
+        self.north_meter = Device.objects.create(name="Medidor N", category=category, zone=self.north, organization=self.organization)
+        self.south_meter = Device.objects.create(name="Medidor S", category=category, zone=south, organization=self.organization)
+        base = datetime(2025, 4, 1, tzinfo=dt_timezone.utc)
+        ingest_rows(
+            [{"device": device.pk, "value": i + 0.5, "unit": "m3", "date": (base + timedelta(hours=i)).isoformat()}
+             for i in range(3) for device in (self.north_meter, self.south_meter)],
+            self.organization.pk,
+        )
+        user = User.objects.create_user(username="streamer", password="testpass123")
+        UserProfile.objects.create(user=user, organization=self.organization)
+        self.client.login(username="streamer", password="testpass123")
+
+    def test_csv_export_filters_by_zone(self):
+        response = self.client.get(reverse('export_measurements_csv'), {"zone": self.north.pk})
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        rows = list(csv.reader(b"".join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(rows[0], ["device_id", "device", "date", "value", "unit"])
+        self.assertEqual([row[1] for row in rows[1:]], ["Medidor N"] * 3)
+        self.assertEqual(rows[1][2:], ["2025-04-01T00:00:00+00:00", "0.5", "m3"])
+
+    def test_ndjson_export_gzip_and_device_token_scope(self):
+        _, key = DeviceToken.issue(self.organization, device=self.south_meter)
+        self.client.logout()
+        response = self.client.get(
+            reverse('export_measurements_ndjson'), {"start": "2025-04-01", "end": "2025-04-01"},
+            HTTP_AUTHORIZATION=f"Token {key}", HTTP_ACCEPT_ENCODING="gzip, deflate",
+        )
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        lines = gzip.decompress(b"".join(response.streaming_content)).decode().splitlines()
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual({row["device_id"] for row in rows}, {self.south_meter.pk})
+        self.assertEqual(len(rows), 3)
+
+    def test_gzip_refused_with_q_zero(self):
+        response = self.client.get(reverse('export_measurements_csv'), HTTP_ACCEPT_ENCODING="gzip;q=0, identity")
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertTrue(b"".join(response.streaming_content).startswith(b"device_id"))
+        self.assertTrue(exports.accepts_gzip("deflate, *;q=0.5"))
+        self.assertFalse(exports.accepts_gzip("*, gzip;q=0"))
+
+    def test_live_rows_page_by_date_and_id(self):
+        # Dos lecturas por fecha: los bloques de 4 cortan entre filas con la misma fecha
+        with CaptureQueriesContext(connection) as queries:
+            rows = list(archive.iter_live_rows(self.organization.pk, chunk_size=4))
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(len(rows), 6)
+        self.assertEqual([row.value for row in rows], [0.5, 0.5, 1.5, 1.5, 2.5, 2.5])
+        self.assertEqual({row.device_id for row in rows[:2]}, {self.north_meter.pk, self.south_meter.pk})
+
+    def test_stream_export_rejects_bad_filters_and_anonymous(self):
+        self.assertEqual(self.client.get(reverse('export_measurements_csv'), {"zone": "x"}).status_code, 400)
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('export_measurements_csv')).status_code, 401)
+
+
+class ExportJobTestCase(TestCase):
+    def setUp(self):
+        self.export_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.export_root, ignore_errors=True)
+        settings_override = override_settings(EXPORT_ROOT=self.export_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.organization = Organization.objects.create(name="Jobs Org", email="jobs@org.com")
+        category = Category.objects.create(name="Vapor", organization=self.organization)
+        zone = Zone.objects.create(name="Caldera", organization=self.organization)
+        self.device = Device.objects.create(name="Termómetro", category=category, zone=zone, organization=self.organization)
+        ingest_rows([{"device": self.device.pk, "value": i} for i in range(7)], self.organization.pk)
+        user = User.objects.create_user(username="jobber", password="testpass123")
+        UserProfile.objects.create(user=user, organization=self.organization)
+        self.client.login(username="jobber", password="testpass123")
+
+    def test_job_lifecycle_and_download(self):
+        response = self.client.post(reverse('export_job_measurements'), {"format": "csv", "device": self.device.pk})
+        job = ExportJob.objects.get()
+        self.assertRedirects(response, reverse('export_job_detail', args=[job.pk]))
+        self.assertEqual(job.params, {"device": [str(self.device.pk)]})
+
+        self.assertEqual(jobs.claim_next_job().pk, job.pk)
+        job = jobs.run_job(ExportJob.objects.get(pk=job.pk))
+        self.assertEqual((job.state, job.rows_written, job.total_rows, job.progress), (ExportJob.DONE, 7, 7, 100))
+        self.assertTrue(job.file.path.startswith(self.export_root))
+
+        response = self.client.get(reverse('export_job_download', args=[job.pk]))
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], "device_id,device,date,value,unit")
+        self.assertEqual(len(lines), 8)
+        status = self.client.get(reverse('export_job_detail', args=[job.pk]), HTTP_ACCEPT="application/json").json()
+        self.assertEqual(status["state"], "DONE")
+        self.assertContains(self.client.get(reverse('export_job_detail', args=[job.pk])), "Descargar")
+
+    def test_identical_requests_are_deduplicated_until_data_changes(self):
+        first, created = jobs.request_export(self.organization.pk, "devices", "xlsx", {"search": "Term"})
+        self.assertTrue(created)
+        again, created = jobs.request_export(self.organization.pk, "devices", "xlsx", {"search": "Term"})
+        self.assertEqual((again.pk, created), (first.pk, False))
+        self.device.save()
+        _, created = jobs.request_export(self.organization.pk, "devices", "xlsx", {"search": "Term"})
+        self.assertTrue(created)
+
+        # Borrar o archivar mediciones también cambia la versión
+        measurement_job, _ = jobs.request_export(self.organization.pk, "measurements", "csv", {})
+        Measurement.objects.filter(device=self.device).order_by("id")[:1].get().hard_delete()
+        self.assertTrue(jobs.request_export(self.organization.pk, "measurements", "csv", {})[1])
+        Measurement.objects.filter(pk=Measurement.objects.order_by("id").values("id")[:1]).hard_delete()
+        self.assertTrue(jobs.request_export(self.organization.pk, "measurements", "csv", {})[1])
+        with override_settings(MEASUREMENT_ARCHIVE_DIR=self.export_root):
+            Measurement.objects.update(date=datetime(2024, 1, 5, tzinfo=dt_timezone.utc))
+            archive.archive_month(self.organization.pk, datetime(2024, 1, 1, tzinfo=dt_timezone.utc), timezone.now())
+        self.assertTrue(jobs.request_export(self.organization.pk, "measurements", "csv", {})[1])
+
+    def test_slots_serialize_claims_and_errors_are_generic(self):
+        for fmt in ("xlsx", "csv"):
+            jobs.request_export(self.organization.pk, "devices", fmt, {})
+        first = jobs.claim_next_job(max_concurrent=2)
+        self.assertEqual(first.slot, 0)
+        pending = ExportJob.objects.get(state=ExportJob.PENDING)
+        # Otro worker leyó los cupos a la vez y eligió el mismo: UNIQUE lo rechaza
+        with mock.patch.object(jobs, "_used_slots", return_value=set()):
+            self.assertIsNone(jobs.claim_next_job(max_concurrent=2))
+        self.assertEqual(ExportJob.objects.get(pk=pending.pk).state, ExportJob.PENDING)
+
+        pending.params = {"start": "2025-13-01"}
+        with self.assertLogs("dispositivos.jobs", "ERROR"):
+            failed = jobs.run_job(pending)
+        self.assertEqual(failed.state, ExportJob.FAILED)
+        self.assertNotIn("2025-13-01", failed.error)
+
+    def test_concurrency_cap_and_cleanup(self):
+        for fmt in ("xlsx", "csv"):
+            jobs.request_export(self.organization.pk, "devices", fmt, {})
+        running = jobs.claim_next_job(max_concurrent=1)
+        self.assertIsNone(jobs.claim_next_job(max_concurrent=1))
+        jobs.run_job(running)
+        path = ExportJob.objects.get(pk=running.pk).file.path
+        self.assertTrue(os.path.exists(path))
+
+        self.assertIsNone(ExportJob.objects.get(pk=running.pk).slot)
+
+        call_command("run_export_jobs", "--once", stdout=StringIO())
+        self.assertEqual(ExportJob.objects.filter(state=ExportJob.DONE).count(), 2)
+        self.assertEqual(jobs.cleanup_jobs(now=timezone.now() + timedelta(days=2)), 2)
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(ExportJob.objects.exists())
+
+
+class DownsamplingTestCase(SimpleTestCase):
+    def setUp(self):
+        self.t = np.arange(10000, dtype=np.float64)
+        self.v = np.sin(self.t / 500)
+        self.v[4321] = 50.0  # pico aislado
+
+    def test_lttb_keeps_endpoints_order_and_spike(self):
+        t, v = downsampling.lttb(self.t, self.v, 200)
+        self.assertEqual(len(t), 200)
+        self.assertEqual((t[0], t[-1]), (0, 9999))
+        self.assertTrue(np.all(np.diff(t) > 0))
+        self.assertIn(50.0, v)
+
+    def test_minmax_keeps_extremes_of_each_bucket(self):
+        t, v = downsampling.minmax(self.t, self.v, 100)
+        self.assertLessEqual(len(t), 100)
+        self.assertTrue(np.all(np.diff(t) > 0))
+        self.assertEqual(v.max(), 50.0)
+        self.assertAlmostEqual(v.min(), self.v.min())
+
+    def test_short_series_is_returned_unchanged(self):
+        t, v = downsampling.downsample(self.t[:10], self.v[:10], 500)
+        self.assertEqual(len(t), 10)
+
+
+class DeviceSeriesTestCase(TestCase):
+    def setUp(self):
+        self.organization = Organization.objects.create(name="Series Org", email="series@org.com")
+        category = Category.objects.create(name="Potencia", organization=self.organization)
+        zone = Zone.objects.create(name="Planta", organization=self.organization)
+        self.device = Device.objects.create(name="Medidor P", category=category, zone=zone, organization=self.organization)
+        base = datetime(2025, 6, 1, tzinfo=dt_timezone.utc)
+        ingest_rows(
+            [{"device": self.device.pk, "value": i % 60, "date": (base + timedelta(minutes=i)).isoformat()}
+             for i in range(3 * 24 * 60)],
+            self.organization.pk,
+        )
+        user = User.objects.create_user(username="charter", password="testpass123")
+        UserProfile.objects.create(user=user, organization=self.organization)
+        self.client.login(username="charter", password="testpass123")
+        self.url = reverse('device_series', args=[self.device.pk])
+        self.params = {"start": "2025-06-01", "end": "2025-06-03"}
+
+    def test_raw_series_is_bounded(self):
+        data = self.client.get(self.url, {**self.params, "points": 300}).json()
+        self.assertEqual(data["source"], "raw")
+        self.assertEqual(len(data["points"]), 300)
+        self.assertEqual(data["points"][0], [int(datetime(2025, 6, 1, tzinfo=dt_timezone.utc).timestamp() * 1000), 0.0])
+
+    def test_dense_range_reads_rollups(self):
+        with mock.patch.object(downsampling, "RAW_POINT_LIMIT", 100):
+            data = self.client.get(self.url, {**self.params, "points": 200, "method": "minmax"}).json()
+        # 72 horas -> 72 ventanas de 1h con mínimo y máximo cada una
+        self.assertEqual(data["source"], "rollup:1h")
+        self.assertEqual(len(data["points"]), 144)
+        self.assertEqual({y for _, y in data["points"]}, {0.0, 59.0})
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get(self.url, {"method": "fft"}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {"points": "many"}).status_code, 400)
+        self.client.logout()
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+
+class AnalyticsTestCase(TestCase):
+    def test_grouped_stats_match_numpy_per_group(self):
+        rng = np.random.default_rng(7)
+        devices = rng.integers(1, 6, size=5000)
+        times = rng.uniform(0, 86400, size=5000)
+        values = rng.normal(20, 5, size=5000)
+        stats = analytics.grouped_stats(devices, times, values)
+        for device_id in range(1, 6):
+            mask = devices == device_id
+            order = np.argsort(times[mask])
+            expected_rate = (values[mask][order[-1]] - values[mask][order[0]]) / ((times[mask][order[-1]] - times[mask][order[0]]) / 3600)
+            result = stats[device_id]
+            self.assertEqual(result["count"], mask.sum())
+            self.assertAlmostEqual(result["mean"], values[mask].mean())
+            self.assertAlmostEqual(result["std"], values[mask].std())
+            self.assertAlmostEqual(result["p95"], np.percentile(values[mask], 95))
+            self.assertAlmostEqual(result["max"], values[mask].max())
+            self.assertAlmostEqual(result["rate_per_hour"], expected_rate)
+
+    def test_device_stats_by_zone_and_benchmark_command(self):
+        organization = Organization.objects.create(name="Stats Org", email="stats@org.com")
+        category = Category.objects.create(name="Corriente", organization=organization)
+        east = Zone.objects.create(name="Este", organization=organization)
+        west = Zone.objects.create(name="Oeste", organization=organization)
+        east_device = Device.objects.create(name="Amperímetro E", category=category, zone=east, organization=organization)
+        west_device = Device.objects.create(name="Amperímetro O", category=category, zone=west, organization=organization)
+        now = timezone.now()
+        ingest_rows(
+            [{"device": device.pk, "value": value, "date": (now - timedelta(hours=4 - value)).isoformat()}
+             for device in (east_device, west_device) for value in range(5)],
+            organization.pk,
+        )
+        stats = analytics.device_stats(organization.pk, now - timedelta(days=1), now + timedelta(minutes=1), zone_id=east.pk)
+        self.assertEqual(list(stats), [east_device.pk])
+        self.assertEqual(stats[east_device.pk]["p50"], 2.0)
+        self.assertAlmostEqual(stats[east_device.pk]["rate_per_hour"], 1.0)
+
+        out = StringIO()
+        call_command("benchmark_analytics", "--organization", organization.pk, "--repeat", "1", stdout=out)
+        self.assertIn("2 devices, 10 measurements", out.getvalue())
+        self.assertNotIn("differ", out.getvalue())
+
+
+class EnergyConsumptionTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.organization = Organization.objects.create(name="Energy Org", email="energy@org.com")
+        self.category = Category.objects.create(name="Energía", organization=self.organization)
+        self.zone = Zone.objects.create(name="Nave 1", organization=self.organization)
+        self.meter = Device.objects.create(name="Medidor kWh", category=self.category, zone=self.zone, organization=self.organization)
+        self.inverter = Device.objects.create(name="Inversor", category=self.category, zone=self.zone, organization=self.organization)
+        self.base = datetime(2025, 7, 1, tzinfo=dt_timezone.utc)
+
+    def _ingest(self, device, readings, unit):
+        ingest_rows(
+            [{"device": device.pk, "value": value, "unit": unit, "date": (self.base + timedelta(minutes=minute)).isoformat()}
+             for minute, value in readings],
+            self.organization.pk,
+        )
+
+    def _hours(self, device):
+        return {
+            row.bucket.hour: round(row.kwh, 6)
+            for row in EnergyConsumption.objects.filter(device=device).order_by("bucket")
+        }
+
+    def test_cumulative_meter_is_split_across_hours_and_continues_between_batches(self):
+        self._ingest(self.meter, [(30, 100), (90, 106)], "kWh")
+        self.assertEqual(self._hours(self.meter), {0: 3.0, 1: 3.0})
+        # Siguiente lote: parte del cursor; el medidor se reinicia (baja a 2)
+        self._ingest(self.meter, [(120, 110), (150, 2)], "kWh")
+        self.assertEqual(self._hours(self.meter), {0: 3.0, 1: 7.0, 2: 2.0})
+        cursor = EnergyCursor.objects.get(device=self.meter)
+        self.assertEqual((cursor.kind, cursor.last_value), ("energy", 2.0))
+
+    def test_power_is_integrated_with_trapezoids_and_gaps_are_skipped(self):
+        self._ingest(self.inverter, [(0, 1000), (30, 3000), (60, 3000), (300, 3000)], "W")
+        # 0-30 min: (1+3)/2 kW * 0.5 h = 1 kWh; 30-60: 3 * 0.5 = 1.5; el hueco de 4 h no se integra
+        self.assertEqual(self._hours(self.inverter), {0: 2.5})
+        row = EnergyConsumption.objects.get(device=self.inverter)
+        self.assertEqual((row.zone_id, row.category_id, row.organization_id), (self.zone.pk, self.category.pk, self.organization.pk))
+
+    def test_device_with_meter_and_power_prefers_the_meter(self):
+        readings = [(0, 1000, "W"), (15, 1000, "W"), (30, 10, "kWh"), (45, 1000, "W"), (60, 10.5, "kWh")]
+        ingest_rows(
+            [{"device": self.inverter.pk, "value": value, "unit": unit, "date": (self.base + timedelta(minutes=minute)).isoformat()}
+             for minute, value, unit in readings],
+            self.organization.pk,
+        )
+        self._ingest(self.inverter, [(75, 1000)], "W")
+        self._ingest(self.inverter, [(90, 11)], "kWh")
+        # 0-15 min con potencia (1 kW * 0.25 h); desde el medidor solo sus diferencias
+        self.assertEqual(self._hours(self.inverter), {0: 0.75, 1: 0.5})
+        self.assertEqual(EnergyCursor.objects.get(device=self.inverter).kind, "energy")
+        call_command("rebuild_energy", "--organization", self.organization.pk, stdout=StringIO())
+        self.assertEqual(self._hours(self.inverter), {0: 0.75, 1: 0.5})
+
+    def test_rollups_rebuild_and_dashboard(self):
+        self._ingest(self.meter, [(0, 10), (60, 12)], "kWh")
+        self._ingest(self.inverter, [(0, 2), (60, 2)], "kW")
+        by_zone = energy.consumption(self.organization.pk, self.base, self.base + timedelta(days=1), group_by="zone")
+        self.assertEqual([(row["name"], row["kwh"]) for row in by_zone], [("Nave 1", 4.0)])
+
+        # Lectura atrasada: el incremental la ignora, rebuild_energy la incorpora
+        self._ingest(self.meter, [(30, 11.5)], "kWh")
+        self.assertEqual(self._hours(self.meter), {0: 2.0})
+        call_command("rebuild_energy", "--organization", self.organization.pk, stdout=StringIO())
+        self.assertEqual(self._hours(self.meter), {0: 2.0})
+        self.assertEqual(EnergyConsumption.objects.filter(device=self.meter).count(), 1)
+        self.assertEqual(EnergyCursor.objects.get(device=self.meter).last_value, 12.0)
+
+        EnergyConsumption.objects.create(
+            device=self.meter, organization=self.organization, zone=self.zone, category=self.category,
+            bucket=rollups.bucket_start(timezone.now(), "1h"), kwh=3.0,
+        )
+        snapshot = dashboard.build_snapshot(self.organization.pk)
+        self.assertEqual((snapshot["energy"]["today"], snapshot["energy"]["month"]), (3.0, 3.0))
+        self.assertEqual(snapshot["energy"]["by_category"], [{"name": "Energía", "kwh": 3.0}])
+
+
+class AnomalyDetectionTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        suppressor.clear()
+        self.organization = Organization.objects.create(name="Anomaly Org", email="anomaly@org.com")
+        self.category = Category.objects.create(name="Clima", organization=self.organization)
+        self.zone = Zone.objects.create(name="Invernadero", organization=self.organization)
+        self.sensor = Device.objects.create(name="Termómetro", category=self.category, zone=self.zone, organization=self.organization)
+        self.stable = Device.objects.create(name="Higrómetro", category=self.category, zone=self.zone, organization=self.organization)
+        self.meter = Device.objects.create(name="Medidor", category=self.category, zone=self.zone, organization=self.organization)
+        self.now = timezone.now()
+
+    def _ingest(self, device, readings, unit):
+        ingest_rows(
+            [{"device": device.pk, "value": value, "unit": unit, "date": (self.now - timedelta(minutes=ago)).isoformat()}
+             for ago, value in readings],
+            self.organization.pk,
+        )
+
+    def _detect(self, **kwargs):
+        return anomalies.detect(self.organization.pk, now=timezone.now() + timedelta(seconds=10), **kwargs)
+
+    def test_rolling_zscores_need_history_and_flag_spikes(self):
+        values = np.array([20.0, 20.5, 19.5, 20.2, 19.8] * 4 + [35.0])
+        z = anomalies.rolling_zscores(np.zeros(len(values), dtype=np.int64), values, window=10)
+        self.assertTrue(np.all(z[:10] == 0))
+        self.assertGreater(z[-1], 6)
+        self.assertTrue(np.all(np.abs(z[10:-1]) < 3))
+
+    def test_first_run_alerts_worst_reading_per_device_and_advances_watermark(self):
+        noise = [0.0, 0.4, -0.4, 0.2, -0.2, 0.1]
+        # 2 h de historia y la última hora como lecturas nuevas
+        self._ingest(self.sensor, [(120 - i * 2, 20 + noise[i % 6]) for i in range(55)] + [(5, 21.0), (2, 80.0)], "°C")
+        self._ingest(self.stable, [(120 - i * 2, 50 + noise[i % 6]) for i in range(60)], "%")
+        self._ingest(self.meter, [(120 - i * 2, 100 + i * 5) for i in range(60)], "kWh")
+        cache.set(dashboard._snapshot_key(self.organization.pk), {"built_at": 0})
+
+        result = self._detect()
+        self.assertEqual(len(result.alerts), 1)
+        alert = Alert.objects.get()
+        self.assertEqual((alert.device_id, alert.level, alert.organization_id), (self.sensor.pk, "GRAVE", self.organization.pk))
+        self.assertIn("80", alert.message)
+        self.assertIsNone(cache.get(dashboard._snapshot_key(self.organization.pk)))
+        watermark = AnomalyWatermark.objects.get(organization=self.organization)
+        self.assertEqual(watermark.last_measurement_id, Measurement.objects.latest("id").id)
+
+        # Sin lecturas nuevas no se examina nada; una lectura normal no genera alerta
+        self.assertEqual(self._detect().examined, 0)
+        self._ingest(self.stable, [(0, 50.1)], "%")
+        result = self._detect()
+        self.assertEqual((result.examined, len(result.alerts)), (1, 0))
+        self.assertEqual(Alert.objects.count(), 1)
+
+    def test_late_commits_are_examined_and_backfills_skipped(self):
+        noise = [0.0, 0.4, -0.4, 0.2, -0.2, 0.1]
+        self._ingest(self.sensor, [(120 - i * 2, 20 + noise[i % 6]) for i in range(60)], "°C")
+        self.assertEqual(self._detect().alerts, [])
+        last = AnomalyWatermark.objects.get(organization=self.organization).last_measurement_id
+
+        # Un backfill de hace días no se evalúa, pero el watermark lo saltea
+        self._ingest(self.sensor, [(3 * 24 * 60, 500.0)], "°C")
+        self.assertEqual(self._detect().examined, 0)
+        backfill = AnomalyWatermark.objects.get(organization=self.organization)
+        self.assertGreater(backfill.last_measurement_id, last)
+        last = backfill.last_measurement_id
+
+        # El id last+1 se confirma después que last+2: queda como hueco y se revisa
+        def reading(offset, value):
+            return Measurement(id=last + offset, device=self.sensor, organization=self.organization,
+                               value=value, unit="°C", date=self.now)
+        Measurement.all_objects.bulk_create([reading(2, 20.1)])
+        self.assertEqual(self._detect().examined, 1)
+        self.assertEqual(AnomalyWatermark.objects.get(organization=self.organization).gaps[0][:2], [last + 1, last + 1])
+        Measurement.all_objects.bulk_create([reading(1, 90.0)])
+        result = self._detect()
+        self.assertEqual((result.examined, len(result.alerts)), (1, 1))
+        self.assertEqual(AnomalyWatermark.objects.get(organization=self.organization).gaps, [])
+
+    def test_dry_run_and_command(self):
+        self._ingest(self.sensor, [(120 - i * 2, 20 + (i % 3) * 0.5) for i in range(58)] + [(1, 40.0)], "°C")
+        result = self._detect(dry_run=True)
+        self.assertEqual(len(result.alerts), 1)
+        self.assertFalse(Alert.objects.exists())
+        self.assertEqual(AnomalyWatermark.objects.get(organization=self.organization).last_measurement_id, 0)
+
+        out = StringIO()
+        with mock.patch("dispositivos.anomalies.SETTLE", timedelta(0)):
+            call_command("detect_anomalies", organization=[self.organization.pk], stdout=out)
+        self.assertIn("1 alerts", out.getvalue())
+        self.assertEqual(Alert.objects.get().device_id, self.sensor.pk)
+
+
+class AlertRuleTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        rules.rule_index.clear()
+        suppressor.clear()
+        self.organization = Organization.objects.create(name="Rules Org", email="rules@org.com")
+        self.category = Category.objects.create(name="Frío", organization=self.organization)
+        self.other_category = Category.objects.create(name="Oficina", organization=self.organization)
+        self.zone = Zone.objects.create(name="Cámara", organization=self.organization)
+        self.device = Device.objects.create(name="Cámara 1", category=self.category, zone=self.zone, organization=self.organization)
+        self.base = timezone.now() - timedelta(hours=1)
+
+    def _ingest(self, readings, unit="°C", device=None):
+        with self.captureOnCommitCallbacks(execute=True):  # las reglas se evalúan tras el commit
+            ingest_rows(
+                [{"device": (device or self.device).pk, "value": value, "unit": unit,
+                  "date": (self.base + timedelta(minutes=minute)).isoformat()} for minute, value in readings],
+                self.organization.pk,
+            )
+
+    def test_threshold_rule_by_category_fires_once_per_batch(self):
+        AlertRule.objects.create(name="Temperatura alta", category=self.category, threshold=8, level="ALTA")
+        self._ingest([(0, 5), (1, 9), (2, 12), (3, 4)])
+        alert = Alert.objects.get()
+        self.assertEqual((alert.device_id, alert.level, alert.organization_id), (self.device.pk, "ALTA", self.organization.pk))
+        self.assertIn("12", alert.message)
+        # Otra unidad no aplica cuando la regla la fija
+        AlertRule.objects.filter(name="Temperatura alta").update(unit="°C")
+        rules.bump_version()
+        self._ingest([(4, 50)], unit="%")
+        self.assertEqual(Alert.objects.count(), 1)
+
+    def test_rate_and_sustained_rules_keep_state_between_batches(self):
+        AlertRule.objects.create(name="Subida brusca", device=self.device, kind="RATE", threshold=2, level="GRAVE")
+        AlertRule.objects.create(
+            name="Puerta abierta", zone=self.zone, kind="SUSTAINED", threshold=6, duration_seconds=600, level="MEDIA",
+        )
+        self._ingest([(0, 4), (5, 5)])
+        self.assertFalse(Alert.objects.exists())
+        self._ingest([(10, 7), (15, 8)])  # +0.4/min: sin alerta de tasa; fuera de rango desde el minuto 10
+        self.assertFalse(Alert.objects.exists())
+        self._ingest([(20, 30)])  # +4.4/min y 10 minutos sobre 6
+        self.assertEqual(
+            sorted(Alert.objects.values_list("level", flat=True)), ["GRAVE", "MEDIA"],
+        )
+        self.assertIn("durante 10 min", Alert.objects.get(level="MEDIA").message)
+
+    def test_rule_state_is_shared_and_skips_rolled_back_batches(self):
+        AlertRule.objects.create(name="Subida brusca", device=self.device, kind="RATE", threshold=2, level="GRAVE")
+        self._ingest([(0, 4)])
+        # Un lote revertido no avanza la lectura de referencia
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    ingest_rows([{"device": self.device.pk, "value": 100, "unit": "°C",
+                                  "date": (self.base + timedelta(minutes=5)).isoformat()}], self.organization.pk)
+                    raise RuntimeError("rollback")
+            except RuntimeError:
+                pass
+        self.assertEqual(callbacks, [])
+        # Otro proceso (índice vacío) ve el mismo estado en la caché
+        rules.rule_index.clear()
+        self._ingest([(10, 40)])  # +3.6/min respecto del minuto 0
+        self.assertEqual(Alert.objects.get().level, "GRAVE")
+
+    @override_settings(WRITE_BEHIND_ENABLED=True)
+    def test_write_behind_queues_rule_alerts(self):
+        AlertRule.objects.create(name="Temperatura alta", category=self.category, threshold=8, level="ALTA")
+        alert_buffer = WriteBehindBuffer(signals.write_alerts, autostart=False)
+        with mock.patch.object(signals, "get_alert_buffer", return_value=alert_buffer):
+            self._ingest([(0, 12)])
+            self.assertFalse(Alert.objects.exists())
+            self.assertEqual(len(alert_buffer), 1)
+            self.assertEqual(alert_buffer.flush(), 1)
+        self.assertEqual(Alert.objects.get().level, "ALTA")
+
+    def test_index_refreshes_on_device_changes_and_evaluation_needs_no_queries(self):
+        AlertRule.objects.create(name="Oficina caliente", category=self.other_category, threshold=25)
+        self._ingest([(0, 30)])
+        self.assertFalse(Alert.objects.exists())
+
+        self.device.category = self.other_category
+        self.device.save()
+        readings = [Measurement(device_id=self.device.pk, organization_id=self.organization.pk,
+                                value=30, unit="°C", date=self.base + timedelta(minutes=i)) for i in range(1, 50)]
+        rules.rule_index.refresh()
+        with self.assertNumQueries(0):
+            alerts = rules.rule_index.evaluate(readings)
+        self.assertEqual(len(alerts), 1)
+
+        AlertRule.objects.get().delete()  # borrado lógico: save
+        self.assertEqual(rules.rule_index.evaluate(readings), [])
+
+
+class AlertSuppressionTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        rules.rule_index.clear()
+        suppressor.clear()
+        self.organization = Organization.objects.create(name="Flap Org", email="flap@org.com")
+        self.category = Category.objects.create(name="Puertas", organization=self.organization)
+        self.zone = Zone.objects.create(name="Depósito", organization=self.organization)
+        self.device = Device.objects.create(name="Sensor puerta", category=self.category, zone=self.zone, organization=self.organization)
+        self.rule = AlertRule.objects.create(name="Puerta abierta", device=self.device, threshold=0.5, level="ALTA")
+
+    def _alert(self, level="ALTA", rule=None):
+        return Alert(device_id=self.device.pk, organization_id=self.organization.pk, level=level,
+                     rule_id=rule.pk if rule else None, message="Puerta abierta")
+
+    def test_flapping_sensor_updates_one_alert(self):
+        base = timezone.now() - timedelta(minutes=30)
+        with self.captureOnCommitCallbacks(execute=True):
+            for minute in range(10):
+                ingest_rows([{"device": self.device.pk, "value": minute % 2, "unit": "",
+                              "date": (base + timedelta(minutes=minute)).isoformat()}], self.organization.pk)
+        self.assertEqual(Alert.objects.count(), 1)
+        self.assertEqual(suppressor.flush(), 1)
+        alert = Alert.objects.get()
+        self.assertEqual((alert.rule_id, alert.occurrences), (self.rule.pk, 5))
+        self.assertIsNotNone(alert.last_seen_at)
+
+    def test_keys_window_and_read_alerts(self):
+        now = timezone.now()
+        with self.captureOnCommitCallbacks(execute=True):
+            created = suppressor.submit([self._alert(rule=self.rule), self._alert(rule=self.rule), self._alert("GRAVE")], now=now)
+        self.assertEqual(len(created), 2)
+        self.assertEqual(Alert.objects.get(level="ALTA").occurrences, 2)
+
+        # Otro proceso (memoria vacía) encuentra la alerta abierta en la BD
+        suppressor.clear()
+        with self.assertNumQueries(1), self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(suppressor.submit([self._alert(rule=self.rule)], now=now + timedelta(minutes=1)), [])
+        suppressor.flush()
+        self.assertEqual(Alert.objects.get(level="ALTA").occurrences, 3)
+
+        # Fuera de la ventana se abre una alerta nueva
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(len(suppressor.submit([self._alert("GRAVE")], now=now + timedelta(minutes=20))), 1)
+
+        # Leída: el volcado la suelta y la siguiente repetición crea otra
+        with self.captureOnCommitCallbacks(execute=True):
+            suppressor.submit([self._alert(rule=self.rule)], now=now + timedelta(minutes=2))
+        Alert.objects.filter(level="ALTA").update(read=True)
+        self.assertEqual(suppressor.flush(), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(len(suppressor.submit([self._alert(rule=self.rule)], now=now + timedelta(minutes=3))), 1)
+        self.assertEqual(Alert.objects.filter(level="ALTA").count(), 2)
+
+    def test_rolled_back_alert_is_not_kept_open(self):
+        now = timezone.now()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    suppressor.submit([self._alert(rule=self.rule)], now=now)
+                    raise RuntimeError("rollback")
+            except RuntimeError:
+                pass
+        self.assertEqual(callbacks, [])
+        self.assertFalse(Alert.objects.exists())
+
+        # La repetición no se suma a una alerta inexistente: se crea
+        with self.captureOnCommitCallbacks(execute=True):
+            created = suppressor.submit([self._alert(rule=self.rule)], now=now + timedelta(minutes=1))
+        self.assertEqual(len(created), 1)
+        self.assertEqual(Alert.objects.get().occurrences, 1)
+
+
+class AlertInboxTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        suppressor.clear()
+        self.organization = Organization.objects.create(name="Inbox Org", email="inbox@org.com")
+        self.other = Organization.objects.create(name="Other Org", email="other@org.com")
+        category = Category.objects.create(name="Bombas", organization=self.organization)
+        zone = Zone.objects.create(name="Sala", organization=self.organization)
+        self.device = Device.objects.create(name="Bomba 1", category=category, zone=zone, organization=self.organization)
+        other_category = Category.objects.create(name="Bombas", organization=self.other)
+        other_zone = Zone.objects.create(name="Sala", organization=self.other)
+        self.other_device = Device.objects.create(name="Bomba X", category=other_category, zone=other_zone, organization=self.other)
+        self.user = User.objects.create_user(username="inbox", password="testpass123")
+        UserProfile.objects.create(user=self.user, organization=self.organization)
+        self.client.login(username="inbox", password="testpass123")
+
+    def _counts(self, organization=None):
+        counts = alerts.unread_counts((organization or self.organization).pk)
+        return counts["GRAVE"], counts["ALTA"], counts["MEDIA"]
+
+    def test_counters_follow_creates_reads_level_changes_and_deletes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            grave = Alert.objects.create(device=self.device, level="GRAVE", message="Sin presión")
+            alta = Alert.objects.create(device=self.device, level="ALTA", message="Vibración")
+            suppressor.submit([Alert(device_id=self.device.pk, organization_id=self.organization.pk, level="MEDIA", message="Ruido")])
+            Alert.objects.create(device=self.other_device, level="GRAVE", message="Otra organización")
+        self.assertEqual(self._counts(), (1, 1, 1))
+        self.assertEqual(alerts.unread_counts()["total"], 4)
+
+        alta = Alert.objects.get(pk=alta.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            alta.level = "GRAVE"
+            alta.save()
+            # Una lectura antes del commit guarda los valores viejos: el commit los invalida
+            self.assertEqual(self._counts(), (1, 1, 1))
+        self.assertEqual(self._counts(), (2, 0, 1))
+        with self.captureOnCommitCallbacks(execute=True):
+            alta.read = True
+            alta.save()
+            alta.save()  # sin cambios de estado: no descuenta dos veces
+        self.assertEqual(self._counts(), (1, 0, 1))
+        with self.captureOnCommitCallbacks(execute=True):
+            Alert.objects.get(pk=grave.pk).delete()  # borrado lógico
+        self.assertEqual(self._counts(), (0, 0, 1))
+        with self.captureOnCommitCallbacks(execute=True):
+            Alert.all_objects.filter(level="MEDIA").delete()
+        self.assertEqual(self._counts(), (0, 0, 0))
+
+        # Cacheado: el contador del menú no consulta la BD
+        with self.assertNumQueries(0):
+            self._counts()
+        AlertCounter.objects.update(unread=99)
+        with self.captureOnCommitCallbacks(execute=True):
+            alerts.rebuild_counters()
+        self.assertEqual(self._counts(), (0, 0, 0))
+        self.assertEqual(self._counts(self.other), (1, 0, 0))
+
+    def test_bulk_soft_delete_adjusts_counters(self):
+        for level in ("GRAVE", "ALTA", "ALTA", "MEDIA"):
+            Alert.objects.create(device=self.device, level=level, message="Fuga")
+        Alert.objects.filter(level="MEDIA").update(read=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            alerts.rebuild_counters()
+        self.assertEqual(self._counts(), (1, 2, 0))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(Alert.objects.for_org(self.organization).filter(level__in=["ALTA", "MEDIA"]).delete(), 3)
+        self.assertEqual(self._counts(), (1, 0, 0))
+        self.assertEqual(Alert.all_objects.filter(deleted_at__isnull=False).count(), 3)
+
+        # Acción "delete_selected" del admin
+        User.objects.create_superuser(username="root", password="testpass123")
+        self.client.login(username="root", password="testpass123")
+        grave = Alert.objects.get(level="GRAVE")
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse("admin:dispositivos_alert_changelist"), {
+                "action": "delete_selected", "_selected_action": [grave.pk], "post": "yes",
+            })
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Alert.objects.exists())
+        self.assertEqual(self._counts(), (0, 0, 0))
+        self.assertEqual(AlertCounter.objects.get(organization=self.organization, level="GRAVE").unread, 0)
+
+    def test_inbox_filters_paginates_and_marks_read_in_bulk(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(30):
+                Alert.objects.create(device=self.device, level="ALTA" if i % 3 else "GRAVE", message=f"Alerta {i}")
+            Alert.objects.create(device=self.other_device, level="GRAVE", message="Ajena")
+
+        response = self.client.get(reverse("alert_list"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["page_obj"]), 25)
+        self.assertTrue(response.context["page_obj"].has_next())
+        self.assertNotContains(response, "Ajena")
+        self.assertContains(response, '<span class="badge bg-danger">30</span>', html=True)
+
+        response = self.client.get(reverse("alert_list"), {"level": "GRAVE"})
+        page = response.context["page_obj"]
+        self.assertEqual(len(page), 10)
+        self.assertFalse(page.has_other_pages())
+
+        ids = [alert.pk for alert in page][:4]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse("alert_mark_read"), {"ids": ids, "level": "GRAVE"})
+        self.assertRedirects(response, reverse("alert_list") + "?level=GRAVE")
+        self.assertEqual(self._counts(), (6, 20, 0))
+        response = self.client.get(reverse("alert_list"), {"state": "unread", "level": "GRAVE"})
+        self.assertEqual(len(response.context["page_obj"]), 6)
+
+        # Todas las que coinciden con el filtro, en un solo UPDATE
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("alert_mark_read"), {"all": "1", "level": "ALTA"})
+        self.assertEqual(self._counts(), (6, 0, 0))
+        self.assertEqual(Alert.objects.filter(read=False, organization=self.other).count(), 1)
+        self.assertEqual(self._counts(self.other), (1, 0, 0))
+
+
+class TenantScopeTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.organization = Organization.objects.create(name="Scope Org", email="scope@org.com")
+        self.other = Organization.objects.create(name="Scope Other", email="scope-other@org.com")
+        for organization, name in ((self.organization, "Propio"), (self.other, "Ajeno")):
+            category = Category.objects.create(name="Sensores", organization=organization)
+            zone = Zone.objects.create(name="Planta", organization=organization)
+            device = Device.objects.create(name=name, category=category, zone=zone, organization=organization)
+            Measurement.objects.create(device=device, value="1.0", unit="V", date=timezone.now())
+            Alert.objects.create(device=device, level="GRAVE", message=f"Alerta {name}")
+        self.orphan = User.objects.create_user(username="orphan", password="testpass123")
+
+    def test_for_org_filters_and_none_is_empty(self):
+        self.assertEqual(list(Device.objects.for_org(self.organization).values_list("name", flat=True)), ["Propio"])
+        self.assertEqual(Device.objects.for_org(self.other.pk).get().name, "Ajeno")
+        self.assertFalse(Device.objects.for_org(None).exists())
+
+    @override_settings(DEBUG=True)
+    def test_unscoped_queries_raise_in_strict_mode(self):
+        token = tenancy.activate()
+        try:
+            with self.assertRaises(tenancy.UnscopedQueryError):
+                list(Device.objects.all())
+            with self.assertRaises(tenancy.UnscopedQueryError):
+                Measurement.objects.filter(unit="V").count()
+            with self.assertRaises(tenancy.UnscopedQueryError):
+                Alert.objects.exclude(organization=self.organization).exists()
+            self.assertEqual(Device.objects.for_org(self.organization).count(), 1)
+            self.assertEqual(Device.objects.unscoped().filter(name__startswith="A").count(), 1)
+            device = Device.objects.for_org(self.other).get()
+            self.assertEqual(Alert.objects.filter(device=device).count(), 1)  # acotada por la FK
+            self.assertEqual(Alert.objects.unscoped().aggregate(total=Count("id"))["total"], 2)
+        finally:
+            tenancy.deactivate(token)
+        self.assertEqual(Device.objects.count(), 2)  # fuera de una vista no hay guardia
+
+    @override_settings(DEBUG=True)
+    def test_users_without_organization_see_nothing(self):
+        self.client.login(username="orphan", password="testpass123")
+        response = self.client.get(reverse("dashboard"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["devices"], [])
+        response = self.client.get(reverse("alert_list"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["page_obj"]), 0)
+        self.assertEqual(response.context["counts"]["total"], 0)
+        self.assertNotContains(response, "Alerta Ajeno")
+
+    def test_admin_changelists_are_scoped(self):
+        admin = User.objects.create_superuser(username="root", password="testpass123")
+        staff = User.objects.create_user(username="staff", password="testpass123", is_staff=True)
+        staff.user_permissions.add(*Permission.objects.filter(codename__in=["view_device", "view_exportjob"]))
+        UserProfile.objects.create(user=staff, organization=self.organization)
+        for user, names in ((admin, ["Propio", "Ajeno"]), (staff, ["Propio"])):
+            self.client.force_login(user)
+            response = self.client.get(reverse("admin:dispositivos_device_changelist"))
+            self.assertEqual(sorted(device.name for device in response.context["cl"].result_list), sorted(names))
+            self.assertEqual(self.client.get(reverse("admin:dispositivos_exportjob_changelist")).status_code, 200)
+
+    def test_admin_foreign_key_choices_are_scoped(self):
+        admin = User.objects.create_superuser(username="root", password="testpass123")
+        staff = User.objects.create_user(username="staff", password="testpass123", is_staff=True)
+        staff.user_permissions.add(*Permission.objects.filter(codename__in=["add_devicetoken", "add_alertrule", "add_category", "add_zone"]))
+        UserProfile.objects.create(user=staff, organization=self.organization)
+        for user, devices, organizations in ((admin, ["Ajeno", "Propio"], 2), (staff, ["Propio"], 1)):
+            self.client.force_login(user)
+            form = self.client.get(reverse("admin:dispositivos_devicetoken_add")).context["adminform"].form
+            self.assertEqual(sorted(device.name for device in form.fields["device"].queryset), devices)
+            self.assertEqual(form.fields["organization"].queryset.count(), organizations)
+            form = self.client.get(reverse("admin:dispositivos_alertrule_add")).context["adminform"].form
+            self.assertEqual(sorted(device.name for device in form.fields["device"].queryset), devices)
+            self.assertEqual(form.fields["zone"].queryset.count(), len(devices))
+            for model in ("category", "zone"):
+                form = self.client.get(reverse(f"admin:dispositivos_{model}_add")).context["adminform"].form
+                self.assertEqual(form.fields["organization"].queryset.count(), organizations)
+
+
+class FragmentCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        fragments.stats.clear()
+        self.organization = Organization.objects.create(name="Fragment Org", email="fragment@org.com")
+        category = Category.objects.create(name="Medidores", organization=self.organization)
+        zone = Zone.objects.create(name="Bodega", organization=self.organization)
+        self.device = Device.objects.create(name="Medidor A", category=category, zone=zone, organization=self.organization)
+        self.user = User.objects.create_user(username="fragments", password="testpass123")
+        self.user.groups.add(Group.objects.create(name="Admin"))
+        UserProfile.objects.create(user=self.user, organization=self.organization)
+        self.client.login(username="fragments", password="testpass123")
+
+    def _stats(self):
+        return {row["name"]: (row["hits"], row["misses"]) for row in fragments.stats.snapshot()}
+
+    def test_unchanged_fragments_are_served_from_cache(self):
+        with CaptureQueriesContext(connection) as first:
+            self.assertContains(self.client.get(reverse("device_list")), "Medidor A")
+        with CaptureQueriesContext(connection) as second:
+            self.assertContains(self.client.get(reverse("device_list")), "Medidor A")
+        self.assertEqual(self._stats()["device_grid"], (1, 1))
+        self.assertEqual(self._stats()["device_categories"], (1, 1))
+        self.assertLess(len(second), len(first))  # ni la página ni las categorías se consultan
+
+        # Otra página/filtro es otra variante del fragmento
+        self.client.get(reverse("device_list"), {"sort": "-created_at"})
+        self.assertEqual(self._stats()["device_grid"], (1, 2))
+
+    def test_model_changes_bump_the_data_version(self):
+        self.client.get(reverse("dashboard"))
+        self.device.name = "Medidor B"
+        self.device.save()
+        response = self.client.get(reverse("dashboard"))
+        self.assertContains(response, "Medidor B")
+        self.assertEqual(self._stats()["dashboard_catalog"], (0, 2))
+
+        version = fragments.data_version(self.organization.pk)
+        Device.objects.filter(pk=self.device.pk).update(name="Medidor C")  # sin señales: no cambia
+        self.assertEqual(fragments.data_version(self.organization.pk), version)
+        self.assertContains(self.client.get(reverse("dashboard")), "Medidor B")
+
+    def test_admin_dashboard_reports_hit_rates(self):
+        self.client.get(reverse("device_list"))
+        self.client.get(reverse("device_list"))
+        response = self.client.get(reverse("admin_dashboard"))
+        self.assertEqual(response.context["fragment_stats"][1], {"name": "device_grid", "hits": 1, "misses": 1, "hit_rate": 0.5})
+        self.assertContains(response, "<td>50%</td>", html=True)
+
+
+class CacheInstrumentationTestCase(TestCase):
+    def test_locmem_counts_hits_misses_and_evictions(self):
+        backend = InstrumentedLocMemCache("instrumentation-test", {"OPTIONS": {"MAX_ENTRIES": 4, "CULL_FREQUENCY": 2}})
+        backend.clear()
+        backend.stats.clear()
+        backend.set("a", 1)
+        self.assertEqual(backend.get("a"), 1)
+        self.assertIsNone(backend.get("missing"))
+        self.assertEqual(backend.get_many(["a", "missing"]), {"a": 1})
+        backend.incr("a")  # lectura interna: no se cuenta
+        for i in range(6):
+            backend.set(f"k{i}", i)
+        stats = backend.stats.snapshot()
+        self.assertEqual((stats["hits"], stats["misses"], stats["gets"], stats["sets"]), (2, 2, 3, 7))
+        self.assertEqual(stats["hit_rate"], 0.5)
+        self.assertGreater(stats["evictions"], 0)
+        self.assertIsNotNone(stats["avg_get_ms"])
+
+    def test_file_based_cache_counts_evictions(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        backend = InstrumentedFileBasedCache(directory, {"OPTIONS": {"MAX_ENTRIES": 3, "CULL_FREQUENCY": 3}})
+        for i in range(5):
+            backend.set(f"k{i}", i)
+        self.assertEqual(backend.get("k4"), 4)
+        stats = backend.stats.snapshot()
+        self.assertEqual((stats["hits"], stats["sets"]), (1, 5))
+        self.assertGreater(stats["evictions"], 0)
+
+    def test_admin_dashboard_reports_cache_stats(self):
+        user = User.objects.create_user(username="cache-admin", password="testpass123")
+        user.groups.add(Group.objects.create(name="Admin"))
+        self.client.login(username="cache-admin", password="testpass123")
+        response = self.client.get(reverse("admin_dashboard"))
+        self.assertEqual([row["alias"] for row in response.context["cache_stats"]], ["default", "local"])
+        self.assertGreater(response.context["cache_stats"][0]["gets"], 0)  # permisos del usuario
+        self.assertContains(response, "InstrumentedFileBasedCache")
@@ -11,10 +11,20 @@ urlpatterns = [
     path('devices/<int:pk>/update/', views.device_update, name='device_update'),
     path('devices/<int:pk>/delete/', views.device_delete, name='device_delete'),
     path('devices/<int:pk>/', views.device_detail, name='device_detail'),
+    path('api/devices/<int:pk>/series/', views.device_series, name='device_series'),
     path('measurements/', views.measurement_list, name='measurement_list'),
     path('measurements/create/', views.measurement_create, name='measurement_create'),
+    path('api/measurements/ingest/', views.measurement_ingest, name='measurement_ingest'),
     path('measurements/<int:pk>/update/', views.measurement_update, name='measurement_update'),
     path('measurements/<int:pk>/delete/', views.measurement_delete, name='measurement_delete'),
+    path('alerts/', views.alert_list, name='alert_list'),
+    path('alerts/mark-read/', views.alert_mark_read, name='alert_mark_read'),
     path('export/measurements/', views.export_measurements_excel, name='export_measurements'),
     path('export/devices/', views.export_devices_excel, name='export_devices'),
+    path('export/measurements/csv/', views.export_measurements_stream, {'fmt': 'csv'}, name='export_measurements_csv'),
+    path('export/measurements/ndjson/', views.export_measurements_stream, {'fmt': 'ndjson'}, name='export_measurements_ndjson'),
+    path('export/jobs/measurements/', views.export_job_create, {'kind': 'measurements'}, name='export_job_measurements'),
+    path('export/jobs/devices/', views.export_job_create, {'kind': 'devices'}, name='export_job_devices'),
+    path('export/jobs/<int:pk>/', views.export_job_detail, name='export_job_detail'),
+    path('export/jobs/<int:pk>/download/', views.export_job_download, name='export_job_download'),
 ]
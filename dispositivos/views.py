@@ -10,15 +10,11 @@ from django.db.models import Count
 from datetime import timedelta
 from django.utils import timezone
 from django.shortcuts import render
-from usuarios.decorators import admin_required, manager_required, editor_required, reader_required
-import openpyxl
-from openpyxl.styles import Font, Alignment
+from usuarios.decorators import admin_required, manager_required, editor_required, reader_required, module_required
 from django.http import HttpResponse
-from django.contrib.auth.decorators import user_passes_test
 from django.contrib import messages
 from django.core.paginator import Paginator
 from django.db.models import Q
-import openpyxl
 from django.http import HttpResponse
 from django.template.loader import get_template
 from django.contrib.auth.models import User
@@ -30,88 +26,127 @@ from django.utils import timezone
 from datetime import timedelta
 from django.db.models import Count
 from dispositivos.models import Zone, Device, Category, Alert, Measurement
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from .ingest import (
+    parse_payload, ingest_rows, PayloadError, MAX_ROWS_PER_REQUEST,
+    JSON_CONTENT_TYPES, NDJSON_CONTENT_TYPES,
+)
+from .buffer import BufferFull, get_measurement_buffer, write_behind_enabled
+from .auth import authenticate_token, get_request_token
+from . import downsampling, rollups
+from .pagination import KeysetPaginator
+from .counting import count_queryset
+from .dashboard import get_snapshot as dashboard_snapshot
+from .archive import latest_measurement_rows
+from .exports import (
+    parse_filters, ExportFilterError, iter_measurement_export_rows, iter_device_export_rows,
+    write_xlsx, XLSX_CONTENT_TYPE, MEASUREMENT_HEADERS, DEVICE_HEADERS,
+    stream_csv, stream_ndjson, accepts_gzip, gzip_stream, CSV_CONTENT_TYPE, NDJSON_CONTENT_TYPE,
+)
+from django.http import FileResponse, Http404, StreamingHttpResponse
+from .jobs import request_export
+from .alerts import empty_counts, mark_read as mark_alerts_read, unread_counts
+from django.urls import reverse
+from urllib.parse import urlencode
+from .models import ExportJob
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.http import require_GET
+import tempfile
+from datetime import datetime, time
+from django.utils.dateparse import parse_date
+from django.utils.functional import SimpleLazyObject
+from . import fragments
+from monitoreo.cache import cache_stats
+
+# Ordenamientos permitidos -> clave keyset respaldada por índice
+DEVICE_SORTS = {
+    'name': ('name', 'id'),
+    '-created_at': ('-created_at', '-id'),
+    'created_at': ('created_at', 'id'),
+}
+MEASUREMENT_SORTS = {
+    '-date': ('-date', '-id'),
+    'date': ('date', 'id'),
+}
+ALERT_ORDERING = ('-created_at', '-id')
+ALERT_STATES = {'unread': False, 'read': True}
+
+DETAIL_MAX_ROWS = 500
+DETAIL_DEFAULT_DAYS = 30
+
+SUMMARY_PERIODS = [
+    ('Últimas 24 horas', timedelta(hours=24)),
+    ('Últimos 30 días', timedelta(days=30)),
+    ('Último año', timedelta(days=365)),
+]
+from django.conf import settings
+
+
+def _date_range(request, default_days=None):
+    """Rango [start, end) desde los parámetros GET start/end (YYYY-MM-DD, end inclusive)."""
+    def parse(name):
+        value = request.GET.get(name)
+        day = parse_date(value) if value else None
+        return timezone.make_aware(datetime.combine(day, time.min)) if day else None
+
+    try:
+        start, end = parse('start'), parse('end')
+    except ValueError:
+        start = end = None
+    if end is not None:
+        end += timedelta(days=1)
+    if start is None and default_days is not None:
+        start = (end or timezone.now()) - timedelta(days=default_days)
+    return start, end
 
 
+def _organization_or_404(request):
+    """``request.organization`` (ver ``usuarios.middleware``); 404 si el usuario no tiene organización."""
+    if request.organization is None:
+        raise Http404('User has no organization.')
+    return request.organization
+
 
 @login_required
 def dashboard(request):
-    # Intentar obtener la organización del usuario
-    organization = getattr(getattr(request.user, "userprofile", None), "organization", None)
-
-    if not organization:
-        zones = Zone.objects.all()
-        devices = Device.objects.all()
-        categories = Category.objects.all()
-        alerts = Alert.objects.all()
-        measurements = Measurement.objects.all()
-    else:
-        zones = Zone.objects.filter(organization=organization)
-        devices = Device.objects.filter(organization=organization)
-        categories = Category.objects.filter(organization=organization)
-        alerts = Alert.objects.filter(device__organization=organization)
-        measurements = Measurement.objects.filter(device__organization=organization)
-
-    # 🔹 Zonas con cantidad de dispositivos
-    zones_with_devices = zones.annotate(device_count=Count('devices')).order_by('-device_count')
-
-    # 🔹 Alertas de la última semana
-    week_ago = timezone.now() - timedelta(days=7)
-    alerts_week = alerts.filter(created_at__gte=week_ago)
-    alert_counts = {
-        'grave': alerts_week.filter(level='GRAVE').count(),
-        'alta': alerts_week.filter(level='ALTA').count(),
-        'media': alerts_week.filter(level='MEDIA').count(),
-    }
-
-    # 🔹 Últimas 10 mediciones (con fecha, dispositivo, valor)
-    latest_measurements = measurements.select_related('device').order_by('-date')[:10]
+    organization = request.organization
 
-    context = {
-        'zones_with_devices': zones_with_devices,
-        'devices': devices,
-        'categories': categories,
-        'alert_counts': alert_counts,
-        'latest_measurements': latest_measurements,
-    }
+    # 🔹 Zonas, alertas de la semana, categorías, dispositivos y últimas mediciones (en caché)
+    context = dashboard_snapshot(organization.pk if organization else None)
     return render(request, 'dashboard.html', context)
 
 @login_required
 def device_list(request):
-    try:
-        organization = request.user.userprofile.organization
-        if not hasattr(organization, 'pk'):
-            organization = None
-    except:
-        organization = None
+    organization = request.organization
 
     category_filter = request.GET.get('category')
     search_query = request.GET.get('search')
     sort_by = request.GET.get('sort', 'name')
-
-    if organization:
-        devices = Device.objects.filter(organization=organization)
-        if category_filter:
-            devices = devices.filter(category__id=category_filter)
-        if search_query:
-            devices = devices.filter(
-                Q(name__icontains=search_query) |
-                Q(reference__icontains=search_query) |
-                Q(category__name__icontains=search_query) |
-                Q(zone__name__icontains=search_query)
-            )
-        devices = devices.order_by(sort_by)
-        categories = Category.objects.filter(organization=organization)
-    else:
-        devices = Device.objects.none()
-        categories = Category.objects.none()
-
-    # Pagination
-    paginator = Paginator(devices, 10)  # Show 10 devices per page
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    if sort_by not in DEVICE_SORTS:
+        sort_by = 'name'
+
+    # for_org(None) devuelve un queryset vacío: sin organización no se ve nada
+    devices = Device.objects.for_org(organization).select_related('category', 'zone')
+    if category_filter:
+        devices = devices.filter(category__id=category_filter)
+    if search_query:
+        devices = devices.filter(
+            Q(name__icontains=search_query) |
+            Q(reference__icontains=search_query) |
+            Q(category__name__icontains=search_query) |
+            Q(zone__name__icontains=search_query)
+        )
+    categories = Category.objects.for_org(organization)
+
+    # Pagination por cursor: la página N cuesta lo mismo que la primera
+    paginator = KeysetPaginator(devices, DEVICE_SORTS[sort_by], 10)  # Show 10 devices per page
+    # Perezosa: si el fragmento "device_grid" está en caché no se consulta la página
+    page_obj = SimpleLazyObject(lambda: paginator.get_page(request.GET.get('cursor')))
 
     contexto = {
         'page_obj': page_obj,
+        'total_count': count_queryset(devices),
         'categories': categories,
         'selected_category': category_filter,
         'search_query': search_query,
@@ -125,29 +160,72 @@ def panel(request):
 
 @login_required
 def device_detail(request, pk):
-    try:
-        organization = request.user.userprofile.organization
-        if not hasattr(organization, 'pk'):
-            organization = None
-    except:
-        organization = None
+    organization = request.organization
 
     if organization:
-        device = get_object_or_404(Device, id=pk, organization=organization)
-        measurements = Measurement.objects.filter(device=device).order_by('-date')
-        alerts = Alert.objects.filter(device=device).order_by('-created_at')
+        device = get_object_or_404(Device.objects.for_org(organization), pk=pk)
+        # Lecturas del rango (archivo + BD); se muestran las más recientes primero
+        start, end = _date_range(request, default_days=DETAIL_DEFAULT_DAYS)
+        measurements = latest_measurement_rows(organization.pk, start, end, device_ids=[device.pk], limit=DETAIL_MAX_ROWS)
+        alerts = Alert.objects.for_org(organization).filter(device=device).order_by('-created_at')
+        # Resúmenes desde los rollups: costo constante sin importar el volumen crudo
+        now = timezone.now()
+        summaries = [
+            (label, rollups.summarize([device.pk], now - span, now)[device.pk])
+            for label, span in SUMMARY_PERIODS
+        ]
     else:
         device = None
         measurements = []
         alerts = []
+        summaries = []
+        start = end = None
 
     contexto = {
         'device': device,
         'measurements': measurements,
         'alerts': alerts,
+        'summaries': summaries,
+        'start': start,
+        'end': end - timedelta(days=1) if end else None,
+        'max_rows': DETAIL_MAX_ROWS,
     }
     return render(request, "device_detail.html", contexto)
 
+@require_GET
+def device_series(request, pk):
+    """Serie reducida (JSON) de un dispositivo para gráficos: como máximo ``points`` puntos.
+
+    Parámetros: start/end (YYYY-MM-DD), points y method (``lttb`` o ``minmax``).
+    """
+    organization_id, device_id, error = _api_identity(request)
+    if error:
+        return error
+    if device_id is not None and device_id != pk:
+        return JsonResponse({'error': 'Token not valid for this device.'}, status=403)
+    device = get_object_or_404(Device, id=pk, organization_id=organization_id)
+
+    method = request.GET.get('method', 'lttb')
+    if method not in downsampling.METHODS:
+        return JsonResponse({'error': f'method must be one of {", ".join(downsampling.METHODS)}.'}, status=400)
+    try:
+        points = int(request.GET.get('points', downsampling.DEFAULT_POINTS))
+    except ValueError:
+        return JsonResponse({'error': 'points must be an integer.'}, status=400)
+    points = max(3, min(points, downsampling.MAX_POINTS))
+    start, end = _date_range(request, default_days=DETAIL_DEFAULT_DAYS)
+    end = end or timezone.now()
+
+    t, v, source = downsampling.load_series(organization_id, device.pk, start, end, points, method)
+    return JsonResponse({
+        'device': device.pk,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'method': method,
+        'source': source,
+        'points': [[int(ts * 1000), value] for ts, value in zip(t.tolist(), v.tolist())],
+    })
+
 from django.shortcuts import redirect
 
 def home(request):
@@ -158,35 +236,37 @@ def home(request):
 
 @login_required
 def measurement_list(request):
-    try:
-        organization = request.user.userprofile.organization
-        if not hasattr(organization, 'pk'):
-            organization = None
-    except:
-        organization = None
+    organization = request.organization
 
     search_query = request.GET.get('search')
     sort_by = request.GET.get('sort', '-date')
-
-    if organization:
-        measurements = Measurement.objects.filter(device__organization=organization).select_related('device').order_by(sort_by)
-        if search_query:
-            measurements = measurements.filter(
-                Q(device__name__icontains=search_query) |
-                Q(value__icontains=search_query) |
-                Q(unit__icontains=search_query)
-            )
-    else:
-        measurements = Measurement.objects.none()
-
-    # Pagination
-    paginator = Paginator(measurements, 20)  # Show 20 measurements per page
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    if sort_by not in MEASUREMENT_SORTS:
+        sort_by = '-date'
+
+    start, end = _date_range(request)
+
+    measurements = Measurement.objects.for_org(organization).select_related('device')
+    if start:
+        measurements = measurements.filter(date__gte=start)
+    if end:
+        measurements = measurements.filter(date__lt=end)
+    if search_query:
+        measurements = measurements.filter(
+            Q(device__name__icontains=search_query) |
+            Q(value__icontains=search_query) |
+            Q(unit__icontains=search_query)
+        )
+
+    # Pagination por cursor: la página N cuesta lo mismo que la primera
+    paginator = KeysetPaginator(measurements, MEASUREMENT_SORTS[sort_by], 20)  # Show 20 measurements per page
+    page_obj = paginator.get_page(request.GET.get('cursor'))
 
     contexto = {
         'page_obj': page_obj,
+        'total_count': count_queryset(measurements),
         'search_query': search_query,
+        'start': start,
+        'end': end - timedelta(days=1) if end else None,
         'sort_by': sort_by,
     }
     return render(request, "measurement_list.html", contexto)
@@ -197,77 +277,104 @@ def inicio(request):
     else:
         return redirect('login')
 
-# Role-based access decorators
-def admin_required(view_func):
-    return user_passes_test(lambda u: u.groups.filter(name='Admin').exists())(view_func)
-
-def manager_required(view_func):
-    return user_passes_test(lambda u: u.groups.filter(name='Admin').exists() or u.groups.filter(name='Manager').exists())(view_func)
-
-
 @admin_required
 def admin_dashboard(request):
-    # Admin specific dashboard
+    # Admin specific dashboard: agregados de todas las organizaciones (opt-in con unscoped())
     total_users = User.objects.count()
-    total_devices = Device.objects.count()
-    total_measurements = Measurement.objects.count()
-    total_alerts = Alert.objects.count()
+    total_devices = Device.objects.unscoped().count()
+    total_measurements = Measurement.objects.unscoped().count()
+    total_alerts = Alert.objects.unscoped().count()
 
     contexto = {
         'total_users': total_users,
         'total_devices': total_devices,
         'total_measurements': total_measurements,
         'total_alerts': total_alerts,
+        'fragment_stats': fragments.stats.snapshot(),
+        'cache_stats': cache_stats(),
     }
     return render(request, "admin_dashboard.html", contexto)
 
+def _alert_queryset(organization, params):
+    """Alertas de la organización filtradas por nivel y estado (leídas/no leídas)."""
+    alerts = Alert.objects.for_org(organization)
+    level = params.get('level')
+    if level not in dict(Alert.LEVEL):
+        level = None
+    else:
+        alerts = alerts.filter(level=level)
+    state = params.get('state')
+    if state not in ALERT_STATES:
+        state = None
+    else:
+        alerts = alerts.filter(read=ALERT_STATES[state])
+    return alerts, level, state
+
 @login_required
 def alert_list(request):
-    organization = getattr(getattr(request.user, "userprofile", None), "organization", None)
+    organization = request.organization
+    alerts, level, state = _alert_queryset(organization, request.GET)
 
-    if not organization:
-        alerts = Alert.objects.all().order_by('-created_at')
-    else:
-        alerts = Alert.objects.filter(device__organization=organization).order_by('-created_at')
+    paginator = KeysetPaginator(alerts.select_related('device'), ALERT_ORDERING, 25)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
+
+    return render(request, 'alerts.html', {
+        'page_obj': page_obj,
+        'level': level,
+        'state': state,
+        'levels': Alert.LEVEL,
+        'counts': unread_counts(organization.pk) if organization else empty_counts(),
+    })
 
-    return render(request, 'alerts.html', {'alerts': alerts})
+@login_required
+@require_POST
+def alert_mark_read(request):
+    organization = request.organization
+    alerts, level, state = _alert_queryset(organization, request.POST)
+    if request.POST.get('all') != '1':
+        ids = [int(pk) for pk in request.POST.getlist('ids') if pk.isdigit()]
+        alerts = alerts.filter(pk__in=ids)
+    updated = mark_alerts_read(alerts)
+    messages.success(request, f'{updated} alert(s) marked as read.')
+    query = urlencode({name: value for name, value in (('level', level), ('state', state)) if value})
+    return redirect(f"{reverse('alert_list')}?{query}" if query else reverse('alert_list'))
 
 
 
 
 @login_required
-@manager_required
+@module_required('dispositivos', 'add')
 def device_create(request):
     if request.method == 'POST':
-        form = DeviceForm(request.POST)
+        form = DeviceForm(request.POST, organization=request.organization)
         if form.is_valid():
             device = form.save(commit=False)
-            device.organization = request.user.userprofile.organization
+            device.organization = request.organization
             device.save()
             messages.success(request, 'Device created successfully.')
             return redirect('device_list')
     else:
-        form = DeviceForm()
+        form = DeviceForm(organization=request.organization)
     return render(request, 'device_form.html', {'form': form, 'title': 'Create Device'})
 
 @login_required
-@manager_required
+@module_required('dispositivos', 'change')
 def device_update(request, pk):
-    device = get_object_or_404(Device, pk=pk, organization=request.user.userprofile.organization)
+    device = get_object_or_404(Device.objects.for_org(_organization_or_404(request)), pk=pk)
     if request.method == 'POST':
-        form = DeviceForm(request.POST, instance=device)
+        form = DeviceForm(request.POST, organization=request.organization, instance=device)
         if form.is_valid():
             form.save()
             messages.success(request, 'Device updated successfully.')
             return redirect('device_detail', pk=device.pk)
     else:
-        form = DeviceForm(instance=device)
+        form = DeviceForm(organization=request.organization, instance=device)
     return render(request, 'device_form.html', {'form': form, 'title': 'Update Device'})
 
 @login_required
-@manager_required
+@module_required('dispositivos', 'delete')
 def device_delete(request, pk):
-    device = get_object_or_404(Device, pk=pk, organization=request.user.userprofile.organization)
+    device = get_object_or_404(Device.objects.for_org(_organization_or_404(request)), pk=pk)
     if request.method == 'POST':
         device.delete()
         messages.success(request, 'Device deleted successfully.')
@@ -275,91 +382,200 @@ def device_delete(request, pk):
     return render(request, 'device_confirm_delete.html', {'device': device})
 
 @login_required
-@manager_required
+@module_required('dispositivos', 'add')
 def measurement_create(request):
     if request.method == 'POST':
-        form = MeasurementForm(request.POST)
+        form = MeasurementForm(request.POST, organization=request.organization)
         if form.is_valid():
             measurement = form.save(commit=False)
-            measurement.organization = request.user.userprofile.organization
+            measurement.organization = request.organization
             measurement.save()
             messages.success(request, 'Measurement created successfully.')
             return redirect('measurement_list')
     else:
-        form = MeasurementForm()
+        form = MeasurementForm(organization=request.organization)
     return render(request, 'measurement_form.html', {'form': form, 'title': 'Create Measurement'})
 
+def _api_identity(request):
+    """(organization_id, device_id, respuesta de error) desde un token o la sesión."""
+    key = get_request_token(request)
+    if key:
+        identity = authenticate_token(key)
+        if identity is None:
+            return None, None, JsonResponse({'error': 'Invalid token.'}, status=401)
+        return identity.organization_id, identity.device_id, None
+    if request.user.is_authenticated:
+        organization = request.organization
+        if organization is None:
+            return None, None, JsonResponse({'error': 'User has no organization.'}, status=403)
+        return organization.pk, None, None
+    return None, None, JsonResponse({'error': 'Authentication required.'}, status=401)
+
+@csrf_exempt
+@require_POST
+def measurement_ingest(request):
+    """Ingesta masiva para gateways: array JSON o NDJSON de (device, value, unit, date).
+
+    Se autentica con ``Authorization: Token <clave>`` (token de dispositivo o
+    gateway) o, en su defecto, con la sesión del usuario.
+    """
+    organization_id, device_id, error = _api_identity(request)
+    if error:
+        return error
+
+    # Solo JSON/NDJSON: un formulario de otro sitio no puede enviar estos tipos sin preflight CORS
+    if request.content_type not in JSON_CONTENT_TYPES + NDJSON_CONTENT_TYPES:
+        return JsonResponse({'error': 'Use application/json or application/x-ndjson.'}, status=415)
+
+    try:
+        rows = parse_payload(request.body, request.content_type)
+    except PayloadError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    if len(rows) > MAX_ROWS_PER_REQUEST:
+        return JsonResponse({'error': f'Batch too large (max {MAX_ROWS_PER_REQUEST} rows).'}, status=413)
+
+    buffer = get_measurement_buffer() if write_behind_enabled() else None
+    try:
+        result = ingest_rows(rows, organization_id, device_id=device_id, buffer=buffer, timeout=settings.WRITE_BEHIND_PUT_TIMEOUT)
+    except BufferFull:
+        response = JsonResponse({'error': 'Ingestion buffer is full, retry later.'}, status=503)
+        response['Retry-After'] = '1'
+        return response
+
+    if rows and not (result['created'] or result['queued']):
+        status = 400
+    elif result['queued']:
+        status = 202
+    else:
+        status = 200
+    return JsonResponse(result, status=status)
+
 @login_required
-@manager_required
+@module_required('dispositivos', 'change')
 def measurement_update(request, pk):
-    measurement = get_object_or_404(Measurement, pk=pk, device__organization=request.user.userprofile.organization)
+    measurement = get_object_or_404(Measurement.objects.for_org(_organization_or_404(request)), pk=pk)
     if request.method == 'POST':
-        form = MeasurementForm(request.POST, instance=measurement)
+        form = MeasurementForm(request.POST, organization=request.organization, instance=measurement)
         if form.is_valid():
             form.save()
             messages.success(request, 'Measurement updated successfully.')
             return redirect('measurement_list')
     else:
-        form = MeasurementForm(instance=measurement)
+        form = MeasurementForm(organization=request.organization, instance=measurement)
     return render(request, 'measurement_form.html', {'form': form, 'title': 'Update Measurement'})
 
 @login_required
-@manager_required
+@module_required('dispositivos', 'delete')
 def measurement_delete(request, pk):
-    measurement = get_object_or_404(Measurement, pk=pk, device__organization=request.user.userprofile.organization)
+    measurement = get_object_or_404(Measurement.objects.for_org(_organization_or_404(request)), pk=pk)
     if request.method == 'POST':
         measurement.delete()
         messages.success(request, 'Measurement deleted successfully.')
         return redirect('measurement_list')
     return render(request, 'measurement_confirm_delete.html', {'measurement': measurement})
 
+def _xlsx_response(filename, title, headers, rows):
+    # El libro se arma en un archivo temporal (memoria constante) y se envía por bloques
+    fh = tempfile.TemporaryFile()
+    try:
+        write_xlsx(fh, title, headers, rows)
+        fh.seek(0)
+    except BaseException:
+        fh.close()
+        raise
+    return FileResponse(fh, as_attachment=True, filename=filename, content_type=XLSX_CONTENT_TYPE)
+
 @login_required
 def export_measurements_excel(request):
-    measurements = Measurement.objects.filter(device__organization=request.user.userprofile.organization).select_related('device')
-
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Measurements"
-
-    # Headers
-    headers = ['Device', 'Value', 'Unit', 'Date']
-    for col_num, header in enumerate(headers, 1):
-        ws.cell(row=1, column=col_num, value=header)
-
-    # Data
-    for row_num, measurement in enumerate(measurements, 2):
-        ws.cell(row=row_num, column=1, value=measurement.device.name)
-        ws.cell(row=row_num, column=2, value=float(measurement.value))
-        ws.cell(row=row_num, column=3, value=measurement.unit)
-        ws.cell(row=row_num, column=4, value=measurement.date.strftime('%Y-%m-%d %H:%M:%S'))
-
-    response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    response['Content-Disposition'] = 'attachment; filename=measurements.xlsx'
-    wb.save(response)
+    organization = _organization_or_404(request)
+    try:
+        filters = parse_filters(request.GET)
+    except ExportFilterError as e:
+        messages.error(request, str(e))
+        return redirect('measurement_list')
+    # Incluye las lecturas archivadas en segmentos
+    rows = iter_measurement_export_rows(organization.pk, filters)
+    return _xlsx_response('measurements.xlsx', 'Measurements', MEASUREMENT_HEADERS, rows)
+
+STREAM_FORMATS = {
+    'csv': (stream_csv, CSV_CONTENT_TYPE),
+    'ndjson': (stream_ndjson, NDJSON_CONTENT_TYPE),
+}
+
+@require_GET
+def export_measurements_stream(request, fmt):
+    """Exportación CSV/NDJSON en flujo para pipelines de datos.
+
+    Acepta los filtros start, end, device, zone y category; se comprime con gzip
+    si el cliente lo acepta (``Accept-Encoding``).
+    """
+    organization_id, device_id, error = _api_identity(request)
+    if error:
+        return error
+    try:
+        filters = parse_filters(request.GET)
+    except ExportFilterError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    if device_id is not None:
+        # Un token de dispositivo solo exporta sus propias lecturas
+        ids = filters.device_ids
+        filters = filters._replace(device_ids=[device_id] if ids is None or device_id in ids else [])
+
+    generate, content_type = STREAM_FORMATS[fmt]
+    chunks = generate(organization_id, filters)
+    compress = accepts_gzip(request.headers.get('Accept-Encoding', ''))
+    response = StreamingHttpResponse(gzip_stream(chunks) if compress else chunks, content_type=content_type)
+    if compress:
+        response['Content-Encoding'] = 'gzip'
+    patch_vary_headers(response, ('Accept-Encoding',))
+    response['Content-Disposition'] = f'attachment; filename=measurements.{fmt}'
+    response['X-Accel-Buffering'] = 'no'  # que el proxy no retenga el flujo
     return response
 
+@login_required
+@require_POST
+def export_job_create(request, kind):
+    """Encola una exportación grande; el archivo lo genera ``run_export_jobs``."""
+    organization = _organization_or_404(request)
+    fmt = request.POST.get('format', 'xlsx')
+    if fmt not in dict(ExportJob.FORMAT):
+        fmt = 'xlsx'
+    try:
+        job, created = request_export(organization.pk, kind, fmt, request.POST, user=request.user)
+    except ExportFilterError as e:
+        messages.error(request, str(e))
+        return redirect('measurement_list' if kind == 'measurements' else 'device_list')
+    if not created:
+        messages.info(request, 'An identical export already exists, reusing it.')
+    return redirect('export_job_detail', pk=job.pk)
+
+@login_required
+def export_job_detail(request, pk):
+    job = get_object_or_404(ExportJob, pk=pk, organization=_organization_or_404(request))
+    if request.headers.get('Accept') == 'application/json':
+        return JsonResponse({
+            'id': job.pk, 'state': job.state, 'progress': job.progress,
+            'rows_written': job.rows_written, 'total_rows': job.total_rows, 'error': job.error,
+        })
+    return render(request, 'export_job.html', {'job': job})
+
+@login_required
+def export_job_download(request, pk):
+    job = get_object_or_404(
+        ExportJob, pk=pk, organization=_organization_or_404(request), state=ExportJob.DONE,
+    )
+    if not job.file:
+        raise Http404
+    content_type = XLSX_CONTENT_TYPE if job.format == 'xlsx' else CSV_CONTENT_TYPE
+    return FileResponse(job.file.open('rb'), as_attachment=True, filename=job.filename, content_type=content_type)
+
 @login_required
 def export_devices_excel(request):
-    devices = Device.objects.filter(organization=request.user.userprofile.organization).select_related('category', 'zone')
-
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Devices"
-
-    # Headers
-    headers = ['Name', 'Category', 'Zone', 'Reference', 'Status']
-    for col_num, header in enumerate(headers, 1):
-        ws.cell(row=1, column=col_num, value=header)
-
-    # Data
-    for row_num, device in enumerate(devices, 2):
-        ws.cell(row=row_num, column=1, value=device.name)
-        ws.cell(row=row_num, column=2, value=device.category.name)
-        ws.cell(row=row_num, column=3, value=device.zone.name)
-        ws.cell(row=row_num, column=4, value=device.reference)
-        ws.cell(row=row_num, column=5, value=device.status)
-
-    response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    response['Content-Disposition'] = 'attachment; filename=devices.xlsx'
-    wb.save(response)
-    return response
+    organization = _organization_or_404(request)
+    try:
+        filters = parse_filters(request.GET)
+    except ExportFilterError as e:
+        messages.error(request, str(e))
+        return redirect('device_list')
+    rows = iter_device_export_rows(organization.pk, filters)
+    return _xlsx_response('devices.xlsx', 'Devices', DEVICE_HEADERS, rows)
@@ -9,8 +9,29 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 
 import os
 
+from asgiref.sync import sync_to_async
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'monitoreo.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from dispositivos.buffer import shutdown_buffers  # noqa: E402  (requiere apps cargadas)
+
+
+async def lifespan(scope, receive, send):
+    """Django no maneja el protocolo lifespan; lo usamos para vaciar los buffers write-behind."""
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await sync_to_async(shutdown_buffers, thread_sensitive=False)()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(scope, receive, send)
+    return await django_application(scope, receive, send)
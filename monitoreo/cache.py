@@ -0,0 +1,186 @@
+"""
+Backends de caché instrumentados.
+
+``CACHES`` (ver settings) define ``default``, compartida entre workers
+(archivos o BD), y ``local``, en memoria del proceso para datos calientes que
+toleran quedar desactualizados unos segundos. Ambas usan estas subclases de
+los backends de Django, que cuentan aciertos, fallos, expulsiones y la latencia
+de lecturas y escrituras; ``cache_stats`` lo resume para ``admin_dashboard``.
+
+Django crea una instancia del backend por hilo, así que los contadores viven en
+un registro del módulo (por backend y ubicación) y son por proceso.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.db import DatabaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connections
+
+_MISSING = object()
+
+
+class CacheStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self.hits = self.misses = self.evictions = 0
+            self.gets = self.sets = 0
+            self.get_seconds = self.set_seconds = 0.0
+
+    def record_get(self, hits, misses, seconds):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+            self.gets += 1
+            self.get_seconds += seconds
+
+    def record_set(self, seconds):
+        with self._lock:
+            self.sets += 1
+            self.set_seconds += seconds
+
+    def record_evictions(self, count):
+        if count > 0:
+            with self._lock:
+                self.evictions += count
+
+    def snapshot(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else None,
+                "evictions": self.evictions,
+                "gets": self.gets,
+                "sets": self.sets,
+                "avg_get_ms": self.get_seconds * 1000 / self.gets if self.gets else None,
+                "avg_set_ms": self.set_seconds * 1000 / self.sets if self.sets else None,
+            }
+
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def stats_for(key):
+    with _registry_lock:
+        return _registry.setdefault(key, CacheStats())
+
+
+class InstrumentedCacheMixin:
+    """Mide get/get_many/set/set_many; las llamadas internas (incr, add, ...) no se cuentan dos veces."""
+
+    def __init__(self, location, params):
+        super().__init__(location, params)
+        self.stats = stats_for((type(self).__name__, str(location)))
+        self._nested = False  # la instancia es por hilo: no necesita lock
+
+    def _untracked(self, method, *args, **kwargs):
+        if self._nested:
+            return method(*args, **kwargs)
+        self._nested = True
+        try:
+            return method(*args, **kwargs)
+        finally:
+            self._nested = False
+
+    def get(self, key, default=None, version=None):
+        if self._nested:
+            return super().get(key, default, version)
+        start = time.perf_counter()
+        value = self._untracked(super().get, key, _MISSING, version)
+        hit = value is not _MISSING
+        self.stats.record_get(int(hit), int(not hit), time.perf_counter() - start)
+        return value if hit else default
+
+    def get_many(self, keys, version=None):
+        if self._nested:
+            return super().get_many(keys, version)
+        keys = list(keys)
+        start = time.perf_counter()
+        found = self._untracked(super().get_many, keys, version)
+        self.stats.record_get(len(found), len(keys) - len(found), time.perf_counter() - start)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        if self._nested:
+            return super().set(key, value, timeout, version)
+        start = time.perf_counter()
+        self._untracked(super().set, key, value, timeout, version)
+        self.stats.record_set(time.perf_counter() - start)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        if self._nested:
+            return super().set_many(data, timeout, version)
+        start = time.perf_counter()
+        failed = self._untracked(super().set_many, data, timeout, version)
+        self.stats.record_set(time.perf_counter() - start)
+        return failed
+
+    def add(self, *args, **kwargs):
+        return self._untracked(super().add, *args, **kwargs)
+
+    def incr(self, *args, **kwargs):
+        return self._untracked(super().incr, *args, **kwargs)
+
+    def decr(self, *args, **kwargs):
+        return self._untracked(super().decr, *args, **kwargs)
+
+    def get_or_set(self, *args, **kwargs):
+        return self._untracked(super().get_or_set, *args, **kwargs)
+
+
+class InstrumentedLocMemCache(InstrumentedCacheMixin, LocMemCache):
+    def _cull(self):
+        before = len(self._cache)
+        super()._cull()
+        self.stats.record_evictions(before - len(self._cache))
+
+
+class InstrumentedFileBasedCache(InstrumentedCacheMixin, FileBasedCache):
+    _culling = False
+
+    def _cull(self):
+        self._culling = True
+        try:
+            super()._cull()
+        finally:
+            self._culling = False
+
+    def _delete(self, fname):
+        deleted = super()._delete(fname)
+        if deleted and self._culling:
+            self.stats.record_evictions(1)
+        return deleted
+
+
+class InstrumentedDatabaseCache(InstrumentedCacheMixin, DatabaseCache):
+    def _cull(self, db, cursor, now, num):
+        super()._cull(db, cursor, now, num)
+        table = connections[db].ops.quote_name(self._table)
+        cursor.execute(f"SELECT COUNT(*) FROM {table}")
+        self.stats.record_evictions(num - cursor.fetchone()[0])  # incluye las vencidas
+
+
+def cache_stats():
+    """[{alias, backend, location, hits, misses, ...}] de las cachés instrumentadas."""
+    rows = []
+    for alias, config in settings.CACHES.items():
+        backend = caches[alias]
+        if isinstance(backend, InstrumentedCacheMixin):
+            rows.append({
+                "alias": alias,
+                "backend": config["BACKEND"].rsplit(".", 1)[-1],
+                "location": config.get("LOCATION", ""),
+                **backend.stats.snapshot(),
+            })
+    return rows
@@ -56,6 +56,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'usuarios.middleware.OrganizationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -72,6 +73,8 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'dispositivos.context_processors.unread_alerts',
+                'usuarios.context_processors.roles',
             ],
         },
     },
@@ -95,6 +98,28 @@ DATABASES = {
     }
 }
 
+# Cachés (ver monitoreo/cache.py). "default" se comparte entre workers (archivos;
+# para BD: CACHE_BACKEND=monitoreo.cache.InstrumentedDatabaseCache, CACHE_LOCATION=<tabla>
+# y manage.py createcachetable); "local" vive en la memoria de cada proceso.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'monitoreo.cache.InstrumentedFileBasedCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', str(BASE_DIR / 'cache')),
+        'TIMEOUT': int(os.environ.get('CACHE_TIMEOUT', 300)),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('CACHE_MAX_ENTRIES', 20000)),
+        },
+    },
+    'local': {
+        'BACKEND': os.environ.get('LOCAL_CACHE_BACKEND', 'monitoreo.cache.InstrumentedLocMemCache'),
+        'LOCATION': os.environ.get('LOCAL_CACHE_LOCATION', 'local'),
+        'TIMEOUT': int(os.environ.get('LOCAL_CACHE_TIMEOUT', 300)),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('LOCAL_CACHE_MAX_ENTRIES', 5000)),
+        },
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -162,3 +187,61 @@ AUTH_PASSWORD_VALIDATORS = [
         'NAME': 'django.contrib.auth.password_validation.NumericPasswordValidator',
     },
 ]
+
+# Ingesta masiva: los lotes de gateways superan el límite por defecto de 2.5 MB
+DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024
+
+# Buffer write-behind para mediciones/alertas (ver dispositivos/buffer.py)
+WRITE_BEHIND_ENABLED = os.environ.get('WRITE_BEHIND_ENABLED', 'False') == 'True'
+WRITE_BEHIND_MAX_ROWS = int(os.environ.get('WRITE_BEHIND_MAX_ROWS', 100000))
+WRITE_BEHIND_BATCH_SIZE = int(os.environ.get('WRITE_BEHIND_BATCH_SIZE', 2000))
+WRITE_BEHIND_INTERVAL = float(os.environ.get('WRITE_BEHIND_INTERVAL', 1.0))
+WRITE_BEHIND_PUT_TIMEOUT = float(os.environ.get('WRITE_BEHIND_PUT_TIMEOUT', 0.5))
+
+# Caché en memoria de tokens de dispositivo (ver dispositivos/auth.py)
+DEVICE_TOKEN_CACHE_SIZE = int(os.environ.get('DEVICE_TOKEN_CACHE_SIZE', 10000))
+DEVICE_TOKEN_CACHE_TTL = int(os.environ.get('DEVICE_TOKEN_CACHE_TTL', 60))
+
+# Archivo de mediciones antiguas en segmentos comprimidos (ver dispositivos/archive.py)
+MEASUREMENT_ARCHIVE_DIR = os.environ.get('MEASUREMENT_ARCHIVE_DIR', BASE_DIR / 'archive')
+MEASUREMENT_ARCHIVE_AFTER_DAYS = int(os.environ.get('MEASUREMENT_ARCHIVE_AFTER_DAYS', 365))
+
+# Conteos de listados grandes (ver dispositivos/counting.py)
+COUNT_EXACT_LIMIT = int(os.environ.get('COUNT_EXACT_LIMIT', 10000))
+COUNT_CACHE_TTL = int(os.environ.get('COUNT_CACHE_TTL', 30))
+
+# Snapshot del dashboard en caché (ver dispositivos/dashboard.py)
+DASHBOARD_CACHE_TTL = int(os.environ.get('DASHBOARD_CACHE_TTL', 300))
+DASHBOARD_MEASUREMENT_STALENESS = int(os.environ.get('DASHBOARD_MEASUREMENT_STALENESS', 30))
+
+# Exportaciones en segundo plano (ver dispositivos/jobs.py)
+EXPORT_ROOT = os.environ.get('EXPORT_ROOT', BASE_DIR / 'exports')
+EXPORT_JOB_TTL_HOURS = int(os.environ.get('EXPORT_JOB_TTL_HOURS', 24))
+EXPORT_MAX_CONCURRENT = int(os.environ.get('EXPORT_MAX_CONCURRENT', 2))
+EXPORT_JOB_TIMEOUT_MINUTES = int(os.environ.get('EXPORT_JOB_TIMEOUT_MINUTES', 60))
+
+# Integración de consumo (ver dispositivos/energy.py): huecos de potencia más largos no se integran
+ENERGY_MAX_GAP_MINUTES = int(os.environ.get('ENERGY_MAX_GAP_MINUTES', 60))
+
+# Detección de anomalías en lote (ver dispositivos/anomalies.py)
+ANOMALY_WINDOW = int(os.environ.get('ANOMALY_WINDOW', 60))
+ANOMALY_LOOKBACK_HOURS = int(os.environ.get('ANOMALY_LOOKBACK_HOURS', 24))
+ANOMALY_INITIAL_MINUTES = int(os.environ.get('ANOMALY_INITIAL_MINUTES', 60))
+ANOMALY_MAX_AGE_HOURS = int(os.environ.get('ANOMALY_MAX_AGE_HOURS', 24))
+ANOMALY_GAP_SECONDS = int(os.environ.get('ANOMALY_GAP_SECONDS', 3600))
+
+# Deduplicación de alertas repetidas (ver dispositivos/suppression.py)
+ALERT_DEDUPE_WINDOW_MINUTES = int(os.environ.get('ALERT_DEDUPE_WINDOW_MINUTES', 15))
+ALERT_DEDUPE_FLUSH_SECONDS = int(os.environ.get('ALERT_DEDUPE_FLUSH_SECONDS', 10))
+
+# Vigencia del estado de reglas de tasa/sostenidas en la caché (ver dispositivos/rules.py)
+ALERT_RULE_STATE_TTL = int(os.environ.get('ALERT_RULE_STATE_TTL', 86400))
+
+# Contadores de alertas no leídas en caché (ver dispositivos/alerts.py)
+ALERT_COUNT_CACHE_TTL = int(os.environ.get('ALERT_COUNT_CACHE_TTL', 300))
+
+# Roles y permisos por módulo compilados por usuario (ver usuarios/permissions.py)
+PERMISSION_CACHE_TTL = int(os.environ.get('PERMISSION_CACHE_TTL', 300))
+
+# Fragmentos de plantilla por organización y versión de datos (ver dispositivos/fragments.py)
+FRAGMENT_CACHE_TTL = int(os.environ.get('FRAGMENT_CACHE_TTL', 3600))
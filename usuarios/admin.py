@@ -41,10 +41,7 @@ class OrganizationAdmin(admin.ModelAdmin):
     def get_queryset(self, request):
         qs = super().get_queryset(request)
         if not request.user.is_superuser:
-            try:
-                qs = qs.filter(id=request.user.userprofile.organization.id)
-            except AttributeError:
-                qs = qs.none()
+            qs = qs.filter(pk=request.organization.pk) if request.organization else qs.none()
         return qs
 
 # Inline for UserProfile (but since OneToOne, perhaps not needed, but for completeness)
@@ -72,10 +69,7 @@ class UserProfileAdmin(admin.ModelAdmin):
     def get_queryset(self, request):
         qs = super().get_queryset(request)
         if not request.user.is_superuser:
-            try:
-                qs = qs.filter(organization=request.user.userprofile.organization)
-            except AttributeError:
-                qs = qs.none()
+            qs = qs.filter(organization=request.organization) if request.organization else qs.none()
         return qs
 
 @admin.register(Module)
@@ -0,0 +1,12 @@
+from .permissions import has_role
+
+
+def roles(request):
+    """Flags de rol para las plantillas desde los permisos en caché (sin consultar ``user.groups``)."""
+    user = getattr(request, "user", None)
+    if user is None:
+        return {}
+    return {
+        "is_admin": has_role(user, ["Admin"]),
+        "can_manage": has_role(user, ["Admin", "Manager"]),
+    }
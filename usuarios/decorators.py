@@ -2,18 +2,36 @@ from functools import wraps
 from django.http import HttpResponseForbidden
 from django.shortcuts import redirect
 
+from .permissions import has_module_perm, has_role
+
 def role_required(allowed_roles):
     """
     Decorator to check if user has one of the allowed roles.
     allowed_roles: list of role names (e.g., ['Admin', 'Manager'])
+    Roles come from the cached permissions (usuarios/permissions.py), no queries per request.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            if not request.user.is_authenticated:
+                return redirect('login')
+            if not has_role(request.user, allowed_roles):
+                return HttpResponseForbidden("You don't have permission to access this page.")
+            return view_func(request, *args, **kwargs)
+        return _wrapped_view
+    return decorator
+
+def module_required(module_code, action='view'):
+    """
+    Decorator to check a RoleModulePermission flag (view, add, change or delete)
+    of one of the user's roles for the module with code ``module_code``.
     """
     def decorator(view_func):
         @wraps(view_func)
         def _wrapped_view(request, *args, **kwargs):
             if not request.user.is_authenticated:
                 return redirect('login')
-            user_groups = request.user.groups.values_list('name', flat=True)
-            if not any(role in allowed_roles for role in user_groups):
+            if not has_module_perm(request.user, module_code, action):
                 return HttpResponseForbidden("You don't have permission to access this page.")
             return view_func(request, *args, **kwargs)
         return _wrapped_view
@@ -0,0 +1,45 @@
+from django.urls import Resolver404, resolve
+
+from dispositivos import tenancy
+from dispositivos.models import Organization
+
+
+def resolve_organization(user):
+    """Organización del usuario en una sola consulta (usuario → perfil → organización)."""
+    if not user.is_authenticated:
+        return None
+    return Organization.objects.filter(userprofile__user_id=user.pk).first()
+
+
+class OrganizationMiddleware:
+    """
+    Adjunta ``request.organization`` (o ``None``) una vez por petición.
+
+    Vistas, formularios y admin la consumen en lugar de recorrer
+    ``request.user.userprofile.organization`` cada uno por su cuenta.
+    Mientras corre una vista (salvo el admin de Django) activa el modo
+    estricto de ``dispositivos.tenancy``; la variable de contexto se fija y se
+    restaura en ``__call__`` (mismo contexto también bajo ASGI). Debe ir
+    después de ``AuthenticationMiddleware``.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.organization = resolve_organization(request.user)
+        if _is_admin(request):
+            return self.get_response(request)
+        token = tenancy.activate()
+        try:
+            return self.get_response(request)
+        finally:
+            tenancy.deactivate(token)
+
+
+def _is_admin(request):
+    """True si la ruta es del admin de Django (filtra en ``get_queryset``)."""
+    try:
+        return resolve(request.path_info, getattr(request, "urlconf", None)).namespace == "admin"
+    except Resolver404:
+        return False
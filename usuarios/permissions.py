@@ -0,0 +1,102 @@
+"""
+Resolución de roles y permisos por módulo con caché por usuario.
+
+Los roles (grupos) y los flags ``can_view/add/change/delete`` de
+``RoleModulePermission`` de cada usuario se compilan en un ``UserPermissions``:
+una tupla de nombres de rol y un entero con 4 bits por módulo (posición
+``module_id * 4 + acción``). Se guarda en la caché y además en el propio
+``request.user`` durante la petición, así los decoradores autorizan sin
+consultas.
+
+Las señales de ``usuarios.signals`` borran la entrada del usuario al cambiar
+sus grupos e incrementan una versión global al cambiar roles, módulos o
+``RoleModulePermission``, lo que invalida todas las entradas a la vez.
+"""
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+
+from .models import Module, RoleModulePermission
+
+ACTIONS = ("view", "add", "change", "delete")
+BITS_PER_MODULE = len(ACTIONS)
+VERSION_KEY = "perms:version"
+
+UserPermissions = namedtuple("UserPermissions", ["roles", "mask"])
+ANONYMOUS = UserPermissions((), 0)
+
+
+def current_version():
+    return cache.get(VERSION_KEY, 0)
+
+
+def bump_version():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, time.time_ns(), None)
+
+
+def _user_key(user_id, version):
+    return f"perms:user:{user_id}:{version}"
+
+
+def _modules_key(version):
+    return f"perms:modules:{version}"
+
+
+def compile_permissions(user_id):
+    roles = tuple(sorted(Group.objects.filter(user__id=user_id).values_list("name", flat=True)))
+    mask = 0
+    flags = RoleModulePermission.objects.filter(role__group__user__id=user_id).values_list(
+        "module_id", "can_view", "can_add", "can_change", "can_delete",
+    )
+    for module_id, *allowed in flags:
+        for action, granted in enumerate(allowed):
+            if granted:
+                mask |= 1 << (module_id * BITS_PER_MODULE + action)
+    return UserPermissions(roles, mask)
+
+
+def get_permissions(user):
+    """``UserPermissions`` del usuario (sin consultas si está en caché)."""
+    if not user.is_authenticated:
+        return ANONYMOUS
+    permissions = getattr(user, "_compiled_permissions", None)
+    if permissions is None:
+        key = _user_key(user.pk, current_version())
+        permissions = cache.get(key)
+        if permissions is None:
+            permissions = compile_permissions(user.pk)
+            cache.set(key, permissions, settings.PERMISSION_CACHE_TTL)
+        user._compiled_permissions = permissions
+    return permissions
+
+
+def module_ids():
+    """{código de módulo: id}, en caché con la misma versión."""
+    key = _modules_key(current_version())
+    ids = cache.get(key)
+    if ids is None:
+        ids = dict(Module.objects.values_list("code", "id"))
+        cache.set(key, ids, settings.PERMISSION_CACHE_TTL)
+    return ids
+
+
+def has_role(user, roles):
+    return not set(get_permissions(user).roles).isdisjoint(roles)
+
+
+def has_module_perm(user, module_code, action="view"):
+    module_id = module_ids().get(module_code)
+    if module_id is None:
+        return False
+    bit = module_id * BITS_PER_MODULE + ACTIONS.index(action)
+    return bool(get_permissions(user).mask >> bit & 1)
+
+
+def invalidate_user(user_id):
+    cache.delete(_user_key(user_id, current_version()))
@@ -0,0 +1,31 @@
+from django.contrib.auth.models import Group, User
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from . import permissions
+from .models import Module, Role, RoleModulePermission
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_user_permissions(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith("post_"):
+        return
+    if not reverse:
+        permissions.invalidate_user(instance.pk)
+    elif pk_set is not None:
+        for user_id in pk_set:
+            permissions.invalidate_user(user_id)
+    else:
+        permissions.bump_version()  # group.user_set.clear(): no se sabe qué usuarios había
+
+
+@receiver(post_save, sender=RoleModulePermission)
+@receiver(post_delete, sender=RoleModulePermission)
+@receiver(post_save, sender=Role)
+@receiver(post_delete, sender=Role)
+@receiver(post_save, sender=Module)
+@receiver(post_delete, sender=Module)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_all_permissions(sender, **kwargs):
+    permissions.bump_version()
@@ -1,7 +1,13 @@
-from django.test import TestCase
-from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase
+from django.contrib.auth.models import AnonymousUser, Group, User
 from django.urls import reverse
-from .models import UserProfile, Organization
+from dispositivos import tenancy
+from . import permissions
+from .decorators import admin_required, manager_required, module_required
+from .middleware import OrganizationMiddleware
+from .models import Module, Role, RoleModulePermission, UserProfile, Organization
 
 class UserProfileTestCase(TestCase):
     def setUp(self):
@@ -24,3 +30,131 @@ class UserProfileTestCase(TestCase):
         response = self.client.get(reverse('change_password'))
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, 'usuarios/change_password.html')
+
+
+class PermissionResolverTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.organization = Organization.objects.create(name="Perm Org", email="perm@org.com")
+        self.admin_group = Group.objects.create(name="Admin")
+        self.manager_group = Group.objects.create(name="Manager")
+        self.devices = Module.objects.create(code="dispositivos", name="Dispositivos")
+        self.users_module = Module.objects.create(code="usuarios", name="Usuarios")
+        self.manager_perm = RoleModulePermission.objects.create(
+            role=Role.objects.create(group=self.manager_group), module=self.devices,
+            can_view=True, can_add=True, can_change=True,
+        )
+        RoleModulePermission.objects.create(
+            role=Role.objects.create(group=self.admin_group), module=self.users_module,
+            can_view=True, can_add=True, can_change=True, can_delete=True,
+        )
+        self.user = User.objects.create_user(username="manager@org.com", email="manager@org.com", password="testpass123")
+        UserProfile.objects.create(user=self.user, organization=self.organization)
+        self.user.groups.add(self.manager_group)
+
+    def _fresh_user(self):
+        return User.objects.get(pk=self.user.pk)
+
+    def test_permissions_are_compiled_and_cached(self):
+        user = self._fresh_user()
+        self.assertTrue(permissions.has_role(user, ["Admin", "Manager"]))
+        self.assertTrue(permissions.has_module_perm(user, "dispositivos", "add"))
+        self.assertFalse(permissions.has_module_perm(user, "dispositivos", "delete"))
+        self.assertFalse(permissions.has_module_perm(user, "usuarios"))
+        self.assertFalse(permissions.has_module_perm(user, "desconocido"))
+
+        user = self._fresh_user()
+        with self.assertNumQueries(0):
+            self.assertFalse(permissions.has_role(user, ["Admin"]))
+            self.assertTrue(permissions.has_module_perm(user, "dispositivos", "change"))
+
+    def test_group_membership_and_module_permission_changes_invalidate(self):
+        self.assertFalse(permissions.has_role(self._fresh_user(), ["Admin"]))
+        self.user.groups.add(self.admin_group)
+        user = self._fresh_user()
+        self.assertTrue(permissions.has_role(user, ["Admin"]))
+        self.assertTrue(permissions.has_module_perm(user, "usuarios", "delete"))
+
+        self.admin_group.user_set.remove(self.user)
+        self.assertFalse(permissions.has_role(self._fresh_user(), ["Admin"]))
+
+        self.manager_perm.can_delete = True
+        self.manager_perm.save()
+        self.assertTrue(permissions.has_module_perm(self._fresh_user(), "dispositivos", "delete"))
+
+    def test_decorators_authorize_without_queries(self):
+        def view(request):
+            return HttpResponse("ok")
+
+        factory = RequestFactory()
+        request = factory.get("/")
+        request.user = self._fresh_user()
+        module_required("dispositivos")(view)(request)  # compila y guarda en caché
+
+        for decorator, status in ((manager_required, 200), (admin_required, 403), (module_required("dispositivos", "add"), 200),
+                                  (module_required("dispositivos", "delete"), 403)):
+            request.user = self._fresh_user()
+            with self.assertNumQueries(0):
+                self.assertEqual(decorator(view)(request).status_code, status)
+
+        self.client.login(username="manager@org.com", password="testpass123")
+        self.assertEqual(self.client.get(reverse("admin_dashboard")).status_code, 403)
+
+    def test_crud_views_check_module_permissions(self):
+        self.client.login(username="manager@org.com", password="testpass123")
+        # con permiso la vista busca el objeto (404); sin él se corta antes (403)
+        self.assertEqual(self.client.get(reverse("device_update", args=[999])).status_code, 404)
+        self.assertEqual(self.client.get(reverse("measurement_update", args=[999])).status_code, 404)
+        self.assertEqual(self.client.get(reverse("device_delete", args=[999])).status_code, 403)
+        self.assertEqual(self.client.get(reverse("measurement_delete", args=[999])).status_code, 403)
+
+        self.manager_perm.can_change = False
+        self.manager_perm.save()
+        self.assertEqual(self.client.get(reverse("device_update", args=[999])).status_code, 403)
+
+    def test_login_redirects_admins_to_admin_dashboard(self):
+        self.user.groups.add(self.admin_group)
+        response = self.client.post(reverse("login"), {"email": "manager@org.com", "password": "testpass123"})
+        self.assertRedirects(response, reverse("admin_dashboard"), fetch_redirect_response=False)
+
+
+class OrganizationMiddlewareTestCase(TestCase):
+    def setUp(self):
+        self.organization = Organization.objects.create(name="Tenant Org", email="tenant@org.com")
+        self.user = User.objects.create_user(username="tenant@org.com", email="tenant@org.com", password="testpass123")
+        UserProfile.objects.create(user=self.user, organization=self.organization)
+        self.orphan = User.objects.create_user(username="orphan@org.com", email="orphan@org.com", password="testpass123")
+        self.middleware = OrganizationMiddleware(lambda request: HttpResponse("ok"))
+
+    def _request(self, user):
+        request = RequestFactory().get("/")
+        request.user = user
+        return request
+
+    def test_organization_resolved_with_one_query(self):
+        request = self._request(User.objects.get(pk=self.user.pk))
+        with self.assertNumQueries(1):
+            self.middleware(request)
+        self.assertEqual(request.organization, self.organization)
+
+    def test_users_without_organization_get_none(self):
+        request = self._request(self.orphan)
+        self.middleware(request)
+        self.assertIsNone(request.organization)
+
+        request = self._request(AnonymousUser())
+        with self.assertNumQueries(0):
+            self.middleware(request)
+        self.assertIsNone(request.organization)
+
+    async def test_tenant_views_serve_under_asgi(self):
+        await self.async_client.aforce_login(self.user)
+        for name in ("dashboard", "device_list", "alert_list"):
+            response = await self.async_client.get(reverse(name))
+            self.assertEqual(response.status_code, 200, name)
+        self.assertFalse(tenancy.is_strict())
+
+    def test_views_use_request_organization(self):
+        self.client.login(username="orphan@org.com", password="testpass123")
+        self.assertEqual(self.client.get(reverse("device_list")).status_code, 200)
+        self.assertEqual(self.client.get(reverse("export_devices")).status_code, 404)
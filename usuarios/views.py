@@ -10,6 +10,7 @@ from django.core.validators import validate_email
 from .models import UserProfile
 from dispositivos.models import Organization
 from .forms import UserProfileForm, CustomPasswordChangeForm
+from .permissions import has_role
 
 class SimpleLoginForm(forms.Form):
     email = forms.EmailField(label="Email")
@@ -43,12 +44,9 @@ def login_view(request):
             if user is not None:
                 login(request, user)
                 # Redirect based on user role
-                if user.groups.filter(name='Admin').exists():
+                if has_role(user, ['Admin']):
                     return redirect('admin_dashboard')
-                elif user.groups.filter(name='Manager').exists():
-                    return redirect('dashboard')
-                else:
-                    return redirect('dashboard')
+                return redirect('dashboard')
             else:
                 messages.error(request, "Invalid email or password.")
         else: